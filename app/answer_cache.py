@@ -0,0 +1,101 @@
+# app/answer_cache.py
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+class SemanticAnswerCache:
+    """
+    Cache of general (non-command) LLM answers looked up by query-embedding similarity.
+    Entries are scoped by cluster and index version, expire after `ttl` seconds and the
+    least recently used ones are evicted beyond `maxsize`. Only answers that depend on the
+    query alone belong here: bot.py skips the cache for turns with conversation history.
+    """
+
+    def __init__(self, threshold=0.92, ttl=3600, maxsize=512):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # entry id -> (scope, unit vector, answer, expires_at)
+        self._matrices = {}            # scope -> (entry ids, stacked vectors), rebuilt lazily
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _matrix(self, scope):
+        if scope not in self._matrices:
+            ids = [entry_id for entry_id, entry in self._entries.items() if entry[0] == scope]
+            vectors = np.stack([self._entries[entry_id][1] for entry_id in ids]) if ids else None
+            self._matrices[scope] = (ids, vectors)
+        return self._matrices[scope]
+
+    def _drop(self, entry_id):
+        scope = self._entries.pop(entry_id)[0]
+        self._matrices.pop(scope, None)
+
+    def lookup(self, vector, cluster, index_version):
+        """Return the cached answer of the most similar query in scope, or None."""
+        scope = (cluster, index_version)
+        query = self._unit(vector)
+        with self._lock:
+            now = time.monotonic()
+            for entry_id in [entry_id for entry_id, entry in self._entries.items() if entry[3] < now]:
+                self._drop(entry_id)
+
+            ids, vectors = self._matrix(scope)
+            if vectors is not None:
+                similarities = vectors @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._entries.move_to_end(ids[best])
+                    self.hits += 1
+                    return self._entries[ids[best]][2]
+            self.misses += 1
+            return None
+
+    def store(self, vector, cluster, index_version, answer):
+        scope = (cluster, index_version)
+        with self._lock:
+            self._next_id += 1
+            self._entries[self._next_id] = (scope, self._unit(vector), answer, time.monotonic() + self.ttl)
+            self._matrices.pop(scope, None)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+def replay_stream(answer):
+    """Replay a cached answer as a token stream, word by word."""
+    for chunk in re.findall(r"\s*\S+", answer):
+        yield chunk
+
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.environ.get("CHATBOT_ANSWER_CACHE_THRESHOLD", "0.92")),
+    ttl=float(os.environ.get("CHATBOT_ANSWER_CACHE_TTL", "3600")),
+    maxsize=int(os.environ.get("CHATBOT_ANSWER_CACHE_SIZE", "512"))
+)
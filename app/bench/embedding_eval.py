@@ -0,0 +1,192 @@
+# app/bench/embedding_eval.py
+"""
+Compare embedding configurations on the docs/ corpus: retrieval recall against query latency.
+Each candidate embeds the same chunks and command examples as the RAG index, then answers
+labelled English and French paraphrases. Reported per candidate: load time, vector size,
+corpus indexing time, single-query latency (p50/p95), batched throughput, recall@1 and
+recall@k plus MRR on both sub-indexes (k = the depth rag.py retrieves).
+A candidate is "model[@backend[:quantization]]", e.g. BAAI/bge-m3,
+sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2@onnx:avx2. Needs the models
+locally or network access to download them.
+Run from the app/ directory:  python bench/embedding_eval.py [--candidates a,b] [--threads 4] [--output eval.json]
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rag
+from embeddings import EMBEDDING_BATCH_SIZE, embedding_id, load_embeddings
+
+DEFAULT_CANDIDATES = [
+    "BAAI/bge-m3",
+    "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+    "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2@onnx",
+    "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2@onnx:avx2",
+    "sentence-transformers/all-MiniLM-L6-v2",
+]
+
+# (paraphrase, command of the docs/k8s_commands.txt example it must retrieve)
+COMMAND_CASES = [
+    ("list the pods", "kubectl get pods"),
+    ("which pods are running in codep-orange", "kubectl get pods -n codep-orange"),
+    ("remove pod my-pod-123", "kubectl delete pod my-pod-123"),
+    ("increase the number of replicas of a deployment", "kubectl scale deployment my-deployment --replicas=3"),
+    ("show services of the default namespace", "kubectl get svc -n default"),
+    ("print the logs of jenkins-orange-65659745d5-4sprj", "kubectl logs jenkins-orange-65659745d5-4sprj -n codep-orange"),
+    ("which namespaces exist", "kubectl get namespaces"),
+    ("make a new dev namespace", "kubectl create namespace dev"),
+    ("details of deployment my-app", "kubectl describe deployment my-app"),
+    ("restart backend", "kubectl rollout restart deployment backend"),
+    ("is the frontend rollout finished", "kubectl rollout status deployment frontend"),
+    ("open a shell in the tools pod", "kubectl exec -it tools -- /bin/bash"),
+    ("list the cluster nodes", "kubectl get nodes"),
+    ("mark node-2 unschedulable", "kubectl cordon node-2"),
+    ("evict everything from node-3", "kubectl drain node-3 --ignore-daemonsets"),
+    ("secrets of the prod namespace", "kubectl get secrets -n prod"),
+    ("cpu and memory used by the pods", "kubectl top pods"),
+    ("recent cluster events", "kubectl get events --sort-by=.metadata.creationTimestamp"),
+    ("affiche les pods", "kubectl get pods"),
+    ("supprime le pod my-pod-123", "kubectl delete pod my-pod-123"),
+    ("liste les namespaces", "kubectl get namespaces"),
+    ("redémarre le déploiement backend", "kubectl rollout restart deployment backend"),
+    ("montre les noeuds du cluster", "kubectl get nodes"),
+    ("journaux du pod jenkins-orange-65659745d5-4sprj", "kubectl logs jenkins-orange-65659745d5-4sprj -n codep-orange"),
+]
+
+# (question, docs/ file whose chunks answer it)
+DOC_CASES = [
+    ("what is the smallest unit you can deploy", "k8s_pods.txt"),
+    ("do containers of a pod share the network", "k8s_pods.txt"),
+    ("how are stateless applications managed", "k8s_deployments.txt"),
+    ("how do I check that a rollout completed", "k8s_deployments.txt"),
+    ("how to deploy to pre-production", "procedures-internes.txt"),
+    ("qu'est-ce qu'un pod", "k8s_pods.txt"),
+    ("comment déployer en préprod", "procedures-internes.txt"),
+    ("combien de réplicas un déploiement garde-t-il", "k8s_deployments.txt"),
+]
+
+def parse_candidate(spec):
+    model, _, variant = spec.partition("@")
+    backend, _, quantization = variant.partition(":")
+    return model, backend or "huggingface", quantization
+
+def load_corpus():
+    """The chunks and command examples exactly as rag.py indexes them."""
+    chunks, examples = [], []
+    for path in rag._list_doc_files():
+        chunks += rag._chunk_file(path)[0]
+        if os.path.basename(path) == rag.COMMANDS_FILE:
+            examples += rag._parse_command_examples(path)[0]
+    return chunks, examples
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def ranks(query_vectors, corpus_vectors, relevant):
+    """1-based rank of the first relevant corpus entry for each query (inf when none is)."""
+    similarities = _unit(query_vectors) @ _unit(corpus_vectors).T
+    result = []
+    for row, is_relevant in zip(similarities, relevant):
+        order = np.argsort(-row)
+        result.append(next((i + 1 for i, j in enumerate(order) if is_relevant(j)), math.inf))
+    return result
+
+def recall(rank_list, k):
+    return sum(r <= k for r in rank_list) / len(rank_list)
+
+def evaluate(spec, chunks, examples, threads, batch_size, rounds):
+    model, backend, quantization = parse_candidate(spec)
+    start = time.perf_counter()
+    embeddings = load_embeddings(model, backend, quantization, threads=threads, batch_size=batch_size)
+    load_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunk_vectors = embeddings.embed_documents([c.page_content for c in chunks])
+    example_vectors = embeddings.embed_documents([e.page_content for e in examples])
+    index_s = time.perf_counter() - start
+
+    queries = [q for q, _ in COMMAND_CASES] + [q for q, _ in DOC_CASES]
+    embeddings.embed_query(queries[0])  # warm-up
+    latencies = []
+    for _ in range(rounds):
+        for query in queries:
+            t = time.perf_counter()
+            embeddings.embed_query(query)
+            latencies.append((time.perf_counter() - t) * 1000)
+    latencies.sort()
+    start = time.perf_counter()
+    query_vectors = embeddings.embed_documents(queries)
+    batch_s = time.perf_counter() - start
+
+    commands = [e.metadata.get("command", "").strip() for e in examples]
+    sources = [os.path.basename(c.metadata.get("source", "")) for c in chunks]
+    command_ranks = ranks(query_vectors[:len(COMMAND_CASES)], example_vectors,
+                          [lambda j, c=command: commands[j] == c for _, command in COMMAND_CASES])
+    doc_ranks = ranks(query_vectors[len(COMMAND_CASES):], chunk_vectors,
+                      [lambda j, s=source: sources[j] == s for _, source in DOC_CASES])
+    return {
+        "embedding_id": embedding_id(model, backend, quantization),
+        "dimension": len(query_vectors[0]),
+        "load_seconds": round(load_s, 2),
+        "index_seconds": round(index_s, 3),
+        "query_p50_ms": round(latencies[len(latencies) // 2], 2),
+        "query_p95_ms": round(latencies[max(0, math.ceil(len(latencies) * 0.95) - 1)], 2),
+        "batch_queries_per_second": round(len(queries) / batch_s, 1),
+        "commands_recall@1": round(recall(command_ranks, 1), 3),
+        "commands_recall@2": round(recall(command_ranks, 2), 3),
+        "commands_mrr": round(sum(1 / r for r in command_ranks) / len(command_ranks), 3),
+        "docs_recall@1": round(recall(doc_ranks, 1), 3),
+        "docs_recall@3": round(recall(doc_ranks, 3), 3),
+        "docs_mrr": round(sum(1 / r for r in doc_ranks) / len(doc_ranks), 3),
+        "misses": [q for (q, _), r in zip(COMMAND_CASES, command_ranks) if r > 2]
+                  + [q for (q, _), r in zip(DOC_CASES, doc_ranks) if r > 3],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", default=",".join(DEFAULT_CANDIDATES), help="comma-separated candidates")
+    parser.add_argument("--threads", type=int, default=0, help="inference threads (0 = library default)")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--rounds", type=int, default=3, help="passes over the queries for the latency figures")
+    parser.add_argument("--output", help="also write the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="list the queries each candidate missed")
+    args = parser.parse_args()
+
+    chunks, examples = load_corpus()
+    print(f"{len(chunks)} chunks, {len(examples)} command examples, {len(COMMAND_CASES)} + {len(DOC_CASES)} labelled queries\n")
+
+    results = {}
+    for spec in [c.strip() for c in args.candidates.split(",") if c.strip()]:
+        try:
+            results[spec] = evaluate(spec, chunks, examples, args.threads, args.batch_size, args.rounds)
+        except Exception as e:
+            print(f"{spec}: failed: {e}", file=sys.stderr)
+            results[spec] = {"error": str(e)}
+
+    print(f"{'candidate':<72}{'load s':>8}{'q p50':>8}{'q p95':>8}{'batch/s':>9}{'cmd@1':>7}{'cmd@2':>7}{'doc@1':>7}{'doc@3':>7}")
+    for spec, r in results.items():
+        if "error" in r:
+            print(f"{spec:<72}  error: {r['error']}")
+            continue
+        print(f"{spec:<72}{r['load_seconds']:>8.1f}{r['query_p50_ms']:>8.1f}{r['query_p95_ms']:>8.1f}{r['batch_queries_per_second']:>9.0f}"
+              f"{r['commands_recall@1']:>7.2f}{r['commands_recall@2']:>7.2f}{r['docs_recall@1']:>7.2f}{r['docs_recall@3']:>7.2f}")
+        if args.verbose and r["misses"]:
+            print(f"    missed: {r['misses']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"threads": args.threads, "batch_size": args.batch_size, "results": results}, f, indent=2)
+        print(f"\nresults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# app/bench/kv_context_bench.py
+"""
+Measure the prompt-eval time saved by reusing a session's Ollama KV context.
+Plays the same multi-turn conversation twice against the configured Ollama server: once
+with a fresh full prompt on every turn, once reusing the session context. Prints Ollama's
+prompt_eval_count / prompt_eval_duration per turn. Needs a running Ollama and the RAG index.
+Context reuse is enabled for the run whatever CHATBOT_LLM_CONTEXT_REUSE says.
+Run from the app/ directory:  python bench/kv_context_bench.py [--turns 6]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+import mcp_context
+from bot import process_user_query_with_llm
+from ollama_client import ollama_client
+
+CONVERSATION = [
+    "what is a pod?",
+    "and how is it different from a deployment?",
+    "how do I scale a deployment?",
+    "what happens to the pods when I scale it down?",
+    "what is a statefulset used for?",
+    "can a statefulset be scaled the same way?",
+    "how do I see why a pod is crashing?",
+    "what does CrashLoopBackOff mean?",
+]
+
+def _prompt_eval_totals():
+    buckets = ollama_client.prompt_eval.values()
+    return sum(b["tokens"] for b in buckets), sum(b["ms"] for b in buckets)
+
+def run_conversation(turns, reuse, cluster):
+    """Return one (prompt tokens, prompt ms) pair per turn."""
+    session_id = f"bench-{uuid.uuid4().hex[:8]}"
+    measures = []
+    for query in CONVERSATION[:turns]:
+        tokens_before, ms_before = _prompt_eval_totals()
+        history = mcp_context.get_history(session_id)
+        # use_cache=False: the semantic answer cache must not short-circuit the generation
+        response = process_user_query_with_llm(
+            f"{query} (on cluster: {cluster})", history, cluster=cluster, use_cache=False,
+            session_id=session_id if reuse else None
+        )
+        mcp_context.update_history(session_id, query, response.get("answer") or response.get("command", ""))
+        tokens_after, ms_after = _prompt_eval_totals()
+        measures.append((tokens_after - tokens_before, ms_after - ms_before))
+    return measures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=6, help=f"conversation turns (max {len(CONVERSATION)})")
+    parser.add_argument("--cluster", default="default")
+    args = parser.parse_args()
+    turns = min(args.turns, len(CONVERSATION))
+
+    # The sessions used for the benchmark go to a throwaway database
+    mcp_context.DB_PATH = os.path.join(tempfile.mkdtemp(), "sessions.db")
+    mcp_context._local.conn = None
+    mcp_context._initialize_db()
+    bot.LLM_CONTEXT_REUSE = True
+
+    baseline = run_conversation(turns, reuse=False, cluster=args.cluster)
+    reused = run_conversation(turns, reuse=True, cluster=args.cluster)
+
+    print(f"{'turn':>4}{'fresh tok':>11}{'fresh ms':>10}{'reuse tok':>11}{'reuse ms':>10}{'saved ms':>10}")
+    for turn, ((fresh_tokens, fresh_ms), (reuse_tokens, reuse_ms)) in enumerate(zip(baseline, reused), 1):
+        print(f"{turn:>4}{fresh_tokens:>11}{fresh_ms:>10.0f}{reuse_tokens:>11}{reuse_ms:>10.0f}{fresh_ms - reuse_ms:>10.0f}")
+    follow_ups = range(1, turns)
+    if follow_ups:
+        saved = sum(baseline[i][1] - reused[i][1] for i in follow_ups) / len(follow_ups)
+        print(f"\nmean prompt-eval time saved per follow-up turn: {saved:.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+# app/bench/offline_bench.py
+"""
+Offline latency/throughput benchmark of the chatbot, without a live model or cluster.
+Starts a local stub Ollama server (configurable first-token latency and token rate), points
+CHATBOT_KUBECTL_PATH at a fake kubectl and runs the app from a temporary directory holding a
+copy of docs/, its own Chroma index and session database. Drives /chat, /confirm and
+/regenerate through the Flask test client and micro-benchmarks retrieve_context,
+correct_typos and the mcp_context functions. Prints p50/p95/p99 latency and throughput per
+scenario and writes them as JSON, to compare runs. The embedding model must be available
+locally (it is the only real component left).
+Run from the app/ directory:  python bench/offline_bench.py [--iterations 50] [--output bench.json]
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+GENERAL_QUESTIONS = [
+    "what is a pod?",
+    "how do I scale a deployment?",
+    "what is the difference between a deployment and a statefulset?",
+    "why would a pod stay in Pending?",
+    "what does CrashLoopBackOff mean?",
+    "how do services find their pods?",
+]
+FAST_PATH_QUERIES = ["show pods in codep-orange", "list deployments in dev", "show the nodes", "list services in kube-system"]
+REGENERATE_QUERIES = ["restart the web deployment", "scale backend to 3 replicas", "delete the failed jobs"]
+TYPO_QUERIES = ["shwo me the pods in codep-orange", "lsit deploymnets in namespace codep-orange", "descibe the servcie my-app"]
+
+FAKE_KUBECTL = """#!{python}
+import os, sys, time
+time.sleep(float(os.environ.get("BENCH_KUBECTL_DELAY", "0")))
+rows = int(os.environ.get("BENCH_KUBECTL_ROWS", "20"))
+print("NAME                      READY   STATUS    RESTARTS   AGE")
+for i in range(rows):
+    print(f"bench-{{i:04d}}-7d9f8-abcde   1/1     Running   0          {{i + 1}}d")
+"""
+
+KUBECONFIG = """apiVersion: v1
+kind: Config
+clusters:
+- name: bench
+  cluster: {server: "https://127.0.0.1:1"}
+users:
+- name: bench
+  user: {token: bench}
+contexts:
+- name: default
+  context: {cluster: bench, user: bench}
+current-context: default
+"""
+
+class StubOllama(BaseHTTPRequestHandler):
+    """/api/generate stub: waits `latency` then emits one word every 1/`token_rate` seconds."""
+    latency = 0.2
+    token_rate = 50.0
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, prompt):
+        request = prompt.rsplit("User's Latest Request:", 1)[-1].lower()
+        command = any(verb in request for verb in ("restart", "scale", "delete", "show", "list"))
+        if "Start your response with 'COMMAND:'" in prompt:
+            if command:
+                return "COMMAND: kubectl rollout restart deployment web\nEXPLANATION: Restarts the web deployment."
+            return "ANSWER: " + " ".join(["A pod is the smallest deployable unit in Kubernetes."] * 4)
+        if command:
+            return json.dumps({"type": "command", "command": "kubectl rollout restart deployment web", "explanation": "Restarts the web deployment."})
+        return json.dumps({"type": "question", "answer": " ".join(["A pod is the smallest deployable unit in Kubernetes."] * 4)})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        tokens = self._reply(body.get("prompt", "")).split(" ")
+        prompt_tokens = len(body.get("prompt", "")) // 4
+        final = {"done": True, "eval_count": len(tokens), "prompt_eval_count": prompt_tokens,
+                 "prompt_eval_duration": int(prompt_tokens * 1e5), "context": [1, 2, 3]}
+        time.sleep(self.latency)
+        if not body.get("stream"):
+            time.sleep(len(tokens) / self.token_rate)
+            self._send(200, json.dumps(dict(final, response=" ".join(tokens))).encode())
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, token in enumerate(tokens):
+            self._chunk(json.dumps({"response": token if i == 0 else f" {token}", "done": False}))
+            time.sleep(1 / self.token_rate)
+        self._chunk(json.dumps(dict(final, response="")))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, line):
+        data = (line + "\n").encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send(self, status, data):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def run_scenario(name, fn, iterations, concurrency):
+    """Call fn(i) `iterations` times over `concurrency` threads; fn returns False on a failed request."""
+    timings, errors = [], 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            ok = fn(i) is not False
+        except Exception as e:
+            print(f"  {name} #{i} failed: {e}", file=sys.stderr)
+            ok = False
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            timings.append(elapsed)
+            errors += not ok
+
+    wall = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(iterations)))
+    wall = time.perf_counter() - wall
+    timings.sort()
+    return {
+        "count": len(timings),
+        "errors": errors,
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "max_ms": round(timings[-1], 3),
+        "throughput_rps": round(len(timings) / wall, 2),
+    }
+
+def setup_environment(workdir, args):
+    """Temporary working directory, stub Ollama and fake kubectl; must run before the app modules are imported."""
+    shutil.copytree(os.path.join(APP_DIR, "docs"), os.path.join(workdir, "docs"))
+    os.makedirs(os.path.join(workdir, "logs"))
+    kubectl = os.path.join(workdir, "kubectl")
+    with open(kubectl, "w") as f:
+        f.write(FAKE_KUBECTL.format(python=sys.executable))
+    os.chmod(kubectl, 0o755)
+    kubeconfig = os.path.join(workdir, "kubeconfig")
+    with open(kubeconfig, "w") as f:
+        f.write(KUBECONFIG)
+
+    StubOllama.latency = args.latency_ms / 1000
+    StubOllama.token_rate = args.token_rate
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllama)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ.update({
+        "CHATBOT_OLLAMA_URL": f"http://127.0.0.1:{server.server_port}",
+        "CHATBOT_OLLAMA_MAX_CONCURRENCY": str(args.ollama_concurrency),
+        "CHATBOT_KUBECTL_PATH": kubectl,
+        "CHATBOT_KUBECONFIG_PATH": kubeconfig,
+        # The fake kubectl stands for the cluster: no in-process API calls
+        "CHATBOT_NATIVE_EXECUTOR": "0",
+        "BENCH_KUBECTL_DELAY": str(args.kubectl_delay_ms / 1000),
+        "BENCH_KUBECTL_ROWS": str(args.kubectl_rows),
+    })
+    os.chdir(workdir)
+    return server
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50, help="requests per HTTP scenario")
+    parser.add_argument("--micro-iterations", type=int, default=500, help="calls per micro-benchmark")
+    parser.add_argument("--concurrency", type=int, default=1, help="parallel clients in the HTTP scenarios")
+    parser.add_argument("--latency-ms", type=float, default=200, help="stub Ollama time to first token")
+    parser.add_argument("--token-rate", type=float, default=50, help="stub Ollama tokens per second")
+    parser.add_argument("--ollama-concurrency", type=int, default=2, help="CHATBOT_OLLAMA_MAX_CONCURRENCY")
+    parser.add_argument("--kubectl-delay-ms", type=float, default=50, help="fake kubectl run time")
+    parser.add_argument("--kubectl-rows", type=int, default=20, help="rows printed by the fake kubectl")
+    parser.add_argument("--output", default="bench_results.json", help="JSON results file (relative to the current directory)")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+
+    workdir = tempfile.mkdtemp(prefix="chatbot-bench-")
+    stub = setup_environment(workdir, args)
+    try:
+        start = time.perf_counter()
+        import server
+        import mcp_context
+        import rag
+        from answer_cache import answer_cache
+        from auth import generate_token
+        from k8s_executor import result_cache
+        startup_s = time.perf_counter() - start
+
+        server.limiter.enabled = False
+        headers = {"Authorization": f"Bearer {generate_token('bench')}"}
+        clients = threading.local()
+
+        def post(path, payload):
+            if not hasattr(clients, "client"):
+                clients.client = server.app.test_client()
+            response = clients.client.post(path, json=payload, headers=headers)
+            response.get_data()  # consumes a streamed response to the end
+            if response.status_code != 200:
+                return False
+            return not response.is_json or response.get_json().get("action") != "error"
+
+        def session():
+            return f"bench-{uuid.uuid4().hex[:12]}"
+
+        def chat(i):
+            return post("/chat", {"message": GENERAL_QUESTIONS[i % len(GENERAL_QUESTIONS)], "session_id": session()})
+
+        def chat_stream(i):
+            return post("/chat", {"message": GENERAL_QUESTIONS[i % len(GENERAL_QUESTIONS)], "session_id": session(), "stream": True})
+
+        def chat_fast_path(i):
+            return post("/chat", {"message": FAST_PATH_QUERIES[i % len(FAST_PATH_QUERIES)], "session_id": session()})
+
+        def confirm(i):
+            session_id = session()
+            mcp_context.set_pending_command(session_id, f"kubectl get pods -n bench-{i}", "default", "show pods")
+            return post("/confirm", {"confirm": "yes", "session_id": session_id})
+
+        def regenerate(i):
+            return post("/regenerate", {"original_query": REGENERATE_QUERIES[i % len(REGENERATE_QUERIES)], "session_id": session()})
+
+        micro_session = session()
+        for i in range(20):
+            mcp_context.update_history(micro_session, f"question {i}", f"answer {i} " * 20)
+
+        def mcp_round_trip(i):
+            session_id = session()
+            mcp_context.set_pending_command(session_id, "kubectl get pods", "default", "show pods")
+            mcp_context.pop_pending_command(session_id)
+
+        results = {}
+        print(f"startup {startup_s:.2f}s, workdir {workdir}")
+
+        # Answer cache disabled: every request goes to the stub model
+        threshold = answer_cache.threshold
+        answer_cache.threshold = float("inf")
+        results["chat"] = run_scenario("chat", chat, args.iterations, args.concurrency)
+        results["chat_stream"] = run_scenario("chat_stream", chat_stream, args.iterations, args.concurrency)
+        results["regenerate"] = run_scenario("regenerate", regenerate, args.iterations, args.concurrency)
+        answer_cache.threshold = threshold
+        results["chat_answer_cached"] = run_scenario("chat_answer_cached", chat, args.iterations, args.concurrency)
+        results["chat_fast_path"] = run_scenario("chat_fast_path", chat_fast_path, args.iterations, args.concurrency)
+        result_cache.clear()
+        results["confirm"] = run_scenario("confirm", confirm, args.iterations, args.concurrency)
+
+        micro = args.micro_iterations
+        results["retrieve_context"] = run_scenario("retrieve_context", lambda i: rag.retrieve_context(GENERAL_QUESTIONS[i % len(GENERAL_QUESTIONS)]), micro, 1)
+        results["retrieve_context_uncached"] = run_scenario(
+            "retrieve_context_uncached", lambda i: rag.retrieve_context(f"{GENERAL_QUESTIONS[i % len(GENERAL_QUESTIONS)]} #{i}"), min(micro, 100), 1)
+        results["correct_typos"] = run_scenario("correct_typos", lambda i: rag.correct_typos(TYPO_QUERIES[i % len(TYPO_QUERIES)]), micro, 1)
+        results["mcp_get_history"] = run_scenario("mcp_get_history", lambda i: mcp_context.get_history(micro_session), micro, 1)
+        results["mcp_update_history"] = run_scenario(
+            "mcp_update_history", lambda i: mcp_context.update_history(session(), "show pods", "Executed", tool_output="x" * 2000), micro, 1)
+        results["mcp_pending_round_trip"] = run_scenario("mcp_pending_round_trip", mcp_round_trip, micro, 1)
+
+        print(f"\n{'scenario':<28}{'n':>6}{'err':>5}{'p50':>10}{'p95':>10}{'p99':>10}{'rps':>10}   (ms)")
+        for name, r in results.items():
+            print(f"{name:<28}{r['count']:>6}{r['errors']:>5}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['throughput_rps']:>10.1f}")
+
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "config": {key: value for key, value in vars(args).items() if key != "output"},
+            "startup_seconds": round(startup_s, 3),
+            "ollama": server.ollama_client.stats(),
+            "results": results,
+        }
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nresults written to {output}")
+    finally:
+        stub.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
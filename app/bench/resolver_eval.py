@@ -0,0 +1,112 @@
+# app/bench/resolver_eval.py
+"""
+Evaluate the deterministic command resolver against labelled queries.
+The set is seeded from the Query:/Command: pairs of docs/k8s_commands.txt, plus paraphrases,
+kubectl flags, and conceptual or qualified requests that must be left to the LLM.
+Run from the app/ directory:  python bench/resolver_eval.py [--verbose]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from command_resolver import FAST_PATH_THRESHOLD, normalize_command, resolve_command
+
+COMMANDS_FILE = os.path.join("docs", "k8s_commands.txt")
+
+# (query, expected command) -- None means the query must not be fast-pathed
+EXTRA_CASES = [
+    ("list pods in codep-orange", "kubectl get pods -n codep-orange"),
+    ("show me the deployments in namespace codep-orange", "kubectl get deployments -n codep-orange"),
+    ("show services", "kubectl get svc"),
+    ("get pods -n kube-system", "kubectl get pods -n kube-system"),
+    ("kubectl get pods -A", "kubectl get pods --all-namespaces"),
+    ("describe pod jenkins-orange-65659745d5-4sprj in codep-orange", "kubectl describe pod jenkins-orange-65659745d5-4sprj -n codep-orange"),
+    ("logs of pod my-app-7d9f8-abcde", "kubectl logs my-app-7d9f8-abcde"),
+    ("show the nodes", "kubectl get nodes"),
+    ("list configmaps in the dev namespace", "kubectl get configmaps -n dev"),
+    ("affiche les pods dans le namespace codep-orange", "kubectl get pods -n codep-orange"),
+    ("list statefulsets in all namespaces", "kubectl get statefulsets --all-namespaces"),
+    ("get pods -o yaml", "kubectl get pods -o yaml"),
+    ("get pods -o wide -n dev", "kubectl get pods -n dev -o wide"),
+    ("show deployment my-app as json", "kubectl get deployment my-app -o json"),
+    ("get pods -l app=web", "kubectl get pods -l app=web"),
+    ("get pods --selector app=web in codep-orange", "kubectl get pods -n codep-orange -l app=web"),
+    ("describe pods --selector=tier=backend", "kubectl describe pods -l tier=backend"),
+    ("show pods that are not running", None),
+    ("show pods and services", None),
+    ("get pods that are failing in dev", None),
+    ("list pods sorted by restarts", None),
+    ("describe pods that keep restarting", None),
+    ("delete pods -l app=web", None),
+    ("delete namespace prod", None),
+    ("remove the kube-system namespace", None),
+    ("delete pod my-app-7d9f8-abcde", None),
+    ("scale deployment backend to 3 replicas", None),
+    ("restart deployment frontend", None),
+    ("create namespace staging", None),
+    ("get pods -o yaml;", None),
+    ("get pods -o foo", None),
+    ("get pods -l app=web;rm", None),
+    ("what is a pod?", None),
+    ("why are my pods crashing", None),
+    ("explain the difference between a deployment and a statefulset", None),
+    ("hello", None),
+    ("comment fonctionne un service ?", None),
+]
+
+def load_cases():
+    cases = []
+    if os.path.exists(COMMANDS_FILE):
+        with open(COMMANDS_FILE, "r", encoding="utf-8") as f:
+            pairs = re.findall(r"^Query:\s*(.+?)\s*\nCommand:\s*(.+?)\s*$", f.read(), re.MULTILINE)
+        cases += pairs
+    cases += EXTRA_CASES
+    return cases
+
+def evaluate(results, threshold):
+    """Hit rate, accuracy of hits and false fast-paths on queries that must go to the LLM."""
+    hits = [r for r in results if r["resolved"]["command"] and r["resolved"]["confidence"] >= threshold]
+    correct = [r for r in hits if r["expected"] and normalize_command(r["resolved"]["command"]) == normalize_command(r["expected"])]
+    negatives = [r for r in results if r["expected"] is None]
+    false_hits = [r for r in hits if r["expected"] is None]
+    return {
+        "threshold": threshold,
+        "hit_rate": len(hits) / len(results),
+        "accuracy": len(correct) / len(hits) if hits else 0.0,
+        "false_fast_path": len(false_hits) / len(negatives) if negatives else 0.0,
+        "coverage": len(correct) / len([r for r in results if r["expected"]]),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--verbose", action="store_true", help="print every case")
+    args = parser.parse_args()
+
+    results = []
+    start = time.perf_counter()
+    for query, expected in load_cases():
+        results.append({"query": query, "expected": expected, "resolved": resolve_command(query)})
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    print(f"{len(results)} cases, {elapsed_ms / len(results):.3f} ms per query\n")
+    print(f"{'threshold':>9}{'hit rate':>10}{'accuracy':>10}{'coverage':>10}{'false FP':>10}")
+    for threshold in (0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95):
+        m = evaluate(results, threshold)
+        marker = "  <- current" if abs(threshold - FAST_PATH_THRESHOLD) < 1e-9 else ""
+        print(f"{threshold:>9.2f}{m['hit_rate']:>10.1%}{m['accuracy']:>10.1%}{m['coverage']:>10.1%}{m['false_fast_path']:>10.1%}{marker}")
+
+    if args.verbose:
+        print()
+        for r in results:
+            resolved = r["resolved"]
+            ok = r["expected"] and resolved["command"] and normalize_command(resolved["command"]) == normalize_command(r["expected"])
+            flag = "ok " if ok or (r["expected"] is None and resolved["confidence"] < FAST_PATH_THRESHOLD) else "-- "
+            print(f"{flag}{resolved['confidence']:.2f}  {r['query']!r}\n      got:      {resolved['command']}\n      expected: {r['expected']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# app/bench/typo_bench.py
+"""
+Compare per-query typo-correction latency of the legacy SpellChecker loop with TypoCorrector.
+Run from the app/ directory:  python bench/typo_bench.py [--rounds 5]
+"""
+
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spellchecker import SpellChecker
+from spelling import TypoCorrector
+
+DOCS_DIR = "docs/"
+
+# Realistic operator queries, with and without typos
+EXTRA_QUERIES = [
+    "shwo me the pods in codep-orange",
+    "lsit deploymnets in namespace codep-orange",
+    "view logs for pod jenkins-orange-65659745d5-4sprj -n codep-orange",
+    "descibe the servcie my-app",
+    "what is a persistnt volume claim",
+    "kubectl get svc -n default",
+    "comment redémarrer un déploiement",
+]
+
+def load_queries():
+    queries = list(EXTRA_QUERIES)
+    path = os.path.join(DOCS_DIR, "k8s_commands.txt")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            queries += [q.strip() for q in re.findall(r"^Query:\s*(.+)$", f.read(), re.MULTILINE)]
+    return queries
+
+def legacy_correct(spell, query):
+    """The original rag.correct_typos implementation."""
+    words = query.split()
+    corrected = [spell.correction(word) if spell.correction(word) else word for word in words]
+    return " ".join(corrected)
+
+def measure(fn, queries, rounds):
+    timings = []
+    for _ in range(rounds):
+        for query in queries:
+            start = time.perf_counter()
+            fn(query)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[int(len(timings) * 0.95) - 1],
+        "max_ms": timings[-1],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    queries = load_queries()
+    spell = SpellChecker()
+    corrector = TypoCorrector(DOCS_DIR, dictionary=SpellChecker(distance=1))
+
+    results = {
+        "legacy (cold)": measure(lambda q: legacy_correct(spell, q), queries, 1),
+        "legacy (warm)": measure(lambda q: legacy_correct(spell, q), queries, args.rounds),
+    }
+    corrector.load_vocabulary()  # clears the memo for a fair cold run
+    results["TypoCorrector (cold)"] = measure(corrector.correct, queries, 1)
+    results["TypoCorrector (warm)"] = measure(corrector.correct, queries, args.rounds)
+
+    print(f"{len(queries)} queries, {args.rounds} warm rounds\n")
+    print(f"{'engine':<24}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}   (ms per query)")
+    for name, r in results.items():
+        print(f"{name:<24}{r['mean_ms']:>10.3f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['max_ms']:>10.3f}")
+
+    print("\nSample corrections:")
+    for query in EXTRA_QUERIES:
+        print(f"  {query!r}\n    legacy: {legacy_correct(spell, query)!r}\n    new:    {corrector.correct(query)!r}")
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,402 @@
 # app/bot.py
 
 import requests
+import hashlib
 import json
 import logging
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 # Importe la fonction de récupération de contexte depuis rag.py
-from rag import retrieve_context
+from rag import retrieve, retrieve_batch, embed_query, get_index_version
+from answer_cache import answer_cache, replay_stream
+from command_resolver import is_conceptual_question
+from ollama_client import ollama_client, OllamaBusyError
+from singleflight import SingleFlight, TokenBroadcast
+from metrics import span, observe_stage, bind_context
+from mcp_context import get_llm_context, save_llm_context, clear_llm_context, get_summary_version, get_history_since, estimate_tokens
 
-def process_user_query_with_llm(user_query, conversation_history="", stream=False):
+# Marqueurs du format de réponse en une seule passe
+COMMAND_MARKER = "COMMAND:"
+ANSWER_MARKER = "ANSWER:"
+
+# Requêtes identiques simultanées : une seule génération, partagée (single-flight)
+_inflight = SingleFlight()
+# Streams de réponse en cours, que les requêtes identiques arrivant plus tard peuvent rejoindre
+_shared_streams = {}
+_shared_streams_lock = threading.Lock()
+
+# Fenêtre de contexte demandée à Ollama à chaque génération (sans elle, Ollama applique sa valeur
+# par défaut et tronque silencieusement le début d'un prompt trop long). Elle doit rester la même
+# d'un tour à l'autre : une autre valeur recharge le modèle et invalide les contextes KV.
+LLM_NUM_CTX = int(os.environ.get("CHATBOT_LLM_NUM_CTX", "4096"))
+# Tokens gardés libres pour la réponse dans num_ctx
+LLM_RESPONSE_TOKENS = int(os.environ.get("CHATBOT_LLM_RESPONSE_TOKENS", "512"))
+LLM_OPTIONS = {"temperature": 0.1, "num_ctx": LLM_NUM_CTX}
+# Réutilisation du contexte KV d'Ollama d'un tour à l'autre d'une session. Désactivée par défaut :
+# le gain n'a pas encore été mesuré sur un vrai serveur Ollama (bench/kv_context_bench.py)
+LLM_CONTEXT_REUSE = os.environ.get("CHATBOT_LLM_CONTEXT_REUSE", "0") == "1"
+# Tokens gardés libres dans num_ctx pour le nouveau contenu d'un tour (nouveaux échanges, contexte RAG, requête)
+LLM_PROMPT_RESERVE_TOKENS = int(os.environ.get("CHATBOT_LLM_PROMPT_RESERVE_TOKENS", "1024"))
+# Au-delà de cette taille, le contexte KV d'une session est abandonné : il ne laisserait plus la place
+# d'un tour dans num_ctx. Il l'est aussi quand il ne tient pas avec le prompt effectif (voir _build_prompt)
+LLM_CONTEXT_MAX_TOKENS = LLM_NUM_CTX - LLM_PROMPT_RESERVE_TOKENS - LLM_RESPONSE_TOKENS
+# Générations en parallèle pour un lot de requêtes : par défaut, autant que de créneaux Ollama
+BATCH_WORKERS = int(os.environ.get("CHATBOT_BATCH_WORKERS", str(ollama_client.max_concurrency)))
+
+# Instructions fixes en tête de chaque nouveau contexte : un préfixe stable, identique d'un tour à l'autre
+JSON_INSTRUCTIONS = (
+    "You are an expert Kubernetes assistant that can understand English and French. "
+    "Your goal is to analyze the user's request, the conversation history, and the provided context, then respond in a specific JSON format. "
+    "There are two possible response types: 'question' or 'command'.\n\n"
+    "1. If the user is asking a general question (e.g., 'what is a pod?', 'how do I scale a deployment?'):\n"
+    "   - First, check the 'RETRIEVED CONTEXT' section. If it contains relevant information, use it to build your answer.\n"
+    "   - If the context is not relevant, use your general knowledge.\n"
+    "   - Your JSON response must be: {\"type\": \"question\", \"answer\": \"<Your clear and helpful answer here>\"}\n\n"
+    "2. If the user is asking for a kubectl command (e.g., 'show me the pods', 'create a namespace called test'):\n"
+    "   - You must generate the simplest, most common, and directly executable `kubectl` command.\n"
+    "   - Use the 'COMMAND EXAMPLES' section as a reference for the expected command style.\n"
+    "   - Provide a very brief, one-sentence explanation of what the command does.\n"
+    "   - Your JSON response must be: {\"type\": \"command\", \"command\": \"<The kubectl command>\", \"explanation\": \"<The brief explanation>\"}\n\n"
+)
+JSON_REMINDER = "Respond with only the JSON object, and nothing else."
+
+SINGLE_PASS_INSTRUCTIONS = (
+    "You are an expert Kubernetes assistant that can understand English and French. "
+    "Analyze the user's request, the conversation history, and the provided context, then answer using exactly one of the two formats below.\n\n"
+    "1. If the user is asking for a kubectl command (e.g., 'show me the pods', 'create a namespace called test'), respond with exactly two lines:\n"
+    "COMMAND: <the simplest, most common, and directly executable kubectl command>\n"
+    "EXPLANATION: <a very brief, one-sentence explanation of what the command does>\n\n"
+    "2. If the user is asking a general question (e.g., 'what is a pod?', 'how do I scale a deployment?'), respond with:\n"
+    "ANSWER: <your clear and helpful answer>\n"
+    "   - Use the 'RETRIEVED CONTEXT' section if it is relevant, otherwise use your general knowledge.\n\n"
+)
+SINGLE_PASS_REMINDER = "Start your response with 'COMMAND:' or 'ANSWER:'."
+
+def process_user_query_with_llm(user_query, conversation_history="", cluster=None, use_cache=True, session_id=None, retrieved=None):
     """
-    Utilise le LLM pour traiter la requête de l'utilisateur.
-    Gère à la fois les réponses structurées (JSON) et les réponses en streaming.
+    Utilise le LLM pour traiter la requête de l'utilisateur et obtenir une réponse structurée (JSON).
+    Les réponses streamées passent par process_user_query_single_pass.
+    `retrieved` fournit un contexte RAG déjà récupéré (traitement par lots).
     """
     logging.info(f"Processing query with new LLM brain: '{user_query}'")
 
-    # Étape 1: Récupérer le contexte pertinent depuis la base de données vectorielle (RAG)
-    relevant_docs_context = retrieve_context(user_query)
-    logging.info(f"Retrieved RAG context: {relevant_docs_context}")
-    
-    # Si le client demande un streaming, on utilise un prompt plus simple pour une réponse directe.
-    if stream:
-        stream_prompt = (
-            "You are a helpful Kubernetes assistant. Based on the following context and conversation history, "
-            "answer the user's question directly and conversationally.\n"
-            f"Context: {relevant_docs_context}\n"
-            f"History: {conversation_history}\n"
-            f"User Question: {user_query}\n\n"
-            "Answer:"
-        )
-        # Retourne un générateur pour le streaming
-        return _query_ollama_stream(stream_prompt)
-
-    # Sinon, on utilise le prompt complexe pour obtenir un JSON structuré (commande ou question).
-    prompt = (
-        "You are an expert Kubernetes assistant that can understand English and French. "
-        "Your goal is to analyze the user's request, the conversation history, and the provided context, then respond in a specific JSON format. "
-        "There are two possible response types: 'question' or 'command'.\n\n"
-        "1. If the user is asking a general question (e.g., 'what is a pod?', 'how do I scale a deployment?'):\n"
-        "   - First, check the 'RETRIEVED CONTEXT' section. If it contains relevant information, use it to build your answer.\n"
-        "   - If the context is not relevant, use your general knowledge.\n"
-        "   - Your JSON response must be: {\"type\": \"question\", \"answer\": \"<Your clear and helpful answer here>\"}\n\n"
-        "2. If the user is asking for a kubectl command (e.g., 'show me the pods', 'create a namespace called test'):\n"
-        "   - You must generate the simplest, most common, and directly executable `kubectl` command.\n"
-        "   - Provide a very brief, one-sentence explanation of what the command does.\n"
-        "   - Your JSON response must be: {\"type\": \"command\", \"command\": \"<The kubectl command>\", \"explanation\": \"<The brief explanation>\"}\n\n"
-        "--- RETRIEVED CONTEXT ---\n"
-        f"{relevant_docs_context}\n"
-        "--- END CONTEXT ---\n\n"
+    # Cache sémantique : une question générale quasi identique déjà traitée sur ce cluster est resservie
+    # telle quelle. Le type de réponse n'est connu qu'après la génération : seules les questions que les
+    # règles reconnaissent comme conceptuelles le consultent, pour qu'une demande de commande proche
+    # d'une question en cache ne reçoive pas une réponse en prose
+    if use_cache and _answer_cacheable(conversation_history) and is_conceptual_question(user_query):
+        cached_answer = _lookup_cached_answer(user_query, cluster)
+        if cached_answer is not None:
+            return {"type": "question", "answer": cached_answer, "cached": True}
+
+    session = _session_context(session_id, "json", cluster)
+    # Les requêtes identiques simultanées attendent la même génération au lieu d'en lancer une autre
+    key = _coalescing_key("json" if use_cache else "regenerate", user_query, conversation_history, cluster, session)
+    return _inflight.do(key, lambda: _process_user_query_with_llm(user_query, conversation_history, cluster, session, retrieved))
+
+def _process_user_query_with_llm(user_query, conversation_history, cluster, session=None, retrieved=None):
+    # Étape 1: Récupérer le contexte pertinent et les exemples de commandes (RAG, une seule recherche)
+    if retrieved is None:
+        with span("retrieve"):
+            retrieved = retrieve(user_query)
+    logging.info(f"Retrieved RAG context: {retrieved['context']}")
+
+    # Le prompt complet, pour obtenir un JSON structuré (commande ou question).
+    prompt = _build_prompt(JSON_INSTRUCTIONS, JSON_REMINDER, retrieved, conversation_history, user_query, session)
+
+    logging.info("Sending master prompt for JSON response to LLM.")
+    done = {}
+    response_text = _query_ollama(prompt, context=_reused_context(session), on_done=done.update)
+    json_response = _parse_llm_json(response_text)
+    if json_response.get("type") == "question":
+        _cache_answer(user_query, conversation_history, cluster, json_response.get("answer"))
+    _save_session_context(session, done.get("context"), covers_next_turn=json_response.get("type") == "question")
+    return json_response
+
+def process_user_queries_batch(user_queries, cluster=None):
+    """
+    Traite un lot de requêtes indépendantes, sans historique ni contexte de session.
+    Le RAG du lot se fait en une passe (un seul embedding groupé, une recherche par index),
+    puis les générations tournent en parallèle, BATCH_WORKERS au plus.
+    Générateur de (index, réponse) dans l'ordre où les réponses se terminent.
+    """
+    logging.info(f"Processing a batch of {len(user_queries)} queries")
+    with span("retrieve"):
+        retrieved = retrieve_batch(user_queries)
+    pool = ThreadPoolExecutor(max_workers=max(1, min(BATCH_WORKERS, len(user_queries))), thread_name_prefix="batch")
+    try:
+        futures = {
+            pool.submit(bind_context(process_user_query_with_llm), query, cluster=cluster, retrieved=context): index
+            for index, (query, context) in enumerate(zip(user_queries, retrieved))
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                logging.error(f"Batch query failed: {e}")
+                yield futures[future], {"type": "question", "answer": f"An unexpected error occurred: {e}"}
+    finally:
+        # Client parti en cours de lot : les générations pas encore lancées sont abandonnées
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def process_user_query_single_pass(user_query, conversation_history="", cluster=None, session_id=None):
+    """
+    Traite la requête avec une seule génération LLM en streaming.
+    Le modèle annonce d'abord le type de réponse (COMMAND ou ANSWER) ; une commande est
+    collectée entièrement, une réponse est streamée token par token sans second appel.
+    Retourne soit {"type": "command", ...}, soit {"type": "question", "stream": <générateur>}.
+    """
+    logging.info(f"Processing query in single-pass mode: '{user_query}'")
+
+    # Une question conceptuelle en cache est rejouée comme un stream, sans génération ; les autres
+    # requêtes ne consultent le cache qu'une fois que le modèle a annoncé une réponse (voir plus bas)
+    if _answer_cacheable(conversation_history) and is_conceptual_question(user_query):
+        cached_answer = _lookup_cached_answer(user_query, cluster)
+        if cached_answer is not None:
+            return {"type": "question", "stream": replay_stream(cached_answer), "cached": True}
+
+    # Une requête identique est déjà en train de streamer sa réponse : on s'y abonne
+    session = _session_context(session_id, "single-pass", cluster)
+    key = _coalescing_key("single-pass", user_query, conversation_history, cluster, session)
+    with _shared_streams_lock:
+        broadcast = _shared_streams.get(key)
+    if broadcast is not None and not broadcast.finished:
+        logging.info(f"Joining the in-flight answer stream for: '{user_query}'")
+        return {"type": "question", "stream": broadcast.subscribe(), "coalesced": True}
+
+    result = _inflight.do(key, lambda: _single_pass_shared(key, user_query, conversation_history, cluster, session))
+    if "broadcast" in result:
+        return {"type": "question", "stream": result["broadcast"].subscribe()}
+    return result
+
+def _coalescing_key(mode, user_query, conversation_history, cluster, session=None):
+    """Clé de coalescence : requête normalisée, cluster et historique utile (et session si son contexte KV est réutilisé)."""
+    normalized = " ".join(user_query.lower().split())
+    reused = session["session_id"] if _reused_context(session) else ""
+    return hashlib.sha1(f"{mode}\0{normalized}\0{cluster}\0{conversation_history}\0{reused}".encode("utf-8")).hexdigest()
+
+def _session_context(session_id, mode, cluster):
+    """
+    Contexte KV Ollama réutilisable pour la session, s'il est toujours valide : même cluster,
+    pas de compaction de l'historique depuis, échange précédent bien enregistré et taille bornée.
+    Retourne None sans session ou si la réutilisation est désactivée ;
+    sinon {"session_id", "mode", "cluster", "summary_version", "context", "last_turn_id"}.
+    """
+    if not session_id or not LLM_CONTEXT_REUSE:
+        return None
+    session = {"session_id": session_id, "mode": mode, "cluster": cluster,
+               "summary_version": get_summary_version(session_id), "context": None, "last_turn_id": None}
+    stored = get_llm_context(session_id, mode)
+    if stored is None:
+        return session
+    if (stored["cluster"] != cluster or stored["summary_version"] != session["summary_version"]
+            or stored["last_turn_id"] is None or len(stored["context"]) > LLM_CONTEXT_MAX_TOKENS):
+        logging.info(f"Dropping the LLM context of session {session_id} ({mode})")
+        clear_llm_context(session_id, mode)
+        return session
+    session["context"] = stored["context"]
+    session["last_turn_id"] = stored["last_turn_id"]
+    return session
+
+def _reused_context(session):
+    return session["context"] if session and session["context"] else None
+
+def _save_session_context(session, context, covers_next_turn):
+    if session and context:
+        save_llm_context(session["session_id"], session["mode"], context, session["cluster"], session["summary_version"], covers_next_turn)
+
+def _build_prompt(instructions, reminder, retrieved, conversation_history, user_query, session=None):
+    """
+    Construit le prompt : instructions fixes, historique, contexte RAG puis la requête.
+    Quand le contexte KV de la session est réutilisé, Ollama a déjà vu les instructions et
+    les échanges précédents : on n'envoie que les tours enregistrés depuis et le nouveau contenu.
+    Si ce contexte, le nouveau prompt et la réponse ne tiennent pas dans num_ctx, le contexte
+    est abandonné et le prompt complet reconstruit, plutôt que de laisser Ollama en tronquer le début.
+    """
+    if _reused_context(session):
+        new_turns = get_history_since(session["session_id"], session["last_turn_id"])
+        header = f"--- NEW CONVERSATION HISTORY ---\n{new_turns}--- END HISTORY ---\n\n" if new_turns else ""
+        prompt = _assemble_prompt(header, reminder, retrieved, user_query)
+        needed = len(session["context"]) + estimate_tokens(prompt) + LLM_RESPONSE_TOKENS
+        if needed <= LLM_NUM_CTX:
+            return prompt
+        logging.info(f"Dropping the LLM context of session {session['session_id']} ({session['mode']}): "
+                     f"~{needed} tokens needed, num_ctx is {LLM_NUM_CTX}")
+        clear_llm_context(session["session_id"], session["mode"])
+        session["context"], session["last_turn_id"] = None, None
+    header = (
+        f"{instructions}"
         "--- CONVERSATION HISTORY ---\n"
         f"{conversation_history}\n"
         "--- END HISTORY ---\n\n"
+    )
+    prompt = _assemble_prompt(header, reminder, retrieved, user_query)
+    if estimate_tokens(prompt) + LLM_RESPONSE_TOKENS > LLM_NUM_CTX:
+        logging.warning(f"Prompt of ~{estimate_tokens(prompt)} tokens may not fit in num_ctx={LLM_NUM_CTX}")
+    return prompt
+
+def _assemble_prompt(header, reminder, retrieved, user_query):
+    return (
+        f"{header}"
+        "--- RETRIEVED CONTEXT ---\n"
+        f"{retrieved['context']}\n"
+        "--- END CONTEXT ---\n\n"
+        "--- COMMAND EXAMPLES ---\n"
+        f"{retrieved['command_examples']}\n"
+        "--- END EXAMPLES ---\n\n"
         f"User's Latest Request: \"{user_query}\"\n\n"
-        "Respond with only the JSON object, and nothing else."
+        f"{reminder}"
     )
 
-    logging.info("Sending master prompt for JSON response to LLM.")
+def _single_pass_shared(key, user_query, conversation_history, cluster, session=None):
+    """Exécute la passe unique ; une réponse streamée est diffusée à tous les abonnés."""
+    result = _process_user_query_single_pass(user_query, conversation_history, cluster, session)
+    if "stream" not in result:
+        return result
+
+    # Peut s'exécuter avant même l'affectation de `broadcast` (réponse rejouée du cache, stream
+    # instantané) : on retire l'entrée enregistrée pour la clé dès qu'elle est terminée
+    def forget():
+        with _shared_streams_lock:
+            current = _shared_streams.get(key)
+            if current is not None and current.finished:
+                del _shared_streams[key]
+
+    broadcast = TokenBroadcast(result["stream"], on_finish=forget)
+    with _shared_streams_lock:
+        if not broadcast.finished:
+            _shared_streams[key] = broadcast
+    return {"type": "question", "broadcast": broadcast}
+
+def get_coalescing_stats():
+    stats = _inflight.stats()
+    with _shared_streams_lock:
+        stats["shared_streams"] = len(_shared_streams)
+    return stats
+
+def _process_user_query_single_pass(user_query, conversation_history, cluster, session=None):
+    # Un seul appel RAG, réutilisé pour toute la génération
+    with span("retrieve"):
+        retrieved = retrieve(user_query)
+    logging.info(f"Retrieved RAG context: {retrieved['context']}")
+
+    prompt = _build_prompt(SINGLE_PASS_INSTRUCTIONS, SINGLE_PASS_REMINDER, retrieved, conversation_history, user_query, session)
+
+    done = {}
+    tokens = _query_ollama_stream(prompt, context=_reused_context(session), on_done=done.update)
+    buffered = ""
+    for token in tokens:
+        buffered += token
+        if _classify_head(buffered) is not None:
+            break
+    kind = _classify_head(buffered) or "answer"
+
+    if kind == "command" or kind == "json":
+        # Les commandes sont courtes : on lit la génération jusqu'au bout.
+        response_text = buffered + "".join(tokens)
+        logging.info(f"LLM Raw Response (single-pass): {response_text}")
+        if kind == "json":
+            json_response = _parse_llm_json(response_text)
+            if json_response.get("type") == "question":
+                _cache_answer(user_query, conversation_history, cluster, json_response.get("answer"))
+        else:
+            json_response = _parse_command_lines(response_text)
+        _save_session_context(session, done.get("context"), covers_next_turn=json_response.get("type") == "question")
+        return json_response
+
+    # Le modèle a annoncé une réponse générale : une réponse en cache pour une question proche
+    # est rejouée et la génération en cours est abandonnée
+    if _answer_cacheable(conversation_history) and not is_conceptual_question(user_query):
+        cached_answer = _lookup_cached_answer(user_query, cluster)
+        if cached_answer is not None:
+            tokens.close()
+            return {"type": "question", "stream": replay_stream(cached_answer), "cached": True}
+
+    head = buffered.lstrip()
+    if head.upper().startswith(ANSWER_MARKER):
+        head = head[len(ANSWER_MARKER):].lstrip()
+    def on_complete(answer):
+        _cache_answer(user_query, conversation_history, cluster, answer)
+        _save_session_context(session, done.get("context"), covers_next_turn=True)
+    return {"type": "question", "stream": _stream_answer(head, tokens, on_complete)}
+
+def _answer_cacheable(conversation_history):
+    """
+    Le cache ne porte que sur les questions posées hors conversation : avec un historique, une relance
+    ("explain more", "et en français ?") dépend des échanges précédents et non de la seule requête.
+    """
+    return not (conversation_history or "").strip()
+
+def _lookup_cached_answer(user_query, cluster):
+    try:
+        with span("answer_cache_lookup"):
+            return answer_cache.lookup(embed_query(user_query), cluster, get_index_version())
+    except Exception as e:
+        logging.error(f"Answer cache lookup failed: {e}")
+        return None
+
+def _cache_answer(user_query, conversation_history, cluster, answer):
+    """Mémorise une réponse générale donnée hors conversation, sauf les messages d'erreur."""
+    if not _answer_cacheable(conversation_history) or not answer or answer.startswith(("Error", "Sorry, I received", "An unexpected error")):
+        return
+    try:
+        answer_cache.store(embed_query(user_query), cluster, get_index_version(), answer)
+    except Exception as e:
+        logging.error(f"Answer cache store failed: {e}")
+
+def _classify_head(buffered):
+    """Détermine le type de réponse à partir du début de la génération (None = pas encore décidable)."""
+    head = buffered.lstrip()
+    if not head:
+        return None
+    if head.startswith("{") or head.startswith("```"):
+        return "json"
+    upper = head.upper()
+    for marker, kind in ((COMMAND_MARKER, "command"), (ANSWER_MARKER, "answer")):
+        if upper.startswith(marker):
+            return kind
+        if marker.startswith(upper):
+            return None
+    return "answer"
+
+def _stream_answer(head, tokens, on_complete=None):
+    """
+    Générateur qui rejoue le début déjà lu puis relaie le reste du stream Ollama.
+    `on_complete` reçoit la réponse complète, uniquement si le stream est allé jusqu'au bout.
+    """
+    parts = []
+    try:
+        if head:
+            parts.append(head)
+            yield head
+        for token in tokens:
+            parts.append(token)
+            yield token
+    finally:
+        tokens.close()
+    if on_complete:
+        on_complete("".join(parts).strip())
+
+def _parse_command_lines(response_text):
+    """Extrait la commande et l'explication d'une réponse au format COMMAND:/EXPLANATION:."""
+    command_match = re.search(r'COMMAND:\s*`*([^`\n]+?)`*\s*$', response_text, re.IGNORECASE | re.MULTILINE)
+    explanation_match = re.search(r'EXPLANATION:\s*(.+)', response_text, re.IGNORECASE)
+    if not command_match or not command_match.group(1).strip().startswith("kubectl"):
+        logging.error(f"Single-pass response did not contain a valid command: '{response_text}'")
+        return {"type": "question", "answer": "Sorry, I received an unexpected response from my AI brain. Please try rephrasing your request."}
+    return {
+        "type": "command",
+        "command": command_match.group(1).strip(),
+        "explanation": explanation_match.group(1).strip() if explanation_match else ""
+    }
+
+def _parse_llm_json(response_text):
+    """Nettoie et valide la réponse JSON (question ou commande) renvoyée par le LLM."""
+    clean_json_string = response_text
     try:
-        response_text = _query_ollama(prompt)
         clean_json_string = re.sub(r'```json\s*|\s*```', '', response_text).strip()
         logging.info(f"LLM Raw Response: {response_text}")
         logging.info(f"Cleaned JSON string: {clean_json_string}")
@@ -72,33 +411,45 @@ def process_user_query_with_llm(user_query, conversation_history="", stream=Fals
         logging.error(f"An unexpected error occurred in process_user_query_with_llm: {e}")
         return {"type": "question", "answer": f"An unexpected error occurred: {e}"}
 
-def _query_ollama(prompt):
-    """Fonction interne pour envoyer un prompt à Ollama et obtenir une réponse complète (non-stream)."""
+def _query_ollama(prompt, context=None, on_done=None):
+    """
+    Fonction interne pour envoyer un prompt à Ollama et obtenir une réponse complète (non-stream).
+    `context` reprend le contexte KV d'un tour précédent ; `on_done` reçoit la réponse finale d'Ollama.
+    """
     try:
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={"model": "mistral:instruct", "prompt": prompt, "stream": False, "options": {"temperature": 0.1}}
-        )
-        response.raise_for_status()
-        full_response_data = response.json()
+        extra = {"context": context} if context else {}
+        with span("llm_generate"):
+            full_response_data = ollama_client.generate(prompt, options=LLM_OPTIONS, **extra)
+        if on_done:
+            on_done(full_response_data)
         return full_response_data.get("response", "")
+    except OllamaBusyError as e:
+        logging.error(f"Ollama is busy: {str(e)}")
+        return "{\"type\": \"question\", \"answer\": \"Error: The language model is busy, please try again in a moment.\"}"
     except requests.RequestException as e:
         logging.error(f"Error connecting to Ollama: {str(e)}")
         return "{\"type\": \"question\", \"answer\": \"Error: Could not connect to the language model.\"}"
 
-def _query_ollama_stream(prompt):
-    """Fonction interne pour envoyer un prompt à Ollama et streamer la réponse."""
+def _query_ollama_stream(prompt, context=None, on_done=None):
+    """Fonction interne pour envoyer un prompt à Ollama et streamer la réponse (voir _query_ollama)."""
+    extra = {"context": context} if context else {}
+    chunks = ollama_client.generate_stream(prompt, options=LLM_OPTIONS, **extra)
+    start = time.perf_counter()
+    first_token = True
     try:
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={"model": "mistral:instruct", "prompt": prompt, "stream": True, "options": {"temperature": 0.1}},
-            stream=True
-        )
-        response.raise_for_status()
-        for chunk in response.iter_lines():
-            if chunk:
-                decoded_chunk = json.loads(chunk)
-                yield decoded_chunk.get("response", "")
+        for decoded_chunk in chunks:
+            if first_token:
+                observe_stage("llm_first_token", time.perf_counter() - start)
+                first_token = False
+            if decoded_chunk.get("done") and on_done:
+                on_done(decoded_chunk)
+            yield decoded_chunk.get("response", "")
+    except OllamaBusyError as e:
+        logging.error(f"Ollama is busy: {str(e)}")
+        yield "Error: The language model is busy, please try again in a moment."
     except requests.RequestException as e:
         logging.error(f"Error connecting to Ollama for streaming: {str(e)}")
         yield "Error: Could not connect to the language model."
+    finally:
+        chunks.close()
+        observe_stage("llm_stream", time.perf_counter() - start)
@@ -1,43 +1,143 @@
+import hashlib
+import json
 import os
+import threading
 from kubernetes import client, config
 import logging # <-- THE MISSING IMPORT
+import yaml
 
 KUBE_CONFIG_PATH = os.environ.get("CHATBOT_KUBECONFIG_PATH")
+# Cluster value targeting every context (fan-out); a comma-separated list targets several
+ALL_CLUSTERS = "*"
 
 class ClusterManager:
+    """
+    Kubeconfig contexts and one isolated ApiClient (with its own connection pool) per context.
+    The kubeconfig file is re-read when it changes on disk; only the clients of contexts whose
+    definition changed are rebuilt. The process-global kubernetes configuration is never touched.
+    The kubeconfig is first read on first use, not at import.
+    """
+
     def __init__(self):
         self.clusters = {}
         self.current_context = None
-        self.load_clusters()
+        self._active_context = None
+        self._fingerprints = {}
+        self._clients = {}
+        self._file_state = None
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def _stat(self):
+        try:
+            stat = os.stat(KUBE_CONFIG_PATH)
+            return (stat.st_mtime_ns, stat.st_size)
+        except (OSError, TypeError):
+            return None
+
+    def _context_fingerprints(self):
+        """Hash of each context together with the cluster and user entries it points to."""
+        with open(KUBE_CONFIG_PATH, "r") as f:
+            kubeconfig = yaml.safe_load(f) or {}
+        clusters = {c.get("name"): c for c in kubeconfig.get("clusters") or []}
+        users = {u.get("name"): u for u in kubeconfig.get("users") or []}
+        fingerprints = {}
+        for context in kubeconfig.get("contexts") or []:
+            details = context.get("context") or {}
+            definition = [context, clusters.get(details.get("cluster")), users.get(details.get("user"))]
+            fingerprints[context.get("name")] = hashlib.sha256(json.dumps(definition, sort_keys=True, default=str).encode()).hexdigest()
+        return fingerprints
 
     def load_clusters(self):
         """Load available kubeconfig contexts from the explicit path."""
-        if not KUBE_CONFIG_PATH or not os.path.exists(KUBE_CONFIG_PATH):
-            logging.error(f"ClusterManager: Kubeconfig path not found. Var value: {KUBE_CONFIG_PATH}")
-            self.clusters = {}
-            return
-        
-        try:
-            contexts, _ = config.list_kube_config_contexts(config_file=KUBE_CONFIG_PATH)
-            for context in contexts:
-                context_name = context['name']
-                self.clusters[context_name] = context
+        with self._lock:
+            self._loaded = True
+            if not KUBE_CONFIG_PATH or not os.path.exists(KUBE_CONFIG_PATH):
+                logging.error(f"ClusterManager: Kubeconfig path not found. Var value: {KUBE_CONFIG_PATH}")
+                self.clusters = {}
+                self._clients = {}
+                return
+
+            self._file_state = self._stat()
+            try:
+                contexts, active = config.list_kube_config_contexts(config_file=KUBE_CONFIG_PATH)
+                fingerprints = self._context_fingerprints()
+            except Exception as e:
+                logging.error(f"Error loading clusters from {KUBE_CONFIG_PATH}: {e}")
+                self.clusters = {}
+                self._clients = {}
+                return
+
+            # Only the clients of removed or modified contexts are dropped
+            changed = [name for name in self._clients if fingerprints.get(name) != self._fingerprints.get(name)]
+            for name in changed:
+                del self._clients[name]
+            if changed:
+                logging.info(f"Kubeconfig contexts changed, API clients rebuilt on next use: {changed}")
+            self.clusters = {context['name']: context for context in contexts}
+            self._active_context = active['name'] if active else None
+            self._fingerprints = fingerprints
             logging.info(f"Successfully loaded clusters: {list(self.clusters.keys())}")
-        except Exception as e:
-            logging.error(f"Error loading clusters from {KUBE_CONFIG_PATH}: {e}")
-            self.clusters = {}
+
+    def _refresh(self):
+        """Load the contexts on first use, then reload them if the kubeconfig file changed since."""
+        if not self._loaded or self._stat() != self._file_state:
+            self.load_clusters()
+
+    def _resolve(self, cluster_name):
+        return cluster_name or self._active_context
+
+    def get_api_client(self, cluster_name=None):
+        """
+        Return the ApiClient of a context (the kubeconfig's current context when None).
+        Clients are built once and shared; raises KeyError for an unknown context.
+        A client is built outside the lock (exec and auth plugins can take seconds) so lookups
+        on other contexts do not wait for it; when two callers build the same one, the first
+        inserted wins.
+        """
+        with self._lock:
+            self._refresh()
+            name = self._resolve(cluster_name)
+            if name not in self.clusters:
+                raise KeyError(f"Unknown Kubernetes context: {cluster_name}")
+            api = self._clients.get(name)
+            fingerprint = self._fingerprints.get(name)
+        if api is not None:
+            return api
+
+        api = config.new_client_from_config(config_file=KUBE_CONFIG_PATH, context=name)
+        with self._lock:
+            if self._fingerprints.get(name) != fingerprint:
+                # The context was redefined meanwhile: this client serves this call only
+                return api
+            existing = self._clients.get(name)
+            if existing is None:
+                self._clients[name] = api
+                logging.info(f"Created API client for context: {name}")
+                return api
+        api.close()
+        return existing
+
+    def get_default_namespace(self, cluster_name=None):
+        """Namespace set on the context, as kubectl uses it when no -n is given."""
+        with self._lock:
+            self._refresh()
+            context = self.clusters.get(self._resolve(cluster_name)) or {}
+            return (context.get('context') or {}).get('namespace') or "default"
+
+    def has_cluster(self, cluster_name):
+        with self._lock:
+            self._refresh()
+            return cluster_name in self.clusters
 
     def set_cluster(self, cluster_name):
-        """Set the active cluster context using the explicit path."""
-        if cluster_name in self.clusters:
+        """
+        Validate a context and remember it as the last one used. Kept for older callers:
+        the global kubernetes configuration is no longer switched, use get_api_client().
+        """
+        if self.has_cluster(cluster_name):
             self.current_context = cluster_name
-            try:
-                config.load_kube_config(config_file=KUBE_CONFIG_PATH, context=cluster_name)
-                logging.info(f"Set active Kubernetes context to: {cluster_name}")
-                return True
-            except Exception as e:
-                logging.error(f"Error setting cluster context '{cluster_name}': {e}")
-                return False
+            return True
         return False
 
     def get_current_cluster(self):
@@ -46,6 +146,16 @@ class ClusterManager:
 
     def list_clusters(self):
         """Return list of available clusters."""
-        return list(self.clusters.keys())
+        with self._lock:
+            self._refresh()
+            return list(self.clusters.keys())
+
+    def fanout_targets(self, cluster):
+        """Contexts targeted by a cluster value: every one for ALL_CLUSTERS, the names of a comma-separated list, None for a single cluster."""
+        if cluster == ALL_CLUSTERS:
+            return self.list_clusters()
+        if cluster and "," in cluster:
+            return list(dict.fromkeys(name.strip() for name in cluster.split(",") if name.strip()))
+        return None
 
 cluster_manager = ClusterManager()
@@ -0,0 +1,376 @@
+# app/command_resolver.py
+
+import logging
+import os
+import re
+import shlex
+
+from nlp_parser2 import K8S_COMMAND_VERBS, K8S_RESOURCES, _extract_parameter_and_clean
+
+# Queries resolved with at least this confidence skip the LLM entirely
+FAST_PATH_THRESHOLD = float(os.environ.get("CHATBOT_FAST_PATH_THRESHOLD", "0.8"))
+
+# Commands that change the cluster never skip the LLM, however confident the rules are: a
+# misread name ("remove the kube-system namespace") would otherwise be one click from running
+MUTATING_VERBS = {"delete", "restart", "scale", "create"}
+MUTATING_MAX_CONFIDENCE = FAST_PATH_THRESHOLD - 0.1
+
+# Only the explicit cluster phrases: the bare "on"/"cluster" indicators of the parser
+# also match "on port 80" or "in the cluster".
+CLUSTER_PHRASES = ["on cluster", "in cluster", "for cluster", "sur le cluster", "dans le cluster"]
+# Fan-out requests: "on all clusters", "across clusters", "sur tous les clusters", "on clusters a, b and c"
+ALL_CLUSTERS_RE = re.compile(r"\b(?:(?:on|in|across|for|sur|dans)\s+(?:all|every|tous)\s+(?:the\s+|les\s+)?clusters?|across\s+(?:the\s+)?clusters)\b")
+CLUSTER_LIST_RE = re.compile(r"\b(?:on|in|across|for|sur|dans)\s+(?:the\s+|les\s+)?clusters\s+([a-z0-9_-]+(?:\s*(?:,|\band\b|\bet\b)\s*[a-z0-9_-]+)+)")
+
+# Natural-language verbs (English and French) mapped to kubectl verbs
+VERB_SYNONYMS = {
+    "show": "get", "list": "get", "display": "get", "view": "get", "see": "get", "fetch": "get",
+    "affiche": "get", "afficher": "get", "liste": "get", "lister": "get", "montre": "get",
+    "décris": "describe", "decris": "describe", "details": "describe",
+    "log": "logs", "supprime": "delete", "supprimer": "delete", "remove": "delete",
+    "crée": "create", "cree": "create", "créer": "create",
+    "restart": "restart", "redémarre": "restart", "usage": "top", "scale": "scale",
+}
+
+# Multi-word phrases rewritten to a single token before matching
+PHRASES = [
+    (r"\bwhat are\b", "list"),
+    (r"\bresource usage\b", "usage"),
+    (r"\bpersistent volume claims?\b", "pvc"),
+    (r"\bpersistent volumes?\b", "pv"),
+    (r"\bconfig ?maps?\b", "configmaps"),
+    (r"\bstateful ?sets?\b", "statefulsets"),
+    (r"\bdaemon ?sets?\b", "daemonsets"),
+    (r"\bcron ?jobs?\b", "cronjobs"),
+    (r"\bstorage ?class(es)?\b", "storageclasses"),
+    (r"\b(all|tous les|toutes les) (the )?(namespaces|espaces de noms)\b", "--all-namespaces"),
+    (r"\bacross namespaces\b", "--all-namespaces"),
+]
+
+# Canonical (plural) resource name for every alias in the parser's resource list
+RESOURCE_CANONICAL = {}
+for _group in (
+    ("pods", "pod", "po"), ("deployments", "deployment", "deploy"), ("statefulsets", "statefulset", "sts"),
+    ("daemonsets", "daemonset", "ds"), ("jobs", "job"), ("cronjobs", "cronjob", "cj"),
+    ("services", "service", "svc"), ("ingresses", "ingress", "ing"), ("configmaps", "configmap", "cm"),
+    ("secrets", "secret"), ("persistentvolumes", "persistentvolume", "pv"),
+    ("persistentvolumeclaims", "persistentvolumeclaim", "pvc"), ("storageclasses", "storageclass", "sc"),
+    ("nodes", "node"), ("namespaces", "namespace", "ns"),
+):
+    for _alias in _group:
+        if _alias in K8S_RESOURCES:
+            RESOURCE_CANONICAL[_alias] = _group[0]
+RESOURCE_CANONICAL.update({"events": "events", "event": "events", "crds": "crds", "crd": "crds"})
+
+# Preferred spelling in generated commands (matches docs/k8s_commands.txt)
+RESOURCE_OUTPUT = {"services": "svc", "persistentvolumes": "pv", "persistentvolumeclaims": "pvc"}
+RESOURCE_SINGULAR = {
+    "pods": "pod", "deployments": "deployment", "statefulsets": "statefulset", "daemonsets": "daemonset",
+    "jobs": "job", "cronjobs": "cronjob", "services": "svc", "ingresses": "ingress", "configmaps": "configmap",
+    "secrets": "secret", "persistentvolumes": "pv", "persistentvolumeclaims": "pvc",
+    "storageclasses": "storageclass", "nodes": "node", "namespaces": "namespace", "events": "event", "crds": "crd",
+}
+RESOURCE_GET_FLAGS = {"events": " --sort-by=.metadata.creationTimestamp"}
+CLUSTER_SCOPED = {"nodes", "namespaces", "persistentvolumes", "storageclasses", "crds"}
+NAMED_VERBS = ("describe", "delete", "logs", "restart", "rollout status", "scale", "create")
+
+# Words that carry no meaning for the command
+STOPWORDS = {
+    "the", "a", "an", "all", "me", "my", "of", "for", "in", "on", "from", "to", "with", "please", "pls",
+    "can", "you", "could", "i", "want", "need", "are", "is", "there", "which", "current", "currently",
+    "le", "la", "les", "des", "de", "du", "un", "une", "dans", "moi", "tous", "toutes", "running", "available",
+    "named", "called", "name", "container", "cluster", "some", "every", "what", "check", "rollout", "status",
+}
+# Conceptual questions are left to the LLM
+QUESTION_MARKERS = re.compile(r"^(how|why|what is|what's|what does|explain|when|comment|pourquoi|qu'est-ce|c'est quoi)\b")
+
+_NAME_RE = re.compile(r"^[a-z0-9]([a-z0-9.-]*[a-z0-9])?$")
+
+# Output format and label selector are kept as kubectl flags: "-o yaml" must not read as an object named "o"
+OUTPUT_RE = re.compile(r"(?:^|\s)(?:-o|--output)(?:=|\s+)(\S+)|\b(?:as|in|en)\s+(yaml|json)(?:\s+format)?\b")
+SELECTOR_RE = re.compile(r"(?:^|\s)(?:-l|--selector)(?:=|\s+)(\S+)")
+FLAG_VERBS = {"-o": ("get",), "-l": ("get", "describe", "top")}
+# Values kubectl accepts: the printer names of -o, and the equality-based label selector syntax of -l
+_TEMPLATE_OUTPUTS = ("jsonpath", "jsonpath-as-json", "jsonpath-file", "go-template", "go-template-file",
+                     "template", "templatefile", "custom-columns", "custom-columns-file")
+OUTPUT_VALUE_RE = re.compile(rf"json|yaml|wide|name|(?:{'|'.join(_TEMPLATE_OUTPUTS)})=[^\s;|&<>`]+")
+_LABEL_KEY = r"(?:[a-z0-9](?:[-a-z0-9.]*[a-z0-9])?/)?[a-z0-9](?:[-a-z0-9_.]*[a-z0-9])?"
+_LABEL_VALUE = r"(?:[a-z0-9](?:[-a-z0-9_.]*[a-z0-9])?)?"
+_LABEL_REQUIREMENT = rf"(?:!?{_LABEL_KEY}|{_LABEL_KEY}(?:==?|!=){_LABEL_VALUE})"
+SELECTOR_VALUE_RE = re.compile(rf"{_LABEL_REQUIREMENT}(?:,{_LABEL_REQUIREMENT})*")
+FLAG_VALUES = {"-o": OUTPUT_VALUE_RE, "-l": SELECTOR_VALUE_RE}
+# Every unexplained word costs this much confidence: a single one keeps the query below the default threshold
+LEFTOVER_PENALTY = 0.2
+
+def _looks_generated(token):
+    """Object names with a dash or a digit (my-app, web-5d8f7, node2) are unlikely to be plain words."""
+    return "-" in token or any(c.isdigit() for c in token)
+
+def _explained(token):
+    return token in STOPWORDS or token.isdigit() or token in ("replicas", "replica")
+
+def _extract_namespace(text):
+    """Namespace extraction that ignores 'in the cluster', 'in pod x' and similar phrases."""
+    patterns = [
+        r"(?:^|\s)(?:-n\s+|--namespace(?:=|\s+))([a-z0-9-]+)",
+        r"\b(?:in|from|dans)\s+(?:the\s+|le\s+)?(?:namespace|ns)\s+([a-z0-9-]+)",
+        r"\b(?:in|from|dans)\s+(?:the\s+|le\s+)?([a-z0-9-]+)\s+(?:namespace|ns)\b",
+        r"\bnamespace\s+([a-z0-9-]+)",
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, text)
+        if match and match.group(1) not in RESOURCE_CANONICAL and match.group(1) not in STOPWORDS:
+            return match.group(1), (text[:match.start()] + " " + text[match.end():]).strip()
+    # "in codep-orange" style: only accepted when the value looks like a name and not a resource
+    match = re.search(r"\b(?:in|from|dans)\s+([a-z0-9][a-z0-9-]*)\s*$", text)
+    if match and match.group(1) not in RESOURCE_CANONICAL and match.group(1) not in STOPWORDS:
+        return match.group(1), text[:match.start()].strip()
+    return None, text
+
+def _extract_flags(text):
+    """
+    The -o and -l values found in the text, keyed by flag, and the ones kubectl would reject
+    ("-o yaml;"), with the text cleaned of both.
+    """
+    flags, invalid = {}, []
+    for flag, pattern in (("-o", OUTPUT_RE), ("-l", SELECTOR_RE)):
+        match = pattern.search(text)
+        if match:
+            value = next(group for group in match.groups() if group)
+            if FLAG_VALUES[flag].fullmatch(value):
+                flags[flag] = value
+            else:
+                invalid.append(f"{flag} {value}")
+            text = (text[:match.start()] + " " + text[match.end():]).strip()
+    return flags, invalid, text
+
+def _extract_clusters(text):
+    """Fan-out target: "all", a list of cluster names, or None; with the text cleaned of the phrase."""
+    match = ALL_CLUSTERS_RE.search(text)
+    if match:
+        return "all", (text[:match.start()] + " " + text[match.end():]).strip()
+    match = CLUSTER_LIST_RE.search(text)
+    if match:
+        names = [name for name in re.split(r"\s*(?:,|\band\b|\bet\b)\s*", match.group(1)) if name]
+        return names, (text[:match.start()] + " " + text[match.end():]).strip()
+    return None, text
+
+def is_conceptual_question(user_input):
+    """True for questions ("what is...", "comment...") that ask for an explanation, never a command."""
+    return QUESTION_MARKERS.search(" ".join(user_input.lower().split())) is not None
+
+def _result(command=None, confidence=0.0, explanation="", cluster=None, namespace=None, clusters=None):
+    return {"command": command, "confidence": round(max(0.0, min(confidence, 1.0)), 2),
+            "explanation": explanation, "cluster": cluster, "namespace": namespace, "clusters": clusters}
+
+def resolve_command(user_input):
+    """
+    Resolves a natural-language request into a kubectl command with rules and templates.
+    Returns a dict with the command (or None), a confidence in [0, 1], an explanation,
+    and the cluster/namespace found in the text. `clusters` is "all" or a list of names
+    when the request targets several clusters.
+    """
+    text = " ".join(user_input.lower().strip().rstrip("?.!").split())
+    if not text:
+        return _result()
+    if is_conceptual_question(text):
+        return _result(explanation="Conceptual question.")
+
+    clusters, text = _extract_clusters(text)
+    cluster, text = _extract_parameter_and_clean(text, CLUSTER_PHRASES)
+    if cluster:
+        cluster = cluster.lower()
+    for pattern, replacement in PHRASES:
+        text = re.sub(pattern, replacement, text)
+    all_namespaces = "--all-namespaces" in text or re.search(r"(^|\s)-a(\s|$)", text) is not None
+    text = re.sub(r"--all-namespaces|(^|\s)-a(?=\s|$)", " ", text)
+    flags, invalid_flags, text = _extract_flags(text)
+    namespace, text = _extract_namespace(text)
+
+    tokens = re.findall(r"[a-zà-ÿ0-9][a-zà-ÿ0-9./=:_-]*", text)
+    if tokens and tokens[0] == "kubectl":
+        tokens = tokens[1:]
+
+    # Verb priority: logs, then real kubectl verbs, then natural-language synonyms ("view logs", "show ... describe")
+    verb, verb_index = None, None
+    for candidates in (("logs", "log"), K8S_COMMAND_VERBS, VERB_SYNONYMS):
+        verb_index = next((i for i, token in enumerate(tokens) if token in candidates), None)
+        if verb_index is not None:
+            verb = VERB_SYNONYMS.get(tokens[verb_index], tokens[verb_index])
+            break
+    resource, resource_index = None, None
+    for i, token in enumerate(tokens):
+        if i != verb_index and token in RESOURCE_CANONICAL:
+            resource, resource_index = RESOURCE_CANONICAL[token], i
+            break
+    if resource is None and all_namespaces:
+        # "list all namespaces"
+        resource, all_namespaces = "namespaces", False
+
+    # "status" right after a rollout-able resource means rollout status
+    if verb is None and "status" in tokens and "rollout" in tokens:
+        verb, verb_index = "rollout status", tokens.index("rollout")
+    elif verb == "get" and "rollout" in tokens and "status" in tokens:
+        verb = "rollout status"
+    if verb is None and resource is None:
+        return _result()
+
+    # Name: after "named"/"called", otherwise the identifier right after the resource. A plain word
+    # there ("pods that are...", "pods and services") is only a name for verbs that need one, and
+    # only when nothing unexplained follows it
+    name, container = None, None
+    consumed = {verb_index, resource_index}
+    for i, token in enumerate(tokens):
+        if token in ("named", "called", "nommé", "appelé") and i + 1 < len(tokens):
+            if i > 0 and tokens[i - 1] == "container":
+                container = tokens[i + 1]
+            elif name is None:
+                name = tokens[i + 1]
+            consumed.update({i, i + 1})
+    if name is None and resource_index is not None and resource_index + 1 < len(tokens):
+        candidate = tokens[resource_index + 1]
+        if (candidate not in STOPWORDS and candidate not in RESOURCE_CANONICAL and _NAME_RE.match(candidate)
+                and (_looks_generated(candidate)
+                     or verb in NAMED_VERBS and all(_explained(t) for t in tokens[resource_index + 2:]))):
+            name = candidate
+            consumed.add(resource_index + 1)
+    if name is None and verb in NAMED_VERBS:
+        # "logs for jenkins-orange-...", "status of frontend deployment": take a name-like leftover,
+        # preferring generated-looking names; a plain word only when it is the only candidate
+        leftover = [(i, t) for i, t in enumerate(tokens)
+                    if i not in consumed and t not in STOPWORDS and t not in RESOURCE_CANONICAL
+                    and t not in VERB_SYNONYMS and t not in K8S_COMMAND_VERBS and _NAME_RE.match(t)]
+        leftover.sort(key=lambda item: not _looks_generated(item[1]))
+        if leftover and (len(leftover) == 1 or _looks_generated(leftover[0][1])):
+            name = leftover[0][1]
+            consumed.add(leftover[0][0])
+    if name and not _NAME_RE.match(name):
+        name = None
+
+    replicas = None
+    if verb == "scale":
+        match = re.search(r"\b(\d+)\s*(replicas?)?\b", " ".join(tokens[verb_index + 1:]))
+        if match:
+            replicas = match.group(1)
+            consumed.update(i for i, t in enumerate(tokens) if t in (replicas, "replicas", "replica"))
+
+    leftovers = [t for i, t in enumerate(tokens)
+                 if i not in consumed and t not in STOPWORDS and t not in ("logs", "log", "replicas", "replica")
+                 and VERB_SYNONYMS.get(t) != "get"] + invalid_flags
+
+    command, explanation, confidence = _build_command(verb, resource, name, container, replicas)
+    if command is None:
+        return _result(confidence=0.3 if verb and resource else 0.1, cluster=cluster, namespace=namespace, clusters=clusters)
+
+    if resource not in CLUSTER_SCOPED:
+        if all_namespaces and verb in ("get", "top"):
+            command += " --all-namespaces"
+            explanation += " across all namespaces"
+        elif namespace:
+            command += f" -n {namespace}"
+            explanation += f" in namespace {namespace}"
+    for flag, value in flags.items():
+        if (verb or "get") in FLAG_VERBS[flag]:
+            command += f" {flag} {value}"
+            explanation += f" as {value}" if flag == "-o" else f" matching {value}"
+        else:
+            leftovers.append(f"{flag} {value}")
+
+    # Every unexplained word lowers the confidence: the rules may have missed part of the request
+    confidence -= LEFTOVER_PENALTY * len(leftovers)
+    if verb in MUTATING_VERBS:
+        confidence = min(confidence, MUTATING_MAX_CONFIDENCE)
+    logging.info(f"Command resolver: '{user_input}' -> '{command}' (confidence {confidence:.2f}, leftovers {leftovers})")
+    if clusters:
+        explanation += " on all clusters" if clusters == "all" else f" on clusters {', '.join(clusters)}"
+    return _result(command, confidence, explanation + ".", cluster, namespace, clusters)
+
+def _build_command(verb, resource, name, container, replicas):
+    """Apply the template of a verb; returns (command, explanation, base confidence)."""
+    if verb is None:
+        # A bare resource ("pods in dev") is a listing request; a named object without a
+        # known verb ("cordon a node named node-2") is an action the rules do not know
+        if resource is None or name:
+            return None, "", 0.0
+        return f"kubectl get {RESOURCE_OUTPUT.get(resource, resource)}", f"Lists the {resource}", 0.85
+
+    if verb == "get":
+        if resource is None:
+            return None, "", 0.0
+        if name:
+            return f"kubectl get {RESOURCE_SINGULAR.get(resource, resource)} {name}", f"Shows the {RESOURCE_SINGULAR.get(resource, resource)} {name}", 0.95
+        return f"kubectl get {RESOURCE_OUTPUT.get(resource, resource)}{RESOURCE_GET_FLAGS.get(resource, '')}", f"Lists the {resource}", 0.95
+
+    if verb == "describe":
+        if resource is None:
+            return None, "", 0.0
+        kind = RESOURCE_SINGULAR.get(resource, resource)
+        if name:
+            return f"kubectl describe {kind} {name}", f"Shows the details of the {kind} {name}", 0.95
+        return f"kubectl describe {RESOURCE_OUTPUT.get(resource, resource)}", f"Shows the details of all {resource}", 0.85
+
+    if verb == "logs":
+        if not name or resource not in (None, "pods"):
+            return None, "", 0.0
+        command = f"kubectl logs {name}"
+        explanation = f"Shows the logs of pod {name}"
+        if container:
+            command += f" -c {container}"
+            explanation += f" (container {container})"
+        return command, explanation, 0.95
+
+    if verb == "top":
+        if resource not in ("pods", "nodes"):
+            return None, "", 0.0
+        return f"kubectl top {resource}", f"Shows CPU and memory usage of the {resource}", 0.95
+
+    if verb == "delete":
+        # Destructive commands need an explicit target
+        if resource is None or not name:
+            return None, "", 0.0
+        kind = RESOURCE_SINGULAR.get(resource, resource)
+        return f"kubectl delete {kind} {name}", f"Deletes the {kind} {name}", 0.9
+
+    if verb == "create":
+        if resource != "namespaces" or not name:
+            return None, "", 0.0
+        return f"kubectl create namespace {name}", f"Creates the namespace {name}", 0.9
+
+    if verb in ("restart", "rollout status"):
+        if resource not in ("deployments", "statefulsets", "daemonsets") or not name:
+            return None, "", 0.0
+        kind = RESOURCE_SINGULAR[resource]
+        if verb == "restart":
+            return f"kubectl rollout restart {kind} {name}", f"Restarts the pods of {kind} {name}", 0.9
+        return f"kubectl rollout status {kind} {name}", f"Shows the rollout status of {kind} {name}", 0.9
+
+    if verb == "scale":
+        if resource not in ("deployments", "statefulsets") or not name or not replicas:
+            return None, "", 0.0
+        kind = RESOURCE_SINGULAR[resource]
+        return f"kubectl scale {kind} {name} --replicas={replicas}", f"Scales {kind} {name} to {replicas} replicas", 0.9
+
+    return None, "", 0.0
+
+def normalize_command(command):
+    """Canonical form of a kubectl command, so that equivalent spellings compare equal."""
+    try:
+        parts = shlex.split(command)
+    except ValueError:
+        return command.strip()
+    normalized, i = [], 0
+    while i < len(parts):
+        part = parts[i]
+        if part in ("-A", "--all-namespaces"):
+            normalized.append("--all-namespaces")
+        elif part in ("-n", "--namespace") and i + 1 < len(parts):
+            normalized.append(f"--namespace={parts[i + 1]}")
+            i += 1
+        elif part.startswith("--namespace="):
+            normalized.append(part)
+        elif part.lower() in RESOURCE_CANONICAL:
+            normalized.append(RESOURCE_CANONICAL[part.lower()])
+        else:
+            normalized.append(part)
+        i += 1
+    return " ".join(normalized)
@@ -0,0 +1,7 @@
+# app/conftest.py
+
+import os
+import tempfile
+
+# mcp_context opens its database at import: the tests must never touch logs/sessions.db
+os.environ.setdefault("CHATBOT_SESSION_DB", os.path.join(tempfile.mkdtemp(prefix="chatbot-tests-"), "sessions.db"))
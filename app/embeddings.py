@@ -0,0 +1,83 @@
+# app/embeddings.py
+"""
+Embedding backend of the RAG index, selected by environment variables:
+  CHATBOT_EMBEDDING_MODEL         sentence-transformers model (default BAAI/bge-m3; smaller options
+                                  include sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2
+                                  or the English-only sentence-transformers/all-MiniLM-L6-v2)
+  CHATBOT_EMBEDDING_BACKEND       "huggingface" (PyTorch, default) or "onnx" (ONNX Runtime on CPU)
+  CHATBOT_EMBEDDING_QUANTIZATION  onnx only: int8 dynamic quantization for "avx2", "avx512",
+                                  "avx512_vnni" or "arm64"; the quantized model is exported once
+                                  under CHATBOT_EMBEDDING_CACHE_DIR
+  CHATBOT_EMBEDDING_ONNX_FILE     onnx only: ONNX file of the model repository to load instead
+                                  (e.g. onnx/model_qint8_avx512.onnx when the repository ships one)
+  CHATBOT_EMBEDDING_THREADS       CPU threads used for inference (0 = library default)
+  CHATBOT_EMBEDDING_BATCH_SIZE    texts encoded per forward pass
+Every backend is wrapped in HuggingFaceEmbeddings, so the LangChain interface stays the same.
+"""
+
+import logging
+import os
+
+EMBEDDING_MODEL = os.environ.get("CHATBOT_EMBEDDING_MODEL", "BAAI/bge-m3")
+EMBEDDING_BACKEND = os.environ.get("CHATBOT_EMBEDDING_BACKEND", "huggingface")
+EMBEDDING_QUANTIZATION = os.environ.get("CHATBOT_EMBEDDING_QUANTIZATION", "")
+EMBEDDING_ONNX_FILE = os.environ.get("CHATBOT_EMBEDDING_ONNX_FILE", "")
+EMBEDDING_THREADS = int(os.environ.get("CHATBOT_EMBEDDING_THREADS", "0"))
+EMBEDDING_BATCH_SIZE = int(os.environ.get("CHATBOT_EMBEDDING_BATCH_SIZE", "32"))
+MODEL_CACHE_DIR = os.environ.get("CHATBOT_EMBEDDING_CACHE_DIR", "models")
+
+BACKENDS = ("huggingface", "onnx")
+QUANTIZATIONS = ("avx2", "avx512", "avx512_vnni", "arm64")
+
+def embedding_id(model=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND, quantization=EMBEDDING_QUANTIZATION, onnx_file=EMBEDDING_ONNX_FILE):
+    """
+    Identity of the vectors a configuration produces, recorded in the index manifest: changing
+    it rebuilds the index. The default PyTorch backend is identified by the model name alone.
+    """
+    if backend != "onnx":
+        return model
+    variant = f"qint8-{quantization}" if quantization else onnx_file or "fp32"
+    return f"{model}@onnx:{variant}"
+
+def _quantized_model(model, quantization):
+    """Local copy of the model with its int8 ONNX export, created on first use: (path, ONNX file)."""
+    path = os.path.join(MODEL_CACHE_DIR, f"{model.replace('/', '--')}-onnx")
+    file_name = f"onnx/model_qint8_{quantization}.onnx"
+    if not os.path.exists(os.path.join(path, file_name)):
+        from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+        logging.info(f"Exporting {model} to ONNX with int8 quantization for {quantization} into {path}")
+        exported = SentenceTransformer(model, backend="onnx")
+        exported.save(path)
+        export_dynamic_quantized_onnx_model(exported, quantization, path)
+    return path, file_name
+
+def load_embeddings(model=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND, quantization=EMBEDDING_QUANTIZATION,
+                    onnx_file=EMBEDDING_ONNX_FILE, threads=EMBEDDING_THREADS, batch_size=EMBEDDING_BATCH_SIZE):
+    """Build the LangChain embeddings object of a configuration (loads the model)."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {BACKENDS}")
+    if quantization and (backend != "onnx" or quantization not in QUANTIZATIONS):
+        raise ValueError(f"Quantization {quantization!r} needs the onnx backend and one of {QUANTIZATIONS}")
+
+    identity = embedding_id(model, backend, quantization, onnx_file)
+    model_kwargs = {}
+    if backend == "onnx":
+        onnx_kwargs = {"provider": "CPUExecutionProvider"}
+        if quantization:
+            model, onnx_kwargs["file_name"] = _quantized_model(model, quantization)
+        elif onnx_file:
+            onnx_kwargs["file_name"] = onnx_file
+        if threads:
+            import onnxruntime
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = threads
+            onnx_kwargs["session_options"] = session_options
+        model_kwargs.update(backend="onnx", model_kwargs=onnx_kwargs)
+    elif threads:
+        import torch
+        torch.set_num_threads(threads)
+
+    logging.info(f"Loading embeddings {identity} (threads={threads or 'default'}, batch_size={batch_size})")
+    return HuggingFaceEmbeddings(model_name=model, model_kwargs=model_kwargs, encode_kwargs={"batch_size": batch_size})
@@ -0,0 +1,338 @@
+# app/k8s_cache.py
+"""
+Optional informer-style cache of the cluster state, one per kubeconfig context.
+Each (context, resource) pair is listed once then kept current by a watch that resumes from
+the last resourceVersion (re-listing when the server answers 410 Gone). Objects are kept as
+server-printed Table rows, so `kubectl get <resource>` lists can be rendered from memory with
+the same columns as the API would return. A list is only served while its watch is connected,
+or disconnected for less than the staleness bound; otherwise the caller asks the API server.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from kubernetes.client.exceptions import ApiException
+
+from clusters import cluster_manager
+from nlp_parser2 import K8S_RESOURCES
+
+WATCH_CACHE_ENABLED = os.environ.get("CHATBOT_WATCH_CACHE", "0") == "1"
+# Seconds a list may be served after its watch dropped, before falling back to the API server
+MAX_STALENESS = float(os.environ.get("CHATBOT_WATCH_CACHE_MAX_STALENESS", "30"))
+# Informers nobody read for this long are stopped and their objects dropped
+IDLE_TIMEOUT = float(os.environ.get("CHATBOT_WATCH_CACHE_IDLE_TIMEOUT", "1800"))
+# Comma-separated resources to cache; defaults to the ones the NLP parser recognizes
+WATCH_RESOURCES = os.environ.get("CHATBOT_WATCH_CACHE_RESOURCES", "")
+
+WATCH_TIMEOUT = 300
+# The API server sends a bookmark about once a minute: a silent connection is a dead one
+READ_TIMEOUT = 90
+LIST_PAGE_SIZE = 500
+MAX_BACKOFF = 300
+
+_REQUIREMENT = re.compile(r"(!?)([\w./-]+)\s*(?:(==|=|!=)\s*([\w.-]*)|\s+(in|notin)\s*\(([^)]*)\))?")
+
+def _label_filter(selector):
+    """Predicate on a labels dict for a -l selector, or None when the selector is not understood."""
+    requirements = []
+    for part in re.split(r",(?![^()]*\))", selector or ""):
+        part = part.strip()
+        if not part:
+            continue
+        match = _REQUIREMENT.fullmatch(part)
+        if match is None:
+            return None
+        negated, key, op, value, set_op, values = match.groups()
+        if negated and (op or set_op):
+            return None
+        if set_op:
+            requirements.append((key, set_op, {v.strip() for v in values.split(",")}))
+        elif op:
+            requirements.append((key, "!=" if op == "!=" else "=", value))
+        else:
+            requirements.append((key, "!" if negated else "exists", None))
+
+    def matches(labels):
+        for key, op, value in requirements:
+            present = key in labels
+            if op == "=" and labels.get(key) != value:
+                return False
+            if op == "!=" and present and labels[key] == value:
+                return False
+            if op == "in" and labels.get(key) not in value:
+                return False
+            if op == "notin" and present and labels[key] in value:
+                return False
+            if op == "exists" and not present:
+                return False
+            if op == "!" and present:
+                return False
+        return True
+    return matches
+
+def _metadata(row):
+    return (row.get("object") or {}).get("metadata") or {}
+
+def _row_key(row):
+    metadata = _metadata(row)
+    return (metadata.get("namespace", ""), metadata.get("name", ""))
+
+class Informer:
+    """List+watch loop keeping the Table rows of one resource of one context."""
+
+    def __init__(self, cluster, plural):
+        self.cluster = cluster
+        self.plural = plural
+        self.columns = []
+        self.rows = {}
+        self.sizes = {}
+        self.resource_version = None
+        self.connected = False
+        self.synced = False
+        self.disconnected_at = None
+        self.last_event_at = None
+        self.last_used = time.monotonic()
+        self.lists = 0
+        self.watches = 0
+        self.events = 0
+        self.error = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"watch-{cluster or 'current'}-{plural}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def staleness(self):
+        """0 while the watch is connected, seconds since it dropped otherwise (inf before the first sync)."""
+        with self._lock:
+            if not self.synced:
+                return float("inf")
+            if self.connected:
+                return 0.0
+            return time.monotonic() - self.disconnected_at
+
+    def snapshot(self):
+        with self._lock:
+            self.last_used = time.monotonic()
+            return list(self.columns), list(self.rows.values())
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "objects": len(self.rows),
+                "memory_bytes": sum(self.sizes.values()),
+                "resource_version": self.resource_version,
+                "connected": self.connected,
+                "watch_lag_seconds": None if not self.synced else 0.0 if self.connected else round(now - self.disconnected_at, 1),
+                "last_event_seconds_ago": round(now - self.last_event_at, 1) if self.last_event_at else None,
+                "lists": self.lists,
+                "watches": self.watches,
+                "events": self.events,
+                "error": self.error,
+            }
+
+    def _run(self):
+        # k8s_native imports this module, its helpers are resolved at run time
+        import k8s_native
+        path = k8s_native._resource_path(self.plural)
+        backoff = 1
+        while not self._stop.is_set():
+            if time.monotonic() - self.last_used > IDLE_TIMEOUT:
+                logging.info(f"Watch cache: stopping idle informer {self.cluster or 'current'}/{self.plural}")
+                watch_cache.drop(self)
+                return
+            try:
+                # The client is looked up each time so a kubeconfig change is picked up
+                api = cluster_manager.get_api_client(self.cluster)
+                if self.resource_version is None:
+                    self._list(k8s_native, api, path)
+                self._watch(k8s_native, api, path)
+                backoff = 1
+            except KeyError as e:
+                logging.warning(f"Watch cache: {e}, stopping informer for {self.plural}")
+                watch_cache.drop(self)
+                return
+            except Exception as e:
+                error = str(e)
+                if isinstance(e, ApiException):
+                    error = f"{e.status} {e.reason}"
+                    if e.status == 410:
+                        self.resource_version = None
+                self._disconnected(error)
+                logging.warning(f"Watch cache: {self.cluster or 'current'}/{self.plural} failed, retrying in {backoff}s: {error}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+
+    def _disconnected(self, error=None):
+        with self._lock:
+            if self.connected:
+                self.disconnected_at = time.monotonic()
+            self.connected = False
+            self.error = error
+
+    def _list(self, k8s_native, api, path):
+        """Full paginated list; the rows are swapped in at once."""
+        rows, columns, token = {}, [], None
+        while True:
+            query = [("includeObject", "Metadata"), ("limit", str(LIST_PAGE_SIZE))]
+            if token:
+                query.append(("continue", token))
+            table = k8s_native._get(api, path, query, accept=k8s_native.TABLE_ACCEPT)
+            columns = columns or table.get("columnDefinitions") or []
+            for row in table.get("rows") or []:
+                rows[_row_key(row)] = row
+            token = (table.get("metadata") or {}).get("continue")
+            if not token:
+                break
+        with self._lock:
+            self.columns = columns
+            self.rows = rows
+            self.sizes = {key: len(json.dumps(row)) for key, row in rows.items()}
+            self.resource_version = (table.get("metadata") or {}).get("resourceVersion")
+            self.lists += 1
+            self.error = None
+        logging.info(f"Watch cache: listed {len(rows)} {self.plural} on {self.cluster or 'current context'} at resourceVersion {self.resource_version}")
+
+    def _watch(self, k8s_native, api, path):
+        query = [
+            ("watch", "true"), ("includeObject", "Metadata"), ("allowWatchBookmarks", "true"),
+            ("resourceVersion", self.resource_version), ("timeoutSeconds", str(WATCH_TIMEOUT)),
+        ]
+        response = k8s_native._stream(api, path, query, accept=k8s_native.TABLE_ACCEPT, timeout=(10, READ_TIMEOUT))
+        with self._lock:
+            self.connected = True
+            self.synced = True
+            self.watches += 1
+        try:
+            buffer = b""
+            for chunk in response.stream(16 * 1024, decode_content=True):
+                if self._stop.is_set():
+                    return
+                buffer += chunk
+                while b"\n" in buffer:
+                    line, buffer = buffer.split(b"\n", 1)
+                    if line.strip() and not self._apply(json.loads(line)):
+                        return
+        finally:
+            response.release_conn()
+            self._disconnected()
+
+    def _apply(self, event):
+        """Apply one watch event; False when the watch must be restarted from a new list."""
+        kind, obj = event.get("type"), event.get("object") or {}
+        if kind == "ERROR":
+            if obj.get("code") == 410:
+                # resourceVersion too old: the events in between are gone, list again
+                logging.info(f"Watch cache: {self.plural} resourceVersion {self.resource_version} expired, re-listing")
+                with self._lock:
+                    self.resource_version = None
+                return False
+            raise ApiException(status=obj.get("code"), reason=obj.get("reason"), body=json.dumps(obj))
+        rows = obj.get("rows") if obj.get("kind") == "Table" else None
+        metadata = _metadata(rows[0]) if rows else obj.get("metadata") or {}
+        with self._lock:
+            self.last_event_at = time.monotonic()
+            self.resource_version = metadata.get("resourceVersion") or self.resource_version
+            if kind == "BOOKMARK" or not rows:
+                return True
+            self.events += 1
+            for row in rows:
+                key = _row_key(row)
+                if kind == "DELETED":
+                    self.rows.pop(key, None)
+                    self.sizes.pop(key, None)
+                else:
+                    self.rows[key] = row
+                    self.sizes[key] = len(json.dumps(row))
+        return True
+
+class WatchCache:
+    """Informers per (context, resource), started on the first list request that could use them."""
+
+    def __init__(self, enabled=WATCH_CACHE_ENABLED):
+        self.enabled = enabled
+        self._informers = {}
+        self._resources = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resources(self):
+        if self._resources is None:
+            import k8s_native
+            names = [name.strip() for name in WATCH_RESOURCES.split(",") if name.strip()] or K8S_RESOURCES
+            self._resources = {k8s_native.RESOURCE_ALIASES[name] for name in names if name in k8s_native.RESOURCE_ALIASES}
+        return self._resources
+
+    def _informer(self, cluster, plural):
+        with self._lock:
+            informer = self._informers.get((cluster, plural))
+            if informer is None:
+                informer = Informer(cluster, plural)
+                self._informers[(cluster, plural)] = informer
+                informer.start()
+            return informer
+
+    def drop(self, informer):
+        with self._lock:
+            if self._informers.get((informer.cluster, informer.plural)) is informer:
+                del self._informers[(informer.cluster, informer.plural)]
+        informer.stop()
+
+    def table(self, cluster, plural, namespace=None, selector=None, field_selector=None):
+        """
+        Table of the objects in `namespace` (all namespaces when None) matching the label
+        selector, like a Table LIST on the API server would return it. None when the list
+        cannot be answered from memory: cache disabled, resource not cached, field selector,
+        informer still syncing or watch down for longer than MAX_STALENESS.
+        """
+        if not self.enabled or plural not in self.resources() or field_selector:
+            return None
+        matches = _label_filter(selector)
+        if matches is None:
+            return None
+        informer = self._informer(cluster, plural)
+        if informer.staleness() > MAX_STALENESS:
+            self.misses += 1
+            return None
+        columns, rows = informer.snapshot()
+        rows = [
+            row for row in rows
+            if (namespace is None or _metadata(row).get("namespace") == namespace) and matches(_metadata(row).get("labels") or {})
+        ]
+        rows.sort(key=_row_key)
+        # Cells were printed when the event arrived: re-derive the age from the creation time
+        age = next((i for i, c in enumerate(columns) if c.get("name") == "Age" and c.get("type") == "date"), None)
+        if age is not None:
+            rows = [self._with_cell(row, age, _metadata(row).get("creationTimestamp")) for row in rows]
+        self.hits += 1
+        return {"columnDefinitions": columns, "rows": rows}
+
+    @staticmethod
+    def _with_cell(row, index, value):
+        cells = list(row.get("cells") or [])
+        if index < len(cells) and value:
+            cells[index] = value
+        return dict(row, cells=cells)
+
+    def stats(self):
+        with self._lock:
+            informers = dict(self._informers)
+        return {
+            "enabled": self.enabled,
+            "max_staleness": MAX_STALENESS,
+            "hits": self.hits,
+            "misses": self.misses,
+            "informers": {f"{cluster or 'current-context'}/{plural}": informer.stats() for (cluster, plural), informer in informers.items()},
+        }
+
+watch_cache = WatchCache()
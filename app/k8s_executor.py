@@ -3,13 +3,58 @@ import shlex
 import time
 import logging
 import os
+import queue
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
+from cache import TTLCache
 from clusters import cluster_manager
+from metrics import span, timed, bind_context
+from k8s_native import execute_native, execute_native_page, UnsupportedCommand, NativeCommandError, RESOURCES, RESOURCE_ALIASES
 
-def execute_command(command, cluster=None):
-    """Execute a kubectl command using absolute paths."""
-    logging.info(f"Preparing to execute command: '{command}' on cluster '{cluster or 'default'}'")
+# `kubectl get` is served in-process through the Kubernetes API when possible
+NATIVE_EXECUTION = os.environ.get("CHATBOT_NATIVE_EXECUTOR", "1") == "1"
+# Objects per chunk when a list is read with the API's limit/continue
+LIST_PAGE_SIZE = int(os.environ.get("CHATBOT_LIST_PAGE_SIZE", "500"))
+
+# Caps of the streaming execution mode; commands that follow or watch get a longer time cap
+STREAM_BYTE_LIMIT = int(os.environ.get("CHATBOT_STREAM_BYTE_LIMIT", str(1024 * 1024)))
+STREAM_TIME_LIMIT = float(os.environ.get("CHATBOT_STREAM_TIME_LIMIT", "60"))
+STREAM_FOLLOW_TIME_LIMIT = float(os.environ.get("CHATBOT_STREAM_FOLLOW_TIME_LIMIT", "600"))
+# Longest wait for a line before giving the caller control back (client still there?)
+STREAM_IDLE_TICK = 1.0
+
+# kubectl run time cap when the caller sets none
+KUBECTL_TIMEOUT = 20
+# Fan-out of a read-only command over several contexts
+FANOUT_WORKERS = int(os.environ.get("CHATBOT_FANOUT_WORKERS", "8"))
+FANOUT_CLUSTER_TIMEOUT = float(os.environ.get("CHATBOT_FANOUT_CLUSTER_TIMEOUT", "10"))
+READ_ONLY_VERBS = {"get", "describe", "logs", "top", "explain", "events", "api-resources", "api-versions", "version", "cluster-info"}
+_fanout_pool = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="fanout")
+
+# Short-lived results of read-only commands, per context and namespace (0 disables)
+RESULT_CACHE_TTL = float(os.environ.get("CHATBOT_RESULT_CACHE_TTL", "10"))
+result_cache = TTLCache(maxsize=int(os.environ.get("CHATBOT_RESULT_CACHE_SIZE", "256")), ttl=RESULT_CACHE_TTL)
+CACHEABLE_VERBS = {"get", "describe", "top", "explain", "api-resources"}
+MUTATING_VERBS = {"delete", "apply", "scale", "create", "patch", "edit", "replace", "label", "annotate", "set",
+                  "rollout", "expose", "autoscale", "run", "cordon", "uncordon", "drain", "taint"}
+# Verbs acting on nodes: everything on the context may change
+NODE_VERBS = {"cordon", "uncordon", "drain", "taint"}
+# Flag spellings normalized in cache keys; the listed long names take a value
+_FLAG_NAMES = {"-n": "--namespace", "-A": "--all-namespaces", "-o": "--output", "-l": "--selector",
+               "-c": "--container", "-f": "--filename", "-L": "--label-columns", "-w": "--watch"}
+_VALUE_FLAGS = {"--namespace", "--output", "--selector", "--container", "--filename", "--label-columns",
+                "--field-selector", "--sort-by", "--replicas", "--tail", "--since", "--type", "--image"}
 
+def _format_output(stdout):
+    # If there is no output, provide a friendlier message.
+    if stdout.strip():
+        return stdout.strip()
+    return "Command executed successfully. No resources found or no output was produced."
+
+def _prepare(command, cluster):
+    """Validate the configuration and the command; returns (error message, kubectl argv, environment)."""
     # --- Read absolute paths from environment INSIDE the function for robustness ---
     KUBECTL_EXEC_PATH = os.environ.get("CHATBOT_KUBECTL_PATH")
     KUBE_CONFIG_FROM_ENV = os.environ.get("CHATBOT_KUBECONFIG_PATH")
@@ -17,46 +62,186 @@ def execute_command(command, cluster=None):
     # --- Validate the paths inherited from the startup script ---
     if not KUBECTL_EXEC_PATH:
         logging.error("FATAL CONFIGURATION ERROR: CHATBOT_KUBECTL_PATH env var not set.")
-        return "FATAL CONFIGURATION ERROR: The absolute path to kubectl was not provided."
+        return "FATAL CONFIGURATION ERROR: The absolute path to kubectl was not provided.", None, None
     if not KUBE_CONFIG_FROM_ENV:
         logging.error("FATAL CONFIGURATION ERROR: CHATBOT_KUBECONFIG_PATH env var not set.")
-        return "FATAL CONFIGURATION ERROR: The absolute path to kubeconfig was not provided."
+        return "FATAL CONFIGURATION ERROR: The absolute path to kubeconfig was not provided.", None, None
 
     proc_env = os.environ.copy()
     proc_env["KUBECONFIG"] = KUBE_CONFIG_FROM_ENV
 
     if cluster:
-        if not cluster_manager.set_cluster(cluster):
-            return f"Error: Invalid cluster specified: {cluster}"
+        if not cluster_manager.has_cluster(cluster):
+            return f"Error: Invalid cluster specified: {cluster}", None, None
 
     if not command.startswith("kubectl "):
-        return "Error: Only kubectl commands are allowed."
+        return "Error: Only kubectl commands are allowed.", None, None
+
+    # Replace 'kubectl' with the absolute path
+    cmd_parts = shlex.split(command)
+    cmd_parts[0] = KUBECTL_EXEC_PATH
+    # The context is passed explicitly: no process-wide "current cluster" is switched
+    if cluster:
+        cmd_parts[1:1] = ["--context", cluster]
+    return None, cmd_parts, proc_env
+
+@timed("kubectl_native")
+def _run_native(command, cluster, timeout=None):
+    """In-process execution; returns (stdout, error message), or None when kubectl must run it."""
+    try:
+        start = time.monotonic()
+        output = execute_native(command, cluster=cluster, timeout=timeout)
+        logging.info(f"Executed '{command}' in-process in {(time.monotonic() - start) * 1000:.0f} ms")
+        return output, None
+    except UnsupportedCommand as e:
+        logging.info(f"Not executable in-process ({e}), falling back to kubectl: '{command}'")
+    except NativeCommandError as e:
+        logging.error(f"kubectl command failed (in-process). Error: {e}")
+        return None, f"Error from server: {e}"
+    except Exception as e:
+        logging.error(f"In-process execution of '{command}' failed, falling back to kubectl: {e}")
+    return None
+
+def _command_scope(command, cluster):
+    """
+    (verb, namespace, normalized arguments) of a command: flags in their long spelling and
+    sorted, resource aliases resolved. The namespace is "*" for --all-namespaces, "" for a
+    cluster-scoped resource, otherwise -n or the context's default; None when the command
+    reads manifests (-f) and its namespace cannot be known.
+    """
+    parts = shlex.split(command)[1:]
+    verb = parts[0] if parts else ""
+    positional, flags, i = [], {}, 1
+    while i < len(parts):
+        token = parts[i]
+        i += 1
+        if not token.startswith("-") or token == "-":
+            positional.append(token)
+            continue
+        name, value = token, None
+        if "=" in token:
+            name, value = token.split("=", 1)
+        elif not token.startswith("--") and len(token) > 2:
+            name, value = token[:2], token[2:]
+        name = _FLAG_NAMES.get(name, name)
+        if verb == "logs" and token == "-f":
+            name = "--follow"
+        elif value is None and name in _VALUE_FLAGS and i < len(parts):
+            value, i = parts[i], i + 1
+        flags[name] = value
+
+    # "rollout restart deployment/x", "set image deployment/x ...": the resource comes after the sub-verb
+    if verb in ("rollout", "set", "auth") and positional:
+        verb = f"{verb} {positional.pop(0)}"
+    resource = None
+    if positional:
+        kind, _, name = positional[0].partition("/")
+        resource = RESOURCE_ALIASES.get(kind.lower(), kind.lower())
+        positional[0] = f"{resource}/{name}" if name else resource
+
+    if "--filename" in flags:
+        namespace = None
+    elif "--all-namespaces" in flags:
+        namespace = "*"
+    elif resource in RESOURCES and not RESOURCES[resource][2]:
+        namespace = ""
+    else:
+        namespace = flags.pop("--namespace", None) or cluster_manager.get_default_namespace(cluster)
+    flags.pop("--namespace", None)
+    arguments = (verb,) + tuple(positional) + tuple(sorted(f"{k}={v}" if v is not None else k for k, v in flags.items()))
+    return verb, namespace, arguments
 
+def _result_cache_key(command, cluster):
+    """Cache key of a cacheable read-only command, None for the others."""
+    if RESULT_CACHE_TTL <= 0 or not is_read_only(command):
+        return None
     try:
-        # Replace 'kubectl' with the absolute path
-        cmd_parts = shlex.split(command)
-        cmd_parts[0] = KUBECTL_EXEC_PATH
+        verb, namespace, arguments = _command_scope(command, cluster)
+    except ValueError:
+        return None
+    if verb not in CACHEABLE_VERBS or namespace is None:
+        return None
+    return (cluster or "", namespace, arguments)
 
+def _invalidate_results(command, cluster):
+    """After a mutating command, drop the cached results it may have made stale on its context."""
+    try:
+        verb, namespace, _ = _command_scope(command, cluster)
+    except ValueError:
+        verb, namespace = None, None
+    if verb is None or verb.split(" ")[0] not in MUTATING_VERBS or verb in ("rollout status", "rollout history"):
+        return
+    context = cluster or ""
+    if namespace in (None, "", "*") or verb in NODE_VERBS:
+        # Manifests, cluster-scoped objects or nodes: anything on the context may have changed
+        removed = result_cache.invalidate(lambda key: key[0] == context)
+    else:
+        removed = result_cache.invalidate(lambda key: key[0] == context and key[1] in (namespace, "*", ""))
+    if removed:
+        logging.info(f"'{command}' invalidated {removed} cached results on '{cluster or 'default'}'")
+
+def _cached_result(key, command, cluster):
+    output = result_cache.get(key) if key else None
+    if output is not None:
+        logging.info(f"Served '{command}' on '{cluster or 'default'}' from the result cache")
+    return output
+
+def execute_command(command, cluster=None, timeout=None):
+    """
+    Execute a kubectl command using absolute paths; read-only results are cached for RESULT_CACHE_TTL seconds.
+    `timeout` bounds the execution (API calls in-process, else the kubectl process); KUBECTL_TIMEOUT by default.
+    """
+    logging.info(f"Preparing to execute command: '{command}' on cluster '{cluster or 'default'}'")
+
+    error, cmd_parts, proc_env = _prepare(command, cluster)
+    if error:
+        return error
+
+    key = _result_cache_key(command, cluster)
+    cached = _cached_result(key, command, cluster)
+    if cached is not None:
+        return cached
+    return _execute(command, cluster, cmd_parts, proc_env, key, timeout)
+
+def _execute(command, cluster, cmd_parts, proc_env, key, timeout=None):
+    """Uncached execution: in-process when possible, else kubectl. Stores the result under `key`."""
+    try:
+        output = _run(command, cluster, cmd_parts, proc_env, timeout)
+    finally:
+        _invalidate_results(command, cluster)
+    if key and not _failed(output):
+        result_cache.set(key, output)
+    return output
+
+def _run(command, cluster, cmd_parts, proc_env, timeout=None):
+    deadline = time.monotonic() + (timeout or KUBECTL_TIMEOUT)
+    if NATIVE_EXECUTION:
+        native = _run_native(command, cluster, timeout)
+        if native is not None:
+            output, error = native
+            return error or _format_output(output)
+
+    try:
         logging.info(f"Running subprocess with command: {cmd_parts}")
-        result = subprocess.run(
-            cmd_parts,
-            env=proc_env,
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=20
-        )
-        # --- START OF UX IMPROVEMENT ---
-        # If there is no output, provide a friendlier message.
-        if result.stdout.strip():
-            return result.stdout.strip()
-        else:
-            return "Command executed successfully. No resources found or no output was produced."
-        # --- END OF UX IMPROVEMENT ---
+        with span("kubectl_subprocess"):
+            result = subprocess.run(
+                cmd_parts,
+                env=proc_env,
+                capture_output=True,
+                text=True,
+                check=True,
+                # What the in-process attempt left of the time budget
+                timeout=max(deadline - time.monotonic(), 0.1)
+            )
+        return _format_output(result.stdout)
+
+    except subprocess.TimeoutExpired as e:
+        logging.error(f"kubectl command timed out after {e.timeout:.1f}s: {cmd_parts}")
+        return f"Error: kubectl did not answer within {timeout or KUBECTL_TIMEOUT:g}s."
 
     except FileNotFoundError:
-        logging.error(f"FATAL: The system could not find the kubectl executable at '{KUBECTL_EXEC_PATH}'")
-        return f"Error: The system could not find the kubectl executable. Path: {KUBECTL_EXEC_PATH}"
+        logging.error(f"FATAL: The system could not find the kubectl executable at '{cmd_parts[0]}'")
+        return f"Error: The system could not find the kubectl executable. Path: {cmd_parts[0]}"
     except subprocess.CalledProcessError as e:
         # Return the stripped standard error for a cleaner UI display
         error_output = e.stderr.strip()
@@ -65,3 +250,249 @@ def execute_command(command, cluster=None):
     except Exception as e:
         logging.error(f"An unexpected error occurred: {str(e)}")
         return f"An unexpected error occurred: {str(e)}"
+
+@timed("kubectl_native")
+def _run_native_page(command, cluster, continue_token):
+    """One chunk of an in-process list; returns (stdout, next token, error message), or None when it cannot be chunked."""
+    try:
+        output, next_token = execute_native_page(command, cluster=cluster, limit=LIST_PAGE_SIZE, continue_token=continue_token)
+        return output, next_token, None
+    except UnsupportedCommand as e:
+        logging.info(f"Not listable in chunks ({e}): '{command}'")
+    except NativeCommandError as e:
+        logging.error(f"kubectl command failed (in-process, chunked). Error: {e}")
+        return None, None, f"Error from server: {e}"
+    except Exception as e:
+        logging.error(f"Chunked in-process execution of '{command}' failed: {e}")
+    return None
+
+def execute_command_page(command, cluster=None, continue_token=None):
+    """
+    Execute a command, reading lists in chunks of LIST_PAGE_SIZE objects when they are served
+    in-process: returns (output, continue token of the next chunk or None). Commands that
+    cannot be chunked run whole through execute_command.
+    """
+    error, cmd_parts, proc_env = _prepare(command, cluster)
+    if error:
+        return error, None
+
+    # Only a list that fits in one chunk is cached: a cursor cannot resume from the cache
+    key = None if continue_token else _result_cache_key(command, cluster)
+    cached = _cached_result(key, command, cluster)
+    if cached is not None:
+        return cached, None
+
+    if NATIVE_EXECUTION:
+        page = _run_native_page(command, cluster, continue_token)
+        if page is not None:
+            output, next_token, error = page
+            if error:
+                return error, None
+            if continue_token:
+                return output.strip(), next_token
+            output = _format_output(output)
+            if key and next_token is None:
+                result_cache.set(key, output)
+            return output, next_token
+    if continue_token:
+        return "Error: This list can no longer be continued, run the command again.", None
+    return _execute(command, cluster, cmd_parts, proc_env, key), None
+
+def _is_long_running(command):
+    """Commands that keep running until stopped or until the rollout ends."""
+    parts = shlex.split(command)
+    verb = parts[1] if len(parts) > 1 else ""
+    follows = any(p in ("-f", "--follow", "--follow=true") for p in parts) if verb == "logs" else False
+    watches = any(p in ("-w", "--watch", "--watch=true") for p in parts)
+    return follows or watches or (verb == "rollout" and "status" in parts)
+
+def _pump(stream, lines):
+    """Reader thread: forwards the process output line by line, then None at end of file."""
+    try:
+        for line in stream:
+            lines.put(line)
+    finally:
+        lines.put(None)
+
+def _stop_process(proc):
+    """
+    Reap a process that is exiting on its own, otherwise terminate it (and kill it if it lingers).
+    Signals go to its whole process group, so helpers it started (auth plugins) stop with it.
+    """
+    try:
+        proc.wait(timeout=0.5)
+        return
+    except subprocess.TimeoutExpired:
+        pass
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            pass
+        try:
+            proc.wait(timeout=3)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+def execute_command_stream(command, cluster=None):
+    """
+    Execute a kubectl command and yield its output while it is produced: {"line": ...} for
+    each line (stderr included), None when no line came for STREAM_IDLE_TICK seconds, then
+    {"done": True, "exit_code": ..., "truncated": reason or None}. The process is stopped
+    once it wrote STREAM_BYTE_LIMIT bytes or ran for its time cap, and as soon as the
+    generator is closed (client gone).
+    """
+    logging.info(f"Preparing to stream command: '{command}' on cluster '{cluster or 'default'}'")
+
+    error, cmd_parts, proc_env = _prepare(command, cluster)
+    if error:
+        yield {"line": error}
+        yield {"done": True, "exit_code": 1, "truncated": None}
+        return
+
+    key = _result_cache_key(command, cluster)
+    cached = _cached_result(key, command, cluster)
+    if cached is not None:
+        for line in cached.splitlines():
+            yield {"line": line}
+        yield {"done": True, "exit_code": 0, "truncated": None}
+        return
+
+    long_running = _is_long_running(command)
+    if NATIVE_EXECUTION and not long_running:
+        # Lists are read chunk by chunk: the first rows go out before the rest is fetched
+        page = _run_native_page(command, cluster, None)
+        if page is None:
+            native = _run_native(command, cluster)
+            page = None if native is None else (native[0], None, native[1])
+        if page is not None:
+            produced, truncated, pages = 0, None, 0
+            while True:
+                output, next_token, error = page
+                text = error or (_format_output(output) if pages == 0 else output.strip())
+                pages += 1
+                for line in text.splitlines():
+                    produced += len(line.encode("utf-8")) + 1
+                    if produced > STREAM_BYTE_LIMIT:
+                        truncated = f"output limit of {STREAM_BYTE_LIMIT} bytes reached"
+                        break
+                    yield {"line": line}
+                if truncated or error or not next_token:
+                    break
+                page = _run_native_page(command, cluster, next_token) or (None, None, "Error: the list could not be continued.")
+            if key and pages == 1 and not (truncated or error):
+                result_cache.set(key, text)
+            yield {"done": True, "exit_code": 1 if error else 0, "truncated": truncated}
+            return
+
+    time_limit = STREAM_FOLLOW_TIME_LIMIT if long_running else STREAM_TIME_LIMIT
+    try:
+        logging.info(f"Streaming subprocess with command: {cmd_parts}")
+        proc = subprocess.Popen(cmd_parts, env=proc_env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, errors="replace", bufsize=1, start_new_session=True)
+    except FileNotFoundError:
+        logging.error(f"FATAL: The system could not find the kubectl executable at '{cmd_parts[0]}'")
+        yield {"line": f"Error: The system could not find the kubectl executable. Path: {cmd_parts[0]}"}
+        yield {"done": True, "exit_code": 1, "truncated": None}
+        return
+
+    lines = queue.Queue()
+    threading.Thread(target=_pump, args=(proc.stdout, lines), daemon=True).start()
+    deadline = time.monotonic() + time_limit
+    produced, truncated, output = 0, None, []
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                truncated = f"time limit of {time_limit:.0f}s reached"
+                break
+            try:
+                line = lines.get(timeout=min(STREAM_IDLE_TICK, remaining))
+            except queue.Empty:
+                yield None
+                continue
+            if line is None:
+                break
+            produced += len(line.encode("utf-8"))
+            if produced > STREAM_BYTE_LIMIT:
+                truncated = f"output limit of {STREAM_BYTE_LIMIT} bytes reached"
+                break
+            if key:
+                output.append(line)
+            yield {"line": line.rstrip("\n")}
+    finally:
+        # Also runs when the caller closes the generator: the process never outlives the stream
+        _stop_process(proc)
+        _invalidate_results(command, cluster)
+        if truncated or proc.returncode:
+            logging.info(f"Stream of '{command}' ended: exit code {proc.returncode}, {truncated or 'complete'}")
+    if key and proc.returncode == 0 and not truncated:
+        result_cache.set(key, _format_output("".join(output)))
+    yield {"done": True, "exit_code": proc.returncode, "truncated": truncated}
+
+def is_read_only(command):
+    """True for the commands that only read the cluster and end on their own (no -f/-w)."""
+    try:
+        parts = shlex.split(command)
+    except ValueError:
+        return False
+    if len(parts) < 2 or parts[0] != "kubectl" or _is_long_running(command):
+        return False
+    verb = parts[1]
+    if verb == "auth":
+        return parts[2:3] == ["can-i"]
+    if verb == "rollout":
+        return parts[2:3] == ["history"]
+    return verb in READ_ONLY_VERBS
+
+def _failed(output):
+    return output.startswith(("Error", "FATAL", "An unexpected error"))
+
+def execute_command_fanout(command, clusters, timeout=FANOUT_CLUSTER_TIMEOUT):
+    """
+    Run a read-only command on several contexts at once through a bounded worker pool and
+    yield {"cluster", "status" (ok, error or timeout), "output", "elapsed_ms"} for each one
+    as it finishes. A cluster's timeout counts from when a worker picks it up and also bounds
+    its execution, so the worker of a cluster reported as timed out is freed at the same time
+    instead of holding a pool slot until kubectl's own timeout. Closing the generator cancels
+    the clusters not started yet.
+    """
+    if not is_read_only(command):
+        yield {"cluster": None, "status": "error", "output": "Error: Only read-only commands can run on several clusters.", "elapsed_ms": 0}
+        return
+    logging.info(f"Fanning out '{command}' to {len(clusters)} clusters: {clusters}")
+
+    started = {}
+    def run(cluster):
+        started[cluster] = time.monotonic()
+        return execute_command(command, cluster=cluster, timeout=timeout)
+
+    futures = {_fanout_pool.submit(bind_context(run), cluster): cluster for cluster in clusters}
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future in done:
+                cluster = futures[future]
+                try:
+                    output = future.result()
+                except Exception as e:
+                    output = f"An unexpected error occurred: {e}"
+                elapsed = (now - started.get(cluster, now)) * 1000
+                status = "ok"
+                if _failed(output):
+                    # The worker may hit its deadline just before this loop notices it
+                    status = "timeout" if elapsed >= timeout * 1000 else "error"
+                yield {"cluster": cluster, "status": status, "output": output, "elapsed_ms": round(elapsed)}
+            for future in list(pending):
+                cluster = futures[future]
+                if cluster in started and now - started[cluster] > timeout:
+                    pending.discard(future)
+                    logging.warning(f"Fan-out of '{command}' timed out on cluster '{cluster}' after {timeout:.0f}s")
+                    yield {"cluster": cluster, "status": "timeout", "output": f"Error: No answer from cluster '{cluster}' within {timeout:.0f}s.",
+                           "elapsed_ms": round((now - started[cluster]) * 1000)}
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,381 @@
+# app/k8s_native.py
+"""
+In-process execution of `kubectl get` through the Kubernetes API. The columns come from
+the API server's own table printing (as=Table), so only their alignment is done here.
+Other verbs (describe, logs, top...), and flags that are not handled here, raise
+UnsupportedCommand so the caller runs kubectl instead.
+"""
+
+import contextvars
+import json
+import logging
+import re
+import shlex
+import time
+from datetime import datetime, timezone
+
+import urllib3
+from kubernetes.client.exceptions import ApiException
+
+from clusters import cluster_manager
+from k8s_cache import watch_cache
+
+REQUEST_TIMEOUT = 20
+# Deadline (time.monotonic()) of the command being executed, when its caller bounds it
+_deadline = contextvars.ContextVar("native_deadline", default=None)
+# Server-side printing: the API server renders the same columns as `kubectl get`
+TABLE_ACCEPT = "application/json;as=Table;v=1;g=meta.k8s.io,application/json"
+
+class UnsupportedCommand(Exception):
+    """The command, or one of its flags, is not handled natively: run it with kubectl."""
+
+class NativeCommandError(Exception):
+    """The API call failed; the message is what kubectl would print on stderr."""
+
+# plural -> (group, version, namespaced, aliases)
+RESOURCES = {
+    "pods": ("", "v1", True, ("pod", "po")),
+    "services": ("", "v1", True, ("service", "svc")),
+    "configmaps": ("", "v1", True, ("configmap", "cm")),
+    "secrets": ("", "v1", True, ("secret",)),
+    "serviceaccounts": ("", "v1", True, ("serviceaccount", "sa")),
+    "endpoints": ("", "v1", True, ("ep",)),
+    "events": ("", "v1", True, ("event", "ev")),
+    "persistentvolumeclaims": ("", "v1", True, ("persistentvolumeclaim", "pvc")),
+    "persistentvolumes": ("", "v1", False, ("persistentvolume", "pv")),
+    "nodes": ("", "v1", False, ("node", "no")),
+    "namespaces": ("", "v1", False, ("namespace", "ns")),
+    "deployments": ("apps", "v1", True, ("deployment", "deploy")),
+    "statefulsets": ("apps", "v1", True, ("statefulset", "sts")),
+    "daemonsets": ("apps", "v1", True, ("daemonset", "ds")),
+    "replicasets": ("apps", "v1", True, ("replicaset", "rs")),
+    "jobs": ("batch", "v1", True, ("job",)),
+    "cronjobs": ("batch", "v1", True, ("cronjob", "cj")),
+    "ingresses": ("networking.k8s.io", "v1", True, ("ingress", "ing")),
+    "storageclasses": ("storage.k8s.io", "v1", False, ("storageclass", "sc")),
+    "horizontalpodautoscalers": ("autoscaling", "v2", True, ("horizontalpodautoscaler", "hpa")),
+}
+RESOURCE_ALIASES = {}
+for _plural, (_group, _version, _namespaced, _aliases) in RESOURCES.items():
+    for _alias in (_plural,) + _aliases:
+        RESOURCE_ALIASES[_alias] = _plural
+        if _group:
+            RESOURCE_ALIASES[f"{_alias}.{_group}"] = _plural
+
+# flag spelling -> (canonical name, takes a value)
+FLAGS = {
+    "-n": ("namespace", True), "--namespace": ("namespace", True),
+    "-A": ("all-namespaces", False), "--all-namespaces": ("all-namespaces", False),
+    "-o": ("output", True), "--output": ("output", True),
+    "-l": ("selector", True), "--selector": ("selector", True),
+    "--field-selector": ("field-selector", True),
+    "--no-headers": ("no-headers", False),
+    "--sort-by": ("sort-by", True),
+}
+VERB_FLAGS = {
+    "get": {"namespace", "all-namespaces", "output", "selector", "field-selector", "no-headers", "sort-by"},
+}
+
+def _api_client(cluster):
+    """Shared API client and default namespace of a kubeconfig context (None = current context)."""
+    try:
+        return cluster_manager.get_api_client(cluster), cluster_manager.get_default_namespace(cluster)
+    except Exception as e:
+        raise UnsupportedCommand(f"no API client for context '{cluster}': {e}")
+
+def _request_timeout(timeout=REQUEST_TIMEOUT):
+    """Timeout of the next API call: what is left of the command's deadline, if it has one."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise NativeCommandError("Unable to connect to the server: request timed out")
+    if isinstance(timeout, tuple):
+        return tuple(min(t, remaining) for t in timeout)
+    return min(timeout, remaining)
+
+def _request(api, path, query, accept, timeout):
+    """Sends a GET through the client's param_serialize/call_api and returns its RESTResponse."""
+    request = api.param_serialize("GET", path, query_params=query or [], header_params={"Accept": accept},
+                                  auth_settings=["BearerToken"])
+    return api.call_api(*request, _request_timeout=_request_timeout(timeout))
+
+def _get(api, path, query=None, accept="application/json"):
+    """GET on the API server, returning the decoded JSON body."""
+    response = _request(api, path, query, accept, REQUEST_TIMEOUT)
+    response.read()
+    if not 200 <= response.status <= 299:
+        raise ApiException.from_response(http_resp=response, body=None, data=None)
+    return json.loads(response.data)
+
+def _stream(api, path, query=None, accept="application/json", timeout=REQUEST_TIMEOUT):
+    """GET on the API server, returning the unread urllib3 response (watches)."""
+    response = _request(api, path, query, accept, timeout).response
+    if not 200 <= response.status <= 299:
+        raise ApiException(http_resp=response)
+    return response
+
+def _api_error(e):
+    """kubectl's rendering of a failed API call, e.g. 'Error from server (NotFound): pods "x" not found'."""
+    try:
+        status = json.loads(e.body)
+        message, reason = status.get("message", ""), status.get("reason", "")
+    except (TypeError, ValueError):
+        message, reason = (e.body or e.reason or "").strip(), ""
+    return f"Error from server ({reason}): {message}" if reason else f"Error from server: {message}"
+
+def _parse(tokens):
+    """Split kubectl arguments into positional arguments and recognized flags."""
+    if not tokens:
+        raise UnsupportedCommand("no verb")
+    verb, args, flags = tokens[0], [], {}
+    allowed = VERB_FLAGS.get(verb)
+    if allowed is None:
+        raise UnsupportedCommand(f"verb '{verb}'")
+    i = 1
+    while i < len(tokens):
+        token = tokens[i]
+        i += 1
+        if not token.startswith("-") or token == "-":
+            args.append(token)
+            continue
+        spelling, value = token, None
+        if token.startswith("--") and "=" in token:
+            spelling, value = token.split("=", 1)
+        elif not token.startswith("--") and len(token) > 2:
+            # Shorthand with an attached value: -nkube-system, -n=kube-system, -owide
+            spelling, value = token[:2], token[2:].removeprefix("=")
+        if spelling not in FLAGS:
+            raise UnsupportedCommand(f"flag '{spelling}'")
+        name, takes_value = FLAGS[spelling]
+        if name not in allowed:
+            raise UnsupportedCommand(f"flag '{spelling}' for {verb}")
+        if takes_value and value is None:
+            if i >= len(tokens):
+                raise UnsupportedCommand(f"missing value for '{spelling}'")
+            value, i = tokens[i], i + 1
+        elif not takes_value:
+            if value not in (None, "true", "false"):
+                raise UnsupportedCommand(f"value for '{spelling}'")
+            value = value != "false"
+        flags[name] = value
+    return verb, args, flags
+
+def _resource_and_name(args, allow_name=True):
+    """'pods', 'pods nginx' and 'pod/nginx' forms; lists of types or names are left to kubectl."""
+    if not args or len(args) > 2 or "," in args[0]:
+        raise UnsupportedCommand("resource arguments")
+    kind, name = args[0], args[1] if len(args) == 2 else None
+    if "/" in kind:
+        if name is not None:
+            raise UnsupportedCommand("resource arguments")
+        kind, name = kind.split("/", 1)
+    plural = RESOURCE_ALIASES.get(kind.lower())
+    if plural is None:
+        raise UnsupportedCommand(f"resource '{kind}'")
+    if name is not None and not allow_name:
+        raise UnsupportedCommand("named resource")
+    return plural, name
+
+def _resource_path(plural, namespace=None, name=None):
+    group, version, namespaced, _ = RESOURCES[plural]
+    path = f"/api/{version}" if not group else f"/apis/{group}/{version}"
+    if namespaced and namespace:
+        path += f"/namespaces/{namespace}"
+    path += f"/{plural}"
+    return path + f"/{name}" if name else path
+
+def _tabwrite(lines, padding=3):
+    """
+    Aligns tab-separated cells like Go's text/tabwriter (as used by kubectl): a column is
+    aligned over each block of consecutive lines that have a tab-terminated cell in it.
+    """
+    rows = [line.split("\t") for line in lines]
+    out = []
+
+    def write(start, end, widths):
+        for row in rows[start:end]:
+            out.append("".join(cell.ljust(widths[j]) if j < len(widths) else cell for j, cell in enumerate(row)))
+
+    def format_block(line0, line1, widths):
+        column = len(widths)
+        this = line0
+        while this < line1:
+            if column >= len(rows[this]) - 1:
+                this += 1
+                continue
+            write(line0, this, widths)
+            line0 = this
+            width = 0
+            while this < line1 and column < len(rows[this]) - 1:
+                width = max(width, len(rows[this][column]) + padding)
+                this += 1
+            format_block(line0, this, widths + [width])
+            line0 = this
+        write(line0, line1, widths)
+
+    format_block(0, len(rows), [])
+    return "\n".join(out)
+
+def _human_duration(seconds):
+    """Same rounding as kubectl's AGE column (apimachinery's HumanDuration)."""
+    if seconds < -1:
+        return "<invalid>"
+    if seconds < 0:
+        return "0s"
+    seconds = int(seconds)
+    if seconds < 60 * 2:
+        return f"{seconds}s"
+    minutes = seconds // 60
+    if minutes < 10:
+        return f"{minutes}m" if seconds % 60 == 0 else f"{minutes}m{seconds % 60}s"
+    if minutes < 60 * 3:
+        return f"{minutes}m"
+    hours = minutes // 60
+    if hours < 8:
+        return f"{hours}h" if minutes % 60 == 0 else f"{hours}h{minutes % 60}m"
+    if hours < 48:
+        return f"{hours}h"
+    if hours < 24 * 8:
+        return f"{hours // 24}d" if hours % 24 == 0 else f"{hours // 24}d{hours % 24}h"
+    if hours < 24 * 365 * 2:
+        return f"{hours // 24}d"
+    if hours < 24 * 365 * 8:
+        days = (hours // 24) % 365
+        return f"{hours // 24 // 365}y" if days == 0 else f"{hours // 24 // 365}y{days}d"
+    return f"{hours // 24 // 365}y"
+
+def _parse_time(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00")) if value else None
+
+def _age(value):
+    timestamp = _parse_time(value)
+    if timestamp is None:
+        return "<unknown>"
+    return _human_duration((datetime.now(timezone.utc) - timestamp).total_seconds())
+
+def _cell(value, column):
+    if value is None:
+        return "<none>"
+    if column.get("type") == "date" or column.get("format") == "date":
+        # Built-in resources come with the age already rendered, custom resources with a timestamp
+        try:
+            return _age(value)
+        except (TypeError, ValueError):
+            return str(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, list):
+        return "[" + " ".join(str(v) for v in value) + "]"
+    return str(value)
+
+# --- get ---------------------------------------------------------------------
+
+def _get_options(args, flags, default_namespace):
+    """Resource, name, namespace (None = all or cluster-scoped) and Table query of a get."""
+    plural, name = _resource_and_name(args)
+    _, _, namespaced, _ = RESOURCES[plural]
+    output = flags.get("output")
+    if output not in (None, "wide", "name"):
+        raise UnsupportedCommand(f"output '{output}'")
+    sort_by = flags.get("sort-by")
+    if sort_by and not re.fullmatch(r"\{?\.metadata\.(name|namespace|creationTimestamp)\}?", sort_by):
+        raise UnsupportedCommand(f"sort-by '{sort_by}'")
+
+    all_namespaces = bool(flags.get("all-namespaces") and namespaced and name is None)
+    namespace = None if all_namespaces or not namespaced else flags.get("namespace") or default_namespace
+    query = [("includeObject", "Metadata")]
+    if flags.get("selector"):
+        query.append(("labelSelector", flags["selector"]))
+    if flags.get("field-selector"):
+        query.append(("fieldSelector", flags["field-selector"]))
+    return plural, name, namespace, all_namespaces, query
+
+def _render_get(table, plural, flags, all_namespaces, headers=True):
+    group, _, _, aliases = RESOURCES[plural]
+    output = flags.get("output")
+    rows = table.get("rows") or []
+    sort_by = flags.get("sort-by")
+    if sort_by:
+        field = sort_by.strip("{}").rsplit(".", 1)[1]
+        rows = sorted(rows, key=lambda row: (row.get("object") or {}).get("metadata", {}).get(field) or "")
+    if not rows:
+        return ""
+    if output == "name":
+        kind = aliases[0] + (f".{group}" if group else "")
+        return "\n".join(f"{kind}/{row['object']['metadata']['name']}" for row in rows)
+
+    columns = [(i, c) for i, c in enumerate(table.get("columnDefinitions", [])) if output == "wide" or c.get("priority", 0) == 0]
+    lines = []
+    if headers and not flags.get("no-headers"):
+        names = [c["name"].upper() for _, c in columns]
+        lines.append("\t".join((["NAMESPACE"] if all_namespaces else []) + names))
+    for row in rows:
+        cells = row.get("cells", [])
+        values = [_cell(cells[i] if i < len(cells) else None, c) for i, c in columns]
+        if all_namespaces:
+            values.insert(0, (row.get("object") or {}).get("metadata", {}).get("namespace", ""))
+        lines.append("\t".join(values))
+    return _tabwrite(lines)
+
+def _get_command(api, default_namespace, args, flags, cluster=None):
+    plural, name, namespace, all_namespaces, query = _get_options(args, flags, default_namespace)
+    table = None
+    if name is None:
+        # Served from the watch cache when that list is cached and fresh enough
+        table = watch_cache.table(cluster, plural, namespace, flags.get("selector"), flags.get("field-selector"))
+    if table is None:
+        table = _get(api, _resource_path(plural, namespace, name), query, accept=TABLE_ACCEPT)
+    return _render_get(table, plural, flags, all_namespaces)
+
+def _get_page(api, default_namespace, args, flags, cluster=None, limit=500, continue_token=None):
+    """
+    One chunk of a list through the API's limit/continue: returns (stdout, next continue token or None).
+    As with kubectl's --chunk-size, only the first chunk has the headers and columns are aligned per chunk.
+    """
+    plural, name, namespace, all_namespaces, query = _get_options(args, flags, default_namespace)
+    if name is not None or flags.get("sort-by"):
+        # Sorting needs the whole list, kubectl does not chunk it either
+        raise UnsupportedCommand("chunked get of a single object or a sorted list")
+    query.append(("limit", str(limit)))
+    if continue_token:
+        query.append(("continue", continue_token))
+    table = _get(api, _resource_path(plural, namespace), query, accept=TABLE_ACCEPT)
+    next_token = (table.get("metadata") or {}).get("continue") or None
+    return _render_get(table, plural, flags, all_namespaces, headers=not continue_token), next_token
+
+HANDLERS = {"get": _get_command}
+
+def _call(command, cluster, handler, args, flags, timeout=None, **options):
+    api, default_namespace = _api_client(cluster)
+    token = _deadline.set(time.monotonic() + timeout if timeout else None)
+    try:
+        return handler(api, default_namespace, args, flags, cluster, **options)
+    except ApiException as e:
+        raise NativeCommandError(_api_error(e))
+    except (OSError, urllib3.exceptions.HTTPError) as e:
+        logging.error(f"Native execution of '{command}' failed: {e}")
+        raise NativeCommandError(f"Unable to connect to the server: {e}")
+    finally:
+        _deadline.reset(token)
+
+def execute_native(command, cluster=None, timeout=None):
+    """
+    Runs a read-only kubectl command in-process and returns what kubectl prints on stdout.
+    Raises UnsupportedCommand when the command must go through kubectl, and
+    NativeCommandError (with kubectl's error message) when the API call fails or when
+    the API calls of the command take more than `timeout` seconds in total.
+    """
+    verb, args, flags = _parse(shlex.split(command)[1:])
+    return _call(command, cluster, HANDLERS[verb], args, flags, timeout=timeout)
+
+def execute_native_page(command, cluster=None, limit=500, continue_token=None, timeout=None):
+    """
+    Like execute_native for a `kubectl get` list, one chunk of `limit` objects at a time:
+    returns (stdout of the chunk, continue token of the next one or None after the last).
+    """
+    verb, args, flags = _parse(shlex.split(command)[1:])
+    if verb != "get":
+        raise UnsupportedCommand(f"chunked {verb}")
+    return _call(command, cluster, _get_page, args, flags, timeout=timeout, limit=limit, continue_token=continue_token)
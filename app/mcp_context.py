@@ -1,76 +1,502 @@
 # app/mcp_context.py
 
 import logging
+import os
+import re
 import sqlite3
 import json
+import threading
+import time
+from contextlib import contextmanager
 
-DB_PATH = "logs/sessions.db"
+from cache import TTLCache
+from metrics import timed
+
+DB_PATH = os.environ.get("CHATBOT_SESSION_DB", "logs/sessions.db")
+# Budget (en tokens estimés) des derniers échanges recopiés tels quels dans le prompt
+HISTORY_TOKEN_BUDGET = int(os.environ.get("CHATBOT_HISTORY_TOKEN_BUDGET", "1024"))
+# Budget du résumé glissant des échanges plus anciens
+SUMMARY_TOKEN_BUDGET = int(os.environ.get("CHATBOT_SUMMARY_TOKEN_BUDGET", "256"))
+# Au-delà, une sortie de commande est stockée à part et seul un aperçu reste dans l'historique
+TOOL_OUTPUT_INLINE_TOKENS = int(os.environ.get("CHATBOT_TOOL_OUTPUT_INLINE_TOKENS", "200"))
+TOOL_OUTPUT_PREVIEW_LINES = 8
+CHARS_PER_TOKEN = 4
+# Une fois le budget dépassé, on compacte jusqu'à cette fraction : la compaction (qui invalide
+# le contexte KV Ollama de la session) n'a alors lieu que tous les quelques échanges
+HISTORY_LOW_WATER = 0.5
+# Cache mémoire en écriture directe (write-through) : à n'activer qu'avec un seul processus serveur.
+# Borné en nombre de sessions (LRU) et en durée : une session évincée est simplement relue en base.
+SESSION_CACHE_ENABLED = os.environ.get("CHATBOT_SESSION_CACHE", "0") == "1"
+SESSION_CACHE_SIZE = int(os.environ.get("CHATBOT_SESSION_CACHE_SIZE", "1024"))
+SESSION_CACHE_TTL = float(os.environ.get("CHATBOT_SESSION_CACHE_TTL", "1800"))
+# Durée de vie des curseurs de listes paginées (les jetons `continue` de l'API expirent aussi)
+LIST_CURSOR_TTL = int(os.environ.get("CHATBOT_LIST_CURSOR_TTL", "900"))
+
+_local = threading.local()
+_cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+# Sérialise la lecture-modification-écriture des entrées du cache
+_cache_lock = threading.Lock()
+
+def _connection():
+    """Connexion SQLite propre au thread courant, ouverte une seule fois en mode WAL."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        # isolation_level=None : autocommit, les transactions sont ouvertes explicitement
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=10000")
+        _local.conn = conn
+    return conn
+
+@contextmanager
+def _transaction():
+    """Transaction en écriture (BEGIN IMMEDIATE) : les lectures-modifications-écritures sont atomiques."""
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
 
 def _initialize_db():
-    """Crée la table de session si elle n'existe pas."""
-    try:
-        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sessions (
-                session_id TEXT PRIMARY KEY,
-                context_data TEXT
-            )
-        """)
-        conn.commit()
-        conn.close()
+    """Crée les tables de session si elles n'existent pas et migre les anciens contextes JSON."""
+    try:
+        with _transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    context_data TEXT
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS turns (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    user_query TEXT NOT NULL,
+                    bot_response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    tool_output_id INTEGER
+                )
+            """)
+            if "tool_output_id" not in [column[1] for column in conn.execute("PRAGMA table_info(turns)")]:
+                conn.execute("ALTER TABLE turns ADD COLUMN tool_output_id INTEGER")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_turns_session ON turns (session_id, id)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tool_outputs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS summaries (
+                    session_id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    last_turn_id INTEGER NOT NULL,
+                    version INTEGER NOT NULL
+                )
+            """)
+            # Contexte KV renvoyé par Ollama, réutilisable tant que le cluster et le résumé n'ont pas changé.
+            # last_turn_id NULL : l'échange généré n'est pas encore enregistré, le prochain tour l'est.
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_contexts (
+                    session_id TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    context TEXT NOT NULL,
+                    cluster TEXT,
+                    summary_version INTEGER NOT NULL,
+                    last_turn_id INTEGER,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (session_id, mode)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pending_commands (
+                    session_id TEXT PRIMARY KEY,
+                    command TEXT NOT NULL,
+                    cluster TEXT,
+                    original_query TEXT,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS list_cursors (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    command TEXT NOT NULL,
+                    cluster TEXT,
+                    continue_token TEXT NOT NULL,
+                    page INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            _migrate_legacy_contexts(conn)
         logging.info(f"Database initialized at {DB_PATH}")
     except Exception as e:
         logging.error(f"Failed to initialize database: {e}")
 
-_initialize_db()
+def _migrate_legacy_contexts(conn):
+    """Déplace l'historique et la commande en attente des anciens blobs JSON vers leurs tables."""
+    rows = conn.execute(
+        "SELECT session_id, context_data FROM sessions WHERE context_data LIKE '%\"history\"%' OR context_data LIKE '%\"pending_command\"%'"
+    ).fetchall()
+    for session_id, context_data in rows:
+        context = json.loads(context_data or "{}")
+        history = context.pop("history", "")
+        for user_query, bot_response in re.findall(r"User: (.*?)\nAssistant: (.*?)(?=\nUser: |\s*\Z)", history, re.DOTALL):
+            conn.execute(
+                "INSERT INTO turns (session_id, user_query, bot_response, created_at) VALUES (?, ?, ?, ?)",
+                (session_id, user_query, bot_response, time.time())
+            )
+        pending = context.pop("pending_command", None)
+        if pending:
+            conn.execute(
+                "INSERT OR REPLACE INTO pending_commands (session_id, command, cluster, original_query, created_at) VALUES (?, ?, ?, ?, ?)",
+                (session_id, pending.get("command"), pending.get("cluster"), pending.get("original_query"), time.time())
+            )
+        conn.execute("UPDATE sessions SET context_data = ? WHERE session_id = ?", (json.dumps(context), session_id))
+        _compact(conn, session_id)
+    if rows:
+        logging.info(f"Migrated {len(rows)} legacy session contexts")
+
+def _cached_session(session_id):
+    """Entrée du cache mémoire d'une session (None si le cache est désactivé)."""
+    if not SESSION_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        return _cache.get(session_id)
+
+def _cache_session(session_id, history=None, pending=False, pending_value=None):
+    if not SESSION_CACHE_ENABLED:
+        return
+    with _cache_lock:
+        entry = _cache.get(session_id) or {"history": None, "pending": None, "pending_loaded": False}
+        if history is not None:
+            entry["history"] = history
+        if pending:
+            entry["pending"] = pending_value
+            entry["pending_loaded"] = True
+        _cache.set(session_id, entry)
 
+@timed("session_db.get_context")
 def get_context(session_id):
     """Récupère le contexte d'une session depuis la base de données."""
     try:
-        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        cursor = conn.cursor()
-        cursor.execute("SELECT context_data FROM sessions WHERE session_id = ?", (session_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return json.loads(result[0]) if result else {}
+        row = _connection().execute("SELECT context_data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        context = json.loads(row[0]) if row and row[0] else {}
+        pending = get_pending_command(session_id)
+        if pending:
+            context["pending_command"] = pending
+        return context
     except Exception as e:
         logging.error(f"Error getting context for {session_id}: {e}")
         return {}
 
+@timed("session_db.update_context")
 def update_context(data, session_id):
-    """Met à jour le contexte d'une session dans la base de données."""
-    try:
-        full_context = get_context(session_id)
-        full_context.update(data)
-        
-        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT OR REPLACE INTO sessions (session_id, context_data) VALUES (?, ?)",
-            (session_id, json.dumps(full_context))
-        )
-        conn.commit()
-        conn.close()
+    """Met à jour le contexte d'une session dans la base de données (fusion atomique)."""
+    try:
+        data = dict(data)
+        if "pending_command" in data:
+            pending = data.pop("pending_command")
+            if pending:
+                set_pending_command(session_id, pending["command"], pending.get("cluster"), pending.get("original_query"))
+            else:
+                clear_pending_command(session_id)
+        data.pop("history", None)
+        if not data:
+            return
+        with _transaction() as conn:
+            row = conn.execute("SELECT context_data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            full_context = json.loads(row[0]) if row and row[0] else {}
+            full_context.update(data)
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, context_data) VALUES (?, ?)",
+                (session_id, json.dumps(full_context))
+            )
         logging.info(f"Updated context for session {session_id}")
     except Exception as e:
         logging.error(f"Error updating context for {session_id}: {e}")
 
+@timed("session_db.set_pending_command")
+def set_pending_command(session_id, command, cluster, original_query):
+    """Enregistre (ou remplace) la commande en attente de confirmation, en une seule requête."""
+    try:
+        _connection().execute(
+            "INSERT OR REPLACE INTO pending_commands (session_id, command, cluster, original_query, created_at) VALUES (?, ?, ?, ?, ?)",
+            (session_id, command, cluster, original_query, time.time())
+        )
+        _cache_session(session_id, pending=True, pending_value={"command": command, "cluster": cluster, "original_query": original_query})
+    except Exception as e:
+        logging.error(f"Error storing pending command for {session_id}: {e}")
+
+@timed("session_db.get_pending_command")
+def get_pending_command(session_id):
+    """Retourne la commande en attente d'une session, ou None."""
+    entry = _cached_session(session_id)
+    if entry and entry["pending_loaded"]:
+        return entry["pending"]
+    try:
+        row = _connection().execute(
+            "SELECT command, cluster, original_query FROM pending_commands WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        pending = {"command": row[0], "cluster": row[1], "original_query": row[2]} if row else None
+        _cache_session(session_id, pending=True, pending_value=pending)
+        return pending
+    except Exception as e:
+        logging.error(f"Error getting pending command for {session_id}: {e}")
+        return None
+
+@timed("session_db.pop_pending_command")
+def pop_pending_command(session_id):
+    """Retire et retourne atomiquement la commande en attente : deux confirmations simultanées ne l'exécutent qu'une fois."""
+    try:
+        with _transaction() as conn:
+            row = conn.execute(
+                "SELECT command, cluster, original_query FROM pending_commands WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row:
+                conn.execute("DELETE FROM pending_commands WHERE session_id = ?", (session_id,))
+        _cache_session(session_id, pending=True, pending_value=None)
+        return {"command": row[0], "cluster": row[1], "original_query": row[2]} if row else None
+    except Exception as e:
+        logging.error(f"Error popping pending command for {session_id}: {e}")
+        return None
+
+@timed("session_db.clear_pending_command")
+def clear_pending_command(session_id):
+    """Supprime la commande en attente d'une session."""
+    try:
+        _connection().execute("DELETE FROM pending_commands WHERE session_id = ?", (session_id,))
+        _cache_session(session_id, pending=True, pending_value=None)
+    except Exception as e:
+        logging.error(f"Error clearing pending command for {session_id}: {e}")
+
+@timed("session_db.save_list_cursor")
+def save_list_cursor(session_id, command, cluster, continue_token, page):
+    """Enregistre la suite d'une liste paginée (page suivante `page`) ; retourne l'id du curseur ou None."""
+    try:
+        with _transaction() as conn:
+            conn.execute("DELETE FROM list_cursors WHERE created_at < ?", (time.time() - LIST_CURSOR_TTL,))
+            return conn.execute(
+                "INSERT INTO list_cursors (session_id, command, cluster, continue_token, page, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, command, cluster, continue_token, page, time.time())
+            ).lastrowid
+    except Exception as e:
+        logging.error(f"Error storing list cursor for {session_id}: {e}")
+        return None
+
+@timed("session_db.pop_list_cursor")
+def pop_list_cursor(session_id, cursor_id):
+    """Retire et retourne atomiquement un curseur non expiré de la session : chaque page n'est servie qu'une fois."""
+    try:
+        with _transaction() as conn:
+            row = conn.execute(
+                "SELECT command, cluster, continue_token, page, created_at FROM list_cursors WHERE id = ? AND session_id = ?",
+                (cursor_id, session_id)
+            ).fetchone()
+            if row:
+                conn.execute("DELETE FROM list_cursors WHERE id = ?", (cursor_id,))
+        if not row or row[4] < time.time() - LIST_CURSOR_TTL:
+            return None
+        return {"command": row[0], "cluster": row[1], "continue_token": row[2], "page": row[3]}
+    except Exception as e:
+        logging.error(f"Error popping list cursor {cursor_id} for {session_id}: {e}")
+        return None
+
+def estimate_tokens(text):
+    """Estimation grossière du nombre de tokens (~4 caractères par token), sans tokenizer."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def _clip(text, tokens):
+    limit = tokens * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:limit].rstrip() + " [...]"
+
+def _tool_output_reference(output_id, content):
+    """Aperçu d'une sortie longue, avec la référence vers le texte complet stocké à part."""
+    lines = content.splitlines()
+    preview = _clip("\n".join(lines[:TOOL_OUTPUT_PREVIEW_LINES]), TOOL_OUTPUT_INLINE_TOKENS)
+    return f"{preview}\n[output #{output_id} truncated: {len(lines)} lines, ~{estimate_tokens(content)} tokens]"
+
+def _render_turn(user_query, bot_response):
+    # Un seul échange ne peut pas dépasser le budget à lui seul
+    return f"User: {_clip(user_query, HISTORY_TOKEN_BUDGET // 4)}\nAssistant: {_clip(bot_response, HISTORY_TOKEN_BUDGET // 2)}\n"
+
+def _summarize_turn(user_query, bot_response):
+    """Résumé extractif d'un échange : la question et la première ligne de la réponse."""
+    first_line = next((line for line in bot_response.splitlines() if line.strip()), "")
+    return f"- User: {_clip(' '.join(user_query.split()), 30)} -> {_clip(first_line.strip(), 30)}"
+
+def _render_history(summary, turns):
+    history = f"Summary of earlier conversation:\n{summary}\n" if summary else ""
+    return history + "".join(_render_turn(user_query, bot_response) for user_query, bot_response in turns)
+
+def _compact(conn, session_id):
+    """
+    Replie dans le résumé glissant les échanges les plus anciens qui dépassent le budget
+    (et supprime leurs sorties stockées à part), puis retourne l'historique rendu. Le résumé est versionné pour invalider ce qui en dépend.
+    """
+    row = conn.execute("SELECT summary, last_turn_id, version FROM summaries WHERE session_id = ?", (session_id,)).fetchone()
+    summary, last_turn_id, version = row if row else ("", 0, 0)
+    turns = conn.execute(
+        "SELECT id, user_query, bot_response FROM turns WHERE session_id = ? AND id > ? ORDER BY id",
+        (session_id, last_turn_id)
+    ).fetchall()
+    rendered = [estimate_tokens(_render_turn(user_query, bot_response)) for _, user_query, bot_response in turns]
+
+    folded = 0
+    if sum(rendered) > HISTORY_TOKEN_BUDGET:
+        while len(turns) - folded > 1 and sum(rendered[folded:]) > HISTORY_TOKEN_BUDGET * HISTORY_LOW_WATER:
+            folded += 1
+    if folded:
+        lines = summary.splitlines() + [_summarize_turn(user_query, bot_response) for _, user_query, bot_response in turns[:folded]]
+        # Les lignes les plus anciennes du résumé sortent en premier
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > SUMMARY_TOKEN_BUDGET:
+            lines.pop(0)
+        summary, last_turn_id, version = "\n".join(lines), turns[folded - 1][0], version + 1
+        conn.execute(
+            "INSERT OR REPLACE INTO summaries (session_id, summary, last_turn_id, version) VALUES (?, ?, ?, ?)",
+            (session_id, summary, last_turn_id, version)
+        )
+        # Les sorties longues des échanges repliés ne sont plus référencées par l'historique
+        conn.execute(
+            "DELETE FROM tool_outputs WHERE id IN (SELECT tool_output_id FROM turns WHERE session_id = ? AND id <= ? AND tool_output_id IS NOT NULL)",
+            (session_id, last_turn_id)
+        )
+        logging.info(f"Compacted {folded} turns of session {session_id} into summary v{version}")
+    return _render_history(summary, [(user_query, bot_response) for _, user_query, bot_response in turns[folded:]])
+
+@timed("session_db.get_history")
 def get_history(session_id):
-    """Obtient l'historique de la conversation pour une session."""
-    context = get_context(session_id)
-    return context.get("history", "")
-
-def update_history(session_id, user_query, bot_response):
-    """Ajoute le dernier échange à l'historique de la conversation."""
-    context = get_context(session_id)
-    current_history = context.get("history", "")
-    new_exchange = f"User: {user_query}\nAssistant: {bot_response}\n"
-    new_history = f"{current_history}{new_exchange}"
-    
-    # Limite la taille de l'historique pour éviter qu'il ne devienne trop grand
-    history_lines = new_history.strip().split('\n')
-    if len(history_lines) > 20: # Garde environ les 10 derniers échanges
-        new_history = "\n".join(history_lines[-20:]) + "\n"
-
-    update_context({"history": new_history}, session_id)
+    """Obtient l'historique borné de la conversation : résumé glissant + derniers échanges dans le budget."""
+    entry = _cached_session(session_id)
+    if entry and entry["history"] is not None:
+        return entry["history"]
+    try:
+        # Une seule requête : le résumé (s'il existe) et les échanges qu'il ne couvre pas encore.
+        # La sous-requête garantit une ligne même pour une session sans résumé ni échange.
+        rows = _connection().execute("""
+            SELECT summaries.summary, turns.user_query, turns.bot_response
+            FROM (SELECT ? AS session_id) AS session
+            LEFT JOIN summaries ON summaries.session_id = session.session_id
+            LEFT JOIN turns ON turns.session_id = session.session_id AND turns.id > COALESCE(summaries.last_turn_id, 0)
+            ORDER BY turns.id
+        """, (session_id,)).fetchall()
+        summary = rows[0][0] or ""
+        turns = [(user_query, bot_response) for _, user_query, bot_response in rows if user_query is not None]
+        history = _render_history(summary, turns)
+        _cache_session(session_id, history=history)
+        return history
+    except Exception as e:
+        logging.error(f"Error getting history for {session_id}: {e}")
+        return ""
+
+@timed("session_db.get_summary_version")
+def get_summary_version(session_id):
+    """Version du résumé glissant d'une session (0 tant qu'aucun échange n'a été compacté)."""
+    try:
+        row = _connection().execute("SELECT version FROM summaries WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+    except Exception as e:
+        logging.error(f"Error getting summary version for {session_id}: {e}")
+        return 0
+
+@timed("session_db.get_history_since")
+def get_history_since(session_id, after_turn_id):
+    """Échanges enregistrés après `after_turn_id` (ceux qu'un contexte KV réutilisé n'a pas encore vus)."""
+    try:
+        turns = _connection().execute(
+            "SELECT user_query, bot_response FROM turns WHERE session_id = ? AND id > ? ORDER BY id",
+            (session_id, after_turn_id)
+        ).fetchall()
+        return _render_history("", turns)
+    except Exception as e:
+        logging.error(f"Error getting history since turn {after_turn_id} for {session_id}: {e}")
+        return ""
+
+@timed("session_db.get_llm_context")
+def get_llm_context(session_id, mode):
+    """Retourne le contexte KV Ollama enregistré pour la session et le type de prompt, ou None."""
+    try:
+        row = _connection().execute(
+            "SELECT context, cluster, summary_version, last_turn_id FROM llm_contexts WHERE session_id = ? AND mode = ?",
+            (session_id, mode)
+        ).fetchone()
+        if not row:
+            return None
+        return {"context": json.loads(row[0]), "cluster": row[1], "summary_version": row[2], "last_turn_id": row[3]}
+    except Exception as e:
+        logging.error(f"Error getting LLM context for {session_id}: {e}")
+        return None
+
+@timed("session_db.save_llm_context")
+def save_llm_context(session_id, mode, context, cluster, summary_version, covers_next_turn):
+    """
+    Enregistre le contexte KV renvoyé par Ollama. Si `covers_next_turn`, l'échange généré sera
+    le prochain tour enregistré par update_history ; sinon le contexte couvre les tours existants.
+    """
+    try:
+        with _transaction() as conn:
+            last_turn_id = None
+            if not covers_next_turn:
+                last_turn_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM turns WHERE session_id = ?", (session_id,)).fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_contexts (session_id, mode, context, cluster, summary_version, last_turn_id, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (session_id, mode, json.dumps(context), cluster, summary_version, last_turn_id, time.time())
+            )
+    except Exception as e:
+        logging.error(f"Error saving LLM context for {session_id}: {e}")
+
+@timed("session_db.clear_llm_context")
+def clear_llm_context(session_id, mode):
+    try:
+        _connection().execute("DELETE FROM llm_contexts WHERE session_id = ? AND mode = ?", (session_id, mode))
+    except Exception as e:
+        logging.error(f"Error clearing LLM context for {session_id}: {e}")
+
+@timed("session_db.get_tool_output")
+def get_tool_output(session_id, output_id):
+    """Retourne le texte complet d'une sortie stockée hors de l'historique, ou None."""
+    try:
+        row = _connection().execute(
+            "SELECT content FROM tool_outputs WHERE id = ? AND session_id = ?", (output_id, session_id)
+        ).fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        logging.error(f"Error getting tool output {output_id} for {session_id}: {e}")
+        return None
+
+@timed("session_db.update_history")
+def update_history(session_id, user_query, bot_response, tool_output=None):
+    """
+    Ajoute le dernier échange à l'historique et compacte les plus anciens hors budget.
+    Une sortie de commande (`tool_output`) trop longue est stockée à part et référencée.
+    """
+    try:
+        with _transaction() as conn:
+            tool_output_id = None
+            if tool_output is not None:
+                if estimate_tokens(tool_output) > TOOL_OUTPUT_INLINE_TOKENS:
+                    tool_output_id = conn.execute(
+                        "INSERT INTO tool_outputs (session_id, content, created_at) VALUES (?, ?, ?)",
+                        (session_id, tool_output, time.time())
+                    ).lastrowid
+                    bot_response = f"{bot_response}\nResult: {_tool_output_reference(tool_output_id, tool_output)}"
+                else:
+                    bot_response = f"{bot_response}\nResult: {tool_output}"
+            turn_id = conn.execute(
+                "INSERT INTO turns (session_id, user_query, bot_response, created_at, tool_output_id) VALUES (?, ?, ?, ?, ?)",
+                (session_id, user_query, bot_response, time.time(), tool_output_id)
+            ).lastrowid
+            # Ce tour est l'échange déjà contenu dans le contexte KV en attente
+            conn.execute("UPDATE llm_contexts SET last_turn_id = ? WHERE session_id = ? AND last_turn_id IS NULL", (turn_id, session_id))
+            history = _compact(conn, session_id)
+        _cache_session(session_id, history=history)
+    except Exception as e:
+        logging.error(f"Error updating history for {session_id}: {e}")
+
+_initialize_db()
@@ -0,0 +1,153 @@
+# app/metrics.py
+
+import contextvars
+import functools
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency buckets: from a cached lookup to a long generation
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+# Request being served by the current thread/context, and the time spent per stage in it
+_request_id = contextvars.ContextVar("request_id", default="-")
+_request_stages = contextvars.ContextVar("request_stages", default=None)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _number(value):
+    return "+Inf" if value == float("inf") else repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, rendered in the Prometheus text format."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._series = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(counts), total, count) for key, (counts, total, count) in self._series.items())
+        for key, counts, total, count in series:
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {bucket_count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+registry = []
+
+stage_duration = Histogram("chatbot_stage_duration_seconds", "Time spent in each stage of a request.", ["stage"])
+request_duration = Histogram("chatbot_http_request_duration_seconds", "HTTP request duration, streamed body included.",
+                             ["endpoint", "method", "status"])
+ollama_duration = Histogram("chatbot_ollama_duration_seconds", "Durations reported by Ollama for each generation.",
+                            ["phase", "context"])
+ollama_tokens = Histogram("chatbot_ollama_tokens", "Token counts reported by Ollama for each generation.",
+                          ["phase", "context"], buckets=TOKEN_BUCKETS)
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+def observe_stage(stage, seconds):
+    """Record `seconds` spent in a stage of the current request."""
+    stage_duration.observe(seconds, stage=stage)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+@contextmanager
+def span(stage):
+    """Time a block as one stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+def timed(stage):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def observe_ollama(data, reused_context):
+    """Record the counts and durations (nanoseconds) of a final Ollama response."""
+    context = "reused" if reused_context else "fresh"
+    for phase, count_key, duration_key in (("prompt_eval", "prompt_eval_count", "prompt_eval_duration"),
+                                           ("eval", "eval_count", "eval_duration")):
+        if count_key in data:
+            ollama_tokens.observe(data[count_key], phase=phase, context=context)
+        if duration_key in data:
+            ollama_duration.observe(data[duration_key] / 1e9, phase=phase, context=context)
+    for phase in ("load", "total"):
+        if f"{phase}_duration" in data:
+            ollama_duration.observe(data[f"{phase}_duration"] / 1e9, phase=phase, context=context)
+
+def start_request(request_id=None):
+    """Bind a request id (a new one when not given) and an empty stage breakdown to the current context."""
+    request_id = request_id or uuid.uuid4().hex[:12]
+    _request_id.set(request_id)
+    _request_stages.set({})
+    return request_id
+
+def current_request_id():
+    return _request_id.get()
+
+def request_stages():
+    """Seconds spent per stage so far in the current request."""
+    return dict(_request_stages.get() or {})
+
+def bind_context(fn):
+    """Run fn in a copy of the caller's context, so worker threads keep its request id and stages."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+def install_log_context():
+    """Add the request id to every line written by the root logger's handlers."""
+    for handler in logging.getLogger().handlers:
+        if not any(isinstance(f, _RequestIdFilter) for f in handler.filters):
+            handler.addFilter(_RequestIdFilter())
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
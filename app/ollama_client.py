@@ -0,0 +1,230 @@
+# app/ollama_client.py
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import observe_ollama
+
+class OllamaBusyError(requests.RequestException):
+    """Raised when no generation slot frees up in time (or the wait queue is full)."""
+
+class OllamaTimeoutError(requests.Timeout):
+    """Raised when a generation exceeds its total time budget."""
+
+class OllamaClient:
+    """
+    Shared client for the local Ollama server.
+    Reuses keep-alive connections, bounds every request with connect / first-token / total
+    timeouts and caps the number of concurrent generations; callers beyond the cap wait in
+    a bounded queue.
+    """
+
+    def __init__(self, base_url, model, max_concurrency=2, max_queue=16, queue_timeout=30.0,
+                 connect_timeout=3.0, first_token_timeout=60.0, total_timeout=180.0):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.connect_timeout = connect_timeout
+        self.first_token_timeout = first_token_timeout
+        self.total_timeout = total_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(max_concurrency, 1) * 2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+        # Streamed generations abandoned by their reader (client disconnect)
+        self.cancelled = 0
+        self.tokens_saved = 0
+        self._stream_tokens_total = 0
+        self._streams_completed = 0
+        # Prompt evaluation, split by whether a session's KV context was reused
+        self.prompt_eval = {mode: {"calls": 0, "tokens": 0, "ms": 0.0} for mode in ("fresh", "reused")}
+
+    @contextmanager
+    def _slot(self):
+        """Wait for a generation slot, failing fast when the wait queue is already full."""
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise OllamaBusyError(f"Ollama wait queue is full ({self.queued} waiting)")
+            self.queued += 1
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+        with self._lock:
+            self.queued -= 1
+            if acquired:
+                self.in_flight += 1
+            else:
+                self.rejected += 1
+        if not acquired:
+            raise OllamaBusyError(f"No Ollama generation slot within {self.queue_timeout}s")
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def _payload(self, prompt, stream, options, extra):
+        payload = {"model": self.model, "prompt": prompt, "stream": stream}
+        if options:
+            payload["options"] = options
+        payload.update(extra)
+        return payload
+
+    def _record(self, error):
+        with self._lock:
+            if error is None:
+                self.completed += 1
+            elif isinstance(error, requests.Timeout):
+                self.timeouts += 1
+            else:
+                self.errors += 1
+
+    def _record_prompt_eval(self, reused, data):
+        """Record Ollama's prompt_eval_count / prompt_eval_duration from a final response."""
+        if "prompt_eval_duration" not in data:
+            return
+        with self._lock:
+            bucket = self.prompt_eval["reused" if reused else "fresh"]
+            bucket["calls"] += 1
+            bucket["tokens"] += data.get("prompt_eval_count", 0)
+            bucket["ms"] += data["prompt_eval_duration"] / 1e6
+
+    def generate(self, prompt, options=None, **extra):
+        """Non-streamed generation; returns Ollama's full JSON response."""
+        with self._slot():
+            try:
+                # Ollama sends nothing before the end of a non-streamed generation: the read timeout is the total budget
+                response = self.session.post(
+                    f"{self.base_url}/api/generate",
+                    json=self._payload(prompt, False, options, extra),
+                    timeout=(self.connect_timeout, self.total_timeout)
+                )
+                response.raise_for_status()
+                data = response.json()
+            except requests.RequestException as e:
+                self._record(e)
+                raise
+            self._record(None)
+            self._record_prompt_eval("context" in extra, data)
+            observe_ollama(data, "context" in extra)
+            return data
+
+    def generate_stream(self, prompt, options=None, **extra):
+        """
+        Streamed generation; yields Ollama's JSON chunks. The slot is taken on the first
+        iteration and released (and the HTTP response closed) as soon as the generator ends
+        or is closed.
+        """
+        with self._slot():
+            start = time.monotonic()
+            response = None
+            error = None
+            tokens = 0
+            try:
+                # The read timeout bounds the wait for the first token and any later stall
+                response = self.session.post(
+                    f"{self.base_url}/api/generate",
+                    json=self._payload(prompt, True, options, extra),
+                    timeout=(self.connect_timeout, self.first_token_timeout),
+                    stream=True
+                )
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    if time.monotonic() - start > self.total_timeout:
+                        raise OllamaTimeoutError(f"Ollama generation exceeded {self.total_timeout}s")
+                    chunk = json.loads(line)
+                    tokens += 1
+                    yield chunk
+                    if chunk.get("done"):
+                        self._record_prompt_eval("context" in extra, chunk)
+                        observe_ollama(chunk, "context" in extra)
+                        with self._lock:
+                            self._stream_tokens_total += chunk.get("eval_count", tokens)
+                            self._streams_completed += 1
+            except GeneratorExit:
+                # The reader went away: closing the response makes Ollama stop generating
+                self._record_cancel(tokens)
+                error = GeneratorExit
+                raise
+            except requests.RequestException as e:
+                error = e
+                raise
+            finally:
+                if response is not None:
+                    response.close()
+                if error is not GeneratorExit:
+                    self._record(error)
+
+    def _record_cancel(self, tokens_streamed):
+        with self._lock:
+            self.cancelled += 1
+            # Estimate of the tokens that would still have been generated, from the average completed stream
+            if self._streams_completed:
+                average = self._stream_tokens_total / self._streams_completed
+                self.tokens_saved += max(0, round(average) - tokens_streamed)
+        logging.info(f"Streamed generation cancelled by its reader after {tokens_streamed} tokens")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "model": self.model,
+                "endpoint": self.base_url,
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "queue_depth": self.queued,
+                "max_queue": self.max_queue,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "cancelled": self.cancelled,
+                "tokens_saved_estimate": self.tokens_saved,
+                "prompt_eval": self._prompt_eval_stats(),
+            }
+
+    def _prompt_eval_stats(self):
+        stats = {}
+        for mode, bucket in self.prompt_eval.items():
+            calls = bucket["calls"]
+            stats[mode] = {
+                "calls": calls,
+                "avg_tokens": round(bucket["tokens"] / calls, 1) if calls else 0.0,
+                "avg_ms": round(bucket["ms"] / calls, 1) if calls else 0.0,
+            }
+        # Prompt-eval time saved per turn by reusing a session context
+        measured = stats["fresh"]["calls"] and stats["reused"]["calls"]
+        stats["saved_ms_per_turn"] = round(stats["fresh"]["avg_ms"] - stats["reused"]["avg_ms"], 1) if measured else 0.0
+        return stats
+
+ollama_client = OllamaClient(
+    base_url=os.environ.get("CHATBOT_OLLAMA_URL", "http://localhost:11434"),
+    model=os.environ.get("CHATBOT_OLLAMA_MODEL", "mistral:instruct"),
+    max_concurrency=int(os.environ.get("CHATBOT_OLLAMA_MAX_CONCURRENCY", "2")),
+    max_queue=int(os.environ.get("CHATBOT_OLLAMA_MAX_QUEUE", "16")),
+    queue_timeout=float(os.environ.get("CHATBOT_OLLAMA_QUEUE_TIMEOUT", "30")),
+    connect_timeout=float(os.environ.get("CHATBOT_OLLAMA_CONNECT_TIMEOUT", "3")),
+    first_token_timeout=float(os.environ.get("CHATBOT_OLLAMA_FIRST_TOKEN_TIMEOUT", "60")),
+    total_timeout=float(os.environ.get("CHATBOT_OLLAMA_TOTAL_TIMEOUT", "180"))
+)
+logging.info(f"Ollama client configured for model '{ollama_client.model}' at {ollama_client.base_url}")
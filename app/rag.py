@@ -1,10 +1,15 @@
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from spellchecker import SpellChecker
+from langchain_core.documents import Document
+from cache import TTLCache
+from embeddings import embedding_id, load_embeddings
+from metrics import span
+from readiness import register
+from spelling import TypoCorrector
+import hashlib
+import json
 import logging
 import os
+import re
+import threading
 
 # Configure logging to track application events
 logging.basicConfig(
@@ -13,80 +18,393 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-# Initialize the embeddings model for semantic search
-#embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-embeddings = HuggingFaceEmbeddings(model_name="BAAI/bge-m3")
-# Initialize spell checker to correct user typos
-spell = SpellChecker()
+# Embeddings model for semantic search, configured through the CHATBOT_EMBEDDING_* variables (see embeddings.py).
+# Vectors of different models or backends are not comparable: the manifest records which one built the index.
+EMBEDDING_MODEL = embedding_id()
 
-# Declare vector store and set directory paths
+# The model, the spelling dictionary and the index are built on first use or by the warm-up thread
+embeddings = register("embeddings", load_embeddings)
+
+# Declare vector stores and set directory paths
 vector_store = None
+# Dedicated sub-index of the Query:/Command: pairs of COMMANDS_FILE, embedded on the query text
+command_store = None
+# chromadb client shared by both stores; batched searches query its collections directly
+_chroma_client = None
 DOCS_DIR = "docs/"
 PERSIST_DIR = "chroma_db"
+COMMANDS_FILE = "k8s_commands.txt"
+# langchain_chroma's default collection name, which existing indexes were built with
+DOCS_COLLECTION = "langchain"
+COMMAND_COLLECTION = "k8s_command_examples"
+# The manifest lives next to the Chroma directory and records the content hash of every
+# indexed file and the ids of its chunks, so restarts only embed what actually changed.
+MANIFEST_PATH = f"{PERSIST_DIR.rstrip('/')}_manifest.json"
+MANIFEST_FORMAT = 2
+
+_index_lock = threading.RLock()
+_manifest = {"format": MANIFEST_FORMAT, "embedding_model": EMBEDDING_MODEL, "version": 0, "files": {}}
+
+def _load_typo_corrector():
+    from spellchecker import SpellChecker
+    return TypoCorrector(DOCS_DIR, dictionary=SpellChecker(distance=1))
+
+# Initialize the typo corrector (domain vocabulary from the docs, general dictionary as fallback)
+typo_corrector = register("spelling", _load_typo_corrector)
 
 # Function to correct spelling mistakes in the input query
 def correct_typos(query):
-    words = query.split()
-    corrected = [spell.correction(word) if spell.correction(word) else word for word in words]
-    corrected_query = " ".join(corrected)
-    return corrected_query
+    return typo_corrector.get().correct(query)
+
+def _hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _load_manifest():
+    """Load the index manifest from disk, or None if it is missing or unusable."""
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != MANIFEST_FORMAT or manifest.get("embedding_model") != EMBEDDING_MODEL:
+            logging.info("Index manifest format or embedding model changed, rebuilding the index.")
+            return None
+        return manifest
+    except Exception as e:
+        logging.error(f"Failed to read index manifest {MANIFEST_PATH}: {str(e)}")
+        return None
+
+def _save_manifest():
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def _doc_path(name):
+    return os.path.join(DOCS_DIR, os.path.basename(name))
+
+def _list_doc_files():
+    if not os.path.isdir(DOCS_DIR):
+        return []
+    return sorted(_doc_path(name) for name in os.listdir(DOCS_DIR) if name.endswith(".txt"))
+
+def _chunk_file(path):
+    """Split a document into chunks and give each one a stable, content-derived id."""
+    # Only needed when something has to be (re-)indexed: imported here to keep startup fast
+    from langchain_community.document_loaders import TextLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    documents = TextLoader(path).load()
+    chunks = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_documents(documents)
+    ids, seen = [], {}
+    for chunk in chunks:
+        chunk_hash = _hash_text(f"{path}\0{chunk.page_content}")
+        # Identical chunks inside one file still need distinct ids
+        seen[chunk_hash] = seen.get(chunk_hash, 0) + 1
+        ids.append(chunk_hash if seen[chunk_hash] == 1 else f"{chunk_hash}-{seen[chunk_hash]}")
+    return chunks, ids
 
-# Function to load documents, split them, and create the vector store
+def _parse_command_examples(path):
+    """Extract the Query:/Command: pairs of the commands file as sub-index documents."""
+    with open(path, "r", encoding="utf-8") as f:
+        pairs = re.findall(r"^Query:\s*(.+?)\s*\nCommand:\s*(.+?)\s*$", f.read(), re.MULTILINE)
+    examples, ids = [], []
+    for query, command in pairs:
+        examples.append(Document(page_content=query, metadata={"source": path, "command": command}))
+        ids.append(_hash_text(f"{path}\0{query}\0{command}"))
+    return examples, ids
+
+def _sync_store(store, documents, ids, old_ids):
+    """Embed the documents whose id is new and delete the ids that disappeared; returns (added, removed)."""
+    old_ids = set(old_ids)
+    new_docs = [(doc, doc_id) for doc, doc_id in zip(documents, ids) if doc_id not in old_ids]
+    stale_ids = list(old_ids - set(ids))
+    if new_docs:
+        store.add_documents([doc for doc, _ in new_docs], ids=[doc_id for _, doc_id in new_docs])
+    if stale_ids:
+        store.delete(ids=stale_ids)
+    return len(new_docs), len(stale_ids)
+
+def _index_file(path, file_hash):
+    """Embed only the new chunks of a file and drop the ones that disappeared."""
+    old_entry = _manifest["files"].get(path, {})
+    chunks, ids = _chunk_file(path)
+    added, removed = _sync_store(vector_store, chunks, ids, old_entry.get("chunks", []))
+    entry = {"hash": file_hash, "chunks": ids, "examples": []}
+
+    if os.path.basename(path) == COMMANDS_FILE:
+        examples, example_ids = _parse_command_examples(path)
+        _sync_store(command_store, examples, example_ids, old_entry.get("examples", []))
+        entry["examples"] = example_ids
+    elif old_entry.get("examples"):
+        command_store.delete(ids=old_entry["examples"])
+
+    _manifest["files"][path] = entry
+    logging.info(f"Indexed {path}: {added} chunks embedded, {len(ids) - added} reused, {removed} removed, {len(entry['examples'])} command examples")
+
+def _remove_file(path):
+    entry = _manifest["files"].pop(path, None)
+    if entry and entry.get("chunks"):
+        vector_store.delete(ids=entry["chunks"])
+    if entry and entry.get("examples"):
+        command_store.delete(ids=entry["examples"])
+    logging.info(f"Removed {path} from the index")
+
+def _open_stores():
+    global _chroma_client
+    import chromadb
+    from langchain_chroma import Chroma
+    _chroma_client = chromadb.PersistentClient(path=PERSIST_DIR)
+    return (
+        Chroma(client=_chroma_client, collection_name=DOCS_COLLECTION, embedding_function=embeddings.get()),
+        Chroma(client=_chroma_client, collection_name=COMMAND_COLLECTION, embedding_function=embeddings.get())
+    )
+
+def _read_file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+# Function to open the persisted vector store and bring it in sync with the docs directory
 def initialize_vector_store():
-    global vector_store
+    global vector_store, command_store, _manifest
     try:
-        if not os.path.exists(DOCS_DIR):
-            os.makedirs(DOCS_DIR)
-            vector_store = Chroma.from_texts(["placeholder"], embeddings, persist_directory=PERSIST_DIR)
-            return
-
-        loader = DirectoryLoader(DOCS_DIR, glob="*.txt", loader_cls=TextLoader, show_progress=True)
-        documents = loader.load()
-
-        if not documents:
-            vector_store = Chroma.from_texts(["placeholder"], embeddings, persist_directory=PERSIST_DIR)
-            return
-
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        chunks = text_splitter.split_documents(documents)
-
-        vector_store = Chroma.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            persist_directory=PERSIST_DIR
-        )
+        os.makedirs(DOCS_DIR, exist_ok=True)
+        with _index_lock:
+            vector_store, command_store = _open_stores()
+            manifest = _load_manifest()
+            if manifest is not None:
+                indexed_ids = {chunk_id for entry in manifest["files"].values() for chunk_id in entry["chunks"]}
+                example_ids = {example_id for entry in manifest["files"].values() for example_id in entry["examples"]}
+                if (set(vector_store.get(include=[])["ids"]) != indexed_ids
+                        or set(command_store.get(include=[])["ids"]) != example_ids):
+                    logging.info("Vector store content does not match the index manifest, rebuilding the index.")
+                    manifest = None
+            if manifest is None:
+                # Without a trustworthy manifest we cannot tell which stored chunks are current: start clean.
+                vector_store.delete_collection()
+                command_store.delete_collection()
+                vector_store, command_store = _open_stores()
+                manifest = {"format": MANIFEST_FORMAT, "embedding_model": EMBEDDING_MODEL, "version": 0, "files": {}}
+            _manifest = manifest
+
+            current = {path: _read_file_hash(path) for path in _list_doc_files()}
+            changed = False
+            for path in list(_manifest["files"]):
+                if path not in current:
+                    _remove_file(path)
+                    changed = True
+            for path, file_hash in current.items():
+                if _manifest["files"].get(path, {}).get("hash") != file_hash:
+                    _index_file(path, file_hash)
+                    changed = True
+
+            if changed or not os.path.exists(MANIFEST_PATH):
+                _manifest["version"] += 1
+                _save_manifest()
+                typo_corrector.get().load_vocabulary()
+            logging.info(f"Vector store ready (index version {_manifest['version']}, {len(current)} documents, changed={changed})")
     except Exception as e:
         logging.error(f"Failed to initialize vector store: {str(e)}")
         vector_store = None
+        command_store = None
+        raise
+
+vector_index = register("vector_store", initialize_vector_store)
+
+def _index_ready():
+    """Open and sync the index on first use; False when it could not be initialized."""
+    try:
+        vector_index.get()
+        return True
+    except Exception:
+        return False
+
+def reindex_document(name):
+    """
+    Re-index a single document of the docs directory at runtime (removes it if the file is gone).
+    Like the startup scan, only .txt documents are indexed.
+    """
+    if not name.endswith(".txt"):
+        logging.warning(f"Not re-indexing {name}: only .txt documents are indexed")
+        return False
+    if not _index_ready():
+        return False
+    path = _doc_path(name)
+    try:
+        with _index_lock:
+            if os.path.exists(path):
+                file_hash = _read_file_hash(path)
+                if _manifest["files"].get(path, {}).get("hash") == file_hash:
+                    return True
+                _index_file(path, file_hash)
+            elif path in _manifest["files"]:
+                _remove_file(path)
+            else:
+                return True
+            _manifest["version"] += 1
+            _save_manifest()
+            typo_corrector.get().load_vocabulary()
+        return True
+    except Exception as e:
+        logging.error(f"Failed to re-index {path}: {str(e)}")
+        return False
+
+def get_index_version():
+    """Return the current index version; it changes every time the indexed content changes."""
+    return _manifest["version"]
+
+# Cache of query vectors and search results, keyed on the normalized query text.
+# Entries are only valid for one index version and are dropped as soon as it changes.
+_query_cache = TTLCache(
+    maxsize=int(os.environ.get("CHATBOT_RAG_CACHE_SIZE", "512")),
+    ttl=float(os.environ.get("CHATBOT_RAG_CACHE_TTL", "3600"))
+)
+_query_cache_version = None
+
+def _normalize_query(query):
+    return " ".join(query.lower().split())
+
+def _check_cache_version():
+    global _query_cache_version
+    version = get_index_version()
+    if version != _query_cache_version:
+        _query_cache.clear()
+        _query_cache_version = version
+
+def _cached_query_entry(query):
+    """Return the cache entry of a query, creating it (typo correction + embedding) on a miss."""
+    _check_cache_version()
+    key = _normalize_query(query)
+    entry = _query_cache.get(key)
+    if entry is None:
+        with span("spell_correction"):
+            corrected_query = correct_typos(query)
+        with span("embedding"):
+            entry = {"vector": embeddings.get().embed_query(corrected_query), "results": {}}
+        _query_cache.set(key, entry)
+    return entry
+
+def _search(store_name, query, k):
+    """Similarity search that reuses the cached query vector and top-k results."""
+    entry = _cached_query_entry(query)
+    docs = entry["results"].get((store_name, k))
+    if docs is None:
+        store = command_store if store_name == "commands" else vector_store
+        with span("vector_search"):
+            docs = store.similarity_search_by_vector(entry["vector"], k=k)
+        entry["results"][(store_name, k)] = docs
+    return docs
+
+def _cached_query_entries(queries):
+    """Cache entries of several queries; the missing vectors are computed in a single batched forward pass."""
+    _check_cache_version()
+    entries, missing = {}, {}
+    for query in queries:
+        key = _normalize_query(query)
+        if key in entries or key in missing:
+            continue
+        entry = _query_cache.get(key)
+        if entry is None:
+            with span("spell_correction"):
+                missing[key] = correct_typos(query)
+        else:
+            entries[key] = entry
+    if missing:
+        # No query instruction is configured: embed_documents gives the same vectors as embed_query
+        with span("embedding"):
+            vectors = embeddings.get().embed_documents(list(missing.values()))
+        for key, vector in zip(missing, vectors):
+            entries[key] = {"vector": vector, "results": {}}
+            _query_cache.set(key, entries[key])
+    return [entries[_normalize_query(query)] for query in queries]
+
+def _search_batch(store_name, entries, k):
+    """
+    Top-k results of several cache entries, the missing ones fetched with one multi-vector query
+    on the chromadb collection (public client API). If that query fails, each vector is searched
+    through the LangChain store instead.
+    """
+    pending = list({id(entry): entry for entry in entries if (store_name, k) not in entry["results"]}.values())
+    if pending:
+        store = command_store if store_name == "commands" else vector_store
+        with span("vector_search"):
+            try:
+                collection = _chroma_client.get_collection(COMMAND_COLLECTION if store_name == "commands" else DOCS_COLLECTION)
+                found = collection.query(
+                    query_embeddings=[entry["vector"] for entry in pending], n_results=k, include=["documents", "metadatas"]
+                )
+                results = [
+                    [Document(page_content=text, metadata=metadata or {}) for text, metadata in zip(documents, metadatas)]
+                    for documents, metadatas in zip(found["documents"], found["metadatas"])
+                ]
+            except Exception as e:
+                logging.error(f"Batched search of '{store_name}' failed, searching vector by vector: {e}")
+                results = [[doc for doc, _ in store.similarity_search_by_vector_with_relevance_scores(entry["vector"], k=k)]
+                           for entry in pending]
+        for entry, docs in zip(pending, results):
+            entry["results"][(store_name, k)] = docs
+    return [entry["results"][(store_name, k)] for entry in entries]
+
+def embed_query(query):
+    """Return the (cached) embedding of a query, shared with the retrieval functions."""
+    return _cached_query_entry(query)["vector"]
+
+def get_cache_stats():
+    """Hit/miss counters of the query cache, used to size it."""
+    stats = _query_cache.stats()
+    stats["index_version"] = _query_cache_version
+    return stats
+
+def _format_context(docs):
+    return "\n".join([doc.page_content for doc in docs])
+
+def _format_command_examples(docs):
+    return "\n\n".join(f"Query: {doc.page_content}\nCommand: {doc.metadata.get('command', '')}" for doc in docs)
 
 # Function to retrieve the most relevant context based on a user query
 def retrieve_context(query, k=3):
-    if vector_store is None:
+    if not _index_ready():
         return "Error: Vector store not initialized."
 
     try:
-        corrected_query = correct_typos(query)
-        docs = vector_store.similarity_search(corrected_query, k=k)
-        context = "\n".join([doc.page_content for doc in docs])
-        return context
+        return _format_context(_search("docs", query, k))
     except Exception as e:
         logging.error(f"Retrieval error: {str(e)}")
         return "Error: Could not retrieve context."
 
-# Function to retrieve specific command examples related to the query
+# Function to retrieve the command examples closest to the query from the Query:/Command: sub-index
 def retrieve_command_context(query, k=2):
-    if vector_store is None:
+    if not _index_ready() or command_store is None:
         return ""
 
     try:
-        corrected_query = correct_typos(query)
-        docs = vector_store.similarity_search(corrected_query, k=k)
-        command_docs = [doc for doc in docs if doc.metadata.get("source", "").endswith("k8s_commands.txt")]
-        context = "\n".join([doc.page_content for doc in command_docs])
-        return context
+        return _format_command_examples(_search("commands", query, k))
     except Exception as e:
         logging.error(f"Command retrieval error: {str(e)}")
         return ""
 
-# Initialize the vector store when the module is loaded
-initialize_vector_store()
+# Function to retrieve both prompt sections at once; they share one typo correction and one query embedding
+def retrieve(query, k=3, k_commands=2):
+    return {
+        "context": retrieve_context(query, k=k),
+        "command_examples": retrieve_command_context(query, k=k_commands)
+    }
+
+# Function to retrieve the prompt sections of many queries at once: one batched embedding
+# pass for the queries not cached yet, then one vector search per store for the whole batch
+def retrieve_batch(queries, k=3, k_commands=2):
+    if not _index_ready():
+        return [retrieve(query, k=k, k_commands=k_commands) for query in queries]
+
+    try:
+        entries = _cached_query_entries(queries)
+        contexts = [_format_context(docs) for docs in _search_batch("docs", entries, k)]
+        examples = [""] * len(queries)
+        if command_store is not None:
+            examples = [_format_command_examples(docs) for docs in _search_batch("commands", entries, k_commands)]
+        logging.info(f"Batch retrieval of {len(queries)} queries")
+        return [{"context": context, "command_examples": example} for context, example in zip(contexts, examples)]
+    except Exception as e:
+        # The per-query path reports its own errors for each query
+        logging.error(f"Batch retrieval error, retrieving the queries one by one: {str(e)}")
+        return [retrieve(query, k=k, k_commands=k_commands) for query in queries]
+
@@ -0,0 +1,102 @@
+# app/readiness.py
+
+import logging
+import os
+import threading
+import time
+
+# Set to 0 to build every component on its first use only
+WARMUP_ENABLED = os.environ.get("CHATBOT_WARMUP", "1") == "1"
+# Wait before retrying a failed load, doubled after each further failure up to the maximum
+RETRY_BACKOFF = float(os.environ.get("CHATBOT_COMPONENT_RETRY_BACKOFF", "5"))
+RETRY_BACKOFF_MAX = float(os.environ.get("CHATBOT_COMPONENT_RETRY_BACKOFF_MAX", "300"))
+
+class LazyComponent:
+    """
+    A heavy resource built once, on first use or by the warm-up thread, whichever comes first.
+    Callers arriving while it loads wait for the same load. After a failed load the component
+    reports "failed" and get() raises its error until the backoff delay has passed; the next
+    get() (or the warm-up thread) then loads it again, so a transient failure at startup
+    (model download, locked index) heals without restarting the process.
+    """
+
+    def __init__(self, name, loader, required=True):
+        self.name = name
+        self.required = required
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._value = None
+        self.state = "pending"
+        self.error = None
+        self.load_seconds = None
+        self.failures = 0
+        self.retry_at = None
+
+    def get(self):
+        if self.state == "ready":
+            return self._value
+        with self._lock:
+            if self.state == "pending" or self.state == "failed" and time.monotonic() >= self.retry_at:
+                self.state = "loading"
+                start = time.monotonic()
+                try:
+                    self._value = self._loader()
+                    self.state = "ready"
+                    self.error, self.retry_at = None, None
+                except Exception as e:
+                    self.error = str(e)
+                    self.state = "failed"
+                    self.failures += 1
+                    delay = min(RETRY_BACKOFF * 2 ** (self.failures - 1), RETRY_BACKOFF_MAX)
+                    self.retry_at = time.monotonic() + delay
+                    logging.error(f"Component {self.name} failed to load (attempt {self.failures}, retry in {delay:g}s): {e}")
+                self.load_seconds = round(time.monotonic() - start, 3)
+                if self.state == "ready":
+                    logging.info(f"Component {self.name} loaded in {self.load_seconds}s")
+        if self.state == "failed":
+            raise RuntimeError(f"{self.name} is unavailable: {self.error}")
+        return self._value
+
+    def status(self):
+        retry_in = round(max(self.retry_at - time.monotonic(), 0), 1) if self.state == "failed" else None
+        return {"status": self.state, "required": self.required, "load_seconds": self.load_seconds, "error": self.error,
+                "failures": self.failures, "retry_in": retry_in}
+
+_components = []
+
+def register(name, loader, required=True):
+    """Declare a lazily built component; the warm-up thread loads them in registration order."""
+    component = LazyComponent(name, loader, required)
+    _components.append(component)
+    return component
+
+def _warm_up():
+    # Failed components are retried as their backoff expires: while /readyz reports 503 the
+    # orchestrator sends no traffic, so no request would call get() to retry them
+    while True:
+        for component in list(_components):
+            try:
+                component.get()
+            except Exception:
+                pass  # already logged, reported by status()
+        failed = [c for c in _components if c.state == "failed"]
+        if not failed:
+            return
+        time.sleep(max(min(c.retry_at for c in failed) - time.monotonic(), 0.1))
+
+def warm_up():
+    """
+    Load every registered component in a background thread, retrying failed ones until they
+    load (no-op when CHATBOT_WARMUP=0: failed components are then retried by get() only).
+    """
+    if not WARMUP_ENABLED:
+        return None
+    thread = threading.Thread(target=_warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def status():
+    """(ready, per-component status): ready once every required component has loaded."""
+    components = {component.name: component.status() for component in _components}
+    ready = all(c.state == "ready" for c in _components if c.required)
+    return ready, components
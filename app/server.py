@@ -8,12 +8,21 @@ from flask_limiter.util import get_remote_address
 import logging
 import os
 import json
+import time
 
-from bot import process_user_query_with_llm
-from k8s_executor import execute_command
-from mcp_context import update_context, get_context, get_history, update_history
+from bot import process_user_query_with_llm, process_user_query_single_pass, process_user_queries_batch, get_coalescing_stats
+from answer_cache import answer_cache
+from ollama_client import ollama_client
+from k8s_executor import execute_command_page, execute_command_stream, execute_command_fanout, is_read_only, result_cache
+from mcp_context import (get_history, update_history, get_tool_output, set_pending_command, get_pending_command, pop_pending_command,
+                         save_list_cursor, pop_list_cursor)
 from auth import require_auth, generate_token
-from clusters import cluster_manager
+from clusters import cluster_manager, ALL_CLUSTERS
+from k8s_cache import watch_cache
+from rag import reindex_document, get_cache_stats
+from command_resolver import resolve_command, FAST_PATH_THRESHOLD
+import metrics
+import readiness
 
 app = Flask(__name__)
 
@@ -26,6 +35,8 @@ logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
+# Chaque ligne de log porte l'identifiant de la requête en cours
+metrics.install_log_context()
 
 limiter = Limiter(
     app=app,
@@ -33,17 +44,59 @@ limiter = Limiter(
     default_limits=["300 per day", "100 per hour"]
 )
 
-def store_pending_command(session_id, command, cluster, query):
-    context = get_context(session_id)
-    if not isinstance(context, dict): context = {}
-    context['pending_command'] = {"command": command, "cluster": cluster, "original_query": query}
-    update_context(context, session_id)
+# Modèle d'embeddings, dictionnaire et index se chargent en arrière-plan : le serveur répond tout de suite,
+# seules les requêtes qui en ont besoin attendent la fin de leur chargement
+readiness.warm_up()
 
-def clear_pending_command(session_id):
-    context = get_context(session_id)
-    if isinstance(context, dict) and 'pending_command' in context:
-        del context['pending_command']
-    update_context(context, session_id)
+# Nombre maximal de requêtes acceptées par /chat/batch
+BATCH_MAX_QUERIES = int(os.environ.get("CHATBOT_BATCH_MAX_QUERIES", "100"))
+
+@app.before_request
+def start_request_metrics():
+    # L'identifiant fourni par un proxy (X-Request-ID) est repris, sinon on en génère un
+    request.request_id = metrics.start_request(request.headers.get('X-Request-ID'))
+    request.started_at = time.perf_counter()
+
+@app.after_request
+def finish_request_metrics(response):
+    response.headers['X-Request-ID'] = request.request_id
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    method, path, started_at = request.method, request.path, request.started_at
+
+    # Appelé une fois le corps envoyé : la durée d'une réponse streamée est comptée en entier
+    def on_close():
+        elapsed = time.perf_counter() - started_at
+        metrics.request_duration.observe(elapsed, endpoint=endpoint, method=method, status=response.status_code)
+        stages = ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in metrics.request_stages().items())
+        if endpoint != "/metrics":
+            logging.info(f"{method} {path} {response.status_code} in {elapsed * 1000:.0f} ms" + (f" ({stages})" if stages else ""))
+    response.call_on_close(on_close)
+    return response
+
+def cluster_label(cluster):
+    """Nom lisible de la cible : un cluster, plusieurs, ou tous."""
+    if cluster == ALL_CLUSTERS:
+        return "all clusters"
+    return (cluster or "default").replace(",", ", ")
+
+def pending_confirmation_response(session_id, command, explanation, cluster, query):
+    if cluster_manager.fanout_targets(cluster) is not None and not is_read_only(command):
+        return jsonify({"response": f"`{command}` changes the cluster: it can only run on one cluster at a time. Please pick a single cluster.",
+                        "action": "error"})
+    set_pending_command(session_id, command, cluster, query)
+    response_text = (
+        f"Suggested command: `{command}`\n"
+        f"Explanation: {explanation}\n"
+        f"(Cluster: {cluster_label(cluster)})\n\n"
+        "Do you want to execute this command?"
+    )
+    return jsonify({
+        "response": response_text,
+        "action": "pending_confirmation",
+        "command": command,
+        "cluster": cluster,
+        "original_query": query
+    })
 
 @app.route('/')
 def index():
@@ -71,38 +124,46 @@ def chat():
     if not user_input:
         return jsonify({"response": "Please enter a message.", "action": "general"})
 
+    # Chemin rapide : les demandes de commande sans ambiguïté sont résolues sans appeler le LLM
+    resolved = resolve_command(user_input)
+    if resolved["command"] and resolved["confidence"] >= FAST_PATH_THRESHOLD:
+        # "on all clusters" / "on clusters a, b" : exécution répartie sur plusieurs contextes
+        if resolved["clusters"]:
+            cluster = ALL_CLUSTERS if resolved["clusters"] == "all" else ",".join(resolved["clusters"])
+        elif resolved["cluster"] in cluster_manager.list_clusters():
+            cluster = resolved["cluster"]
+        logging.info(f"Fast path resolved '{user_input}' to '{resolved['command']}' (confidence {resolved['confidence']})")
+        return pending_confirmation_response(session_id, resolved["command"], resolved["explanation"], cluster, user_input)
+
     conversation_history = get_history(session_id)
-    query_with_context = f"{user_input} (on cluster: {cluster})"
+    query_with_context = f"{user_input} (on cluster: {cluster_label(cluster)})"
 
-    # D'abord, on appelle en mode non-stream pour voir si c'est une commande
-    llm_response = process_user_query_with_llm(query_with_context, conversation_history, stream=False)
+    # En mode stream, une seule génération décide commande/réponse et streame la réponse.
+    if stream:
+        llm_response = process_user_query_single_pass(query_with_context, conversation_history, cluster=cluster, session_id=session_id)
+    else:
+        llm_response = process_user_query_with_llm(query_with_context, conversation_history, cluster=cluster, session_id=session_id)
     response_type = llm_response.get("type")
 
     if response_type == "command":
-        command = llm_response.get("command")
-        explanation = llm_response.get("explanation")
-        store_pending_command(session_id, command, cluster, user_input)
-        response_text = (
-            f"Suggested command: `{command}`\n"
-            f"Explanation: {explanation}\n"
-            f"(Cluster: {cluster})\n\n"
-            "Do you want to execute this command?"
-        )
-        return jsonify({
-            "response": response_text,
-            "action": "pending_confirmation",
-            "command": command,
-            "cluster": cluster,
-            "original_query": user_input
-        })
-
-    # Si ce n'est pas une commande et que le client veut un stream, on le fait.
-    if stream:
+        return pending_confirmation_response(session_id, llm_response.get("command"), llm_response.get("explanation"), cluster, user_input)
+
+    # Si ce n'est pas une commande et que le client veut un stream, on relaie la génération en cours.
+    if stream and "stream" in llm_response:
         def stream_generator():
+            # Si le client se déconnecte, le serveur WSGI ferme ce générateur : on ferme alors
+            # la génération en amont pour libérer tout de suite le créneau Ollama.
             full_response = []
-            for chunk in process_user_query_with_llm(query_with_context, conversation_history, stream=True):
-                full_response.append(chunk)
-                yield f"data: {json.dumps({'chunk': chunk})}\n\n"
+            completed = False
+            try:
+                for chunk in llm_response["stream"]:
+                    full_response.append(chunk)
+                    yield f"data: {json.dumps({'chunk': chunk})}\n\n"
+                completed = True
+            finally:
+                llm_response["stream"].close()
+                if not completed:
+                    logging.info(f"Client left the stream for session {session_id}, upstream generation cancelled.")
             
             final_answer = "".join(full_response)
             update_history(session_id, user_input, final_answer)
@@ -116,6 +177,62 @@ def chat():
         update_history(session_id, user_input, answer)
         return jsonify({"response": answer, "action": "general"})
 
+def batch_item(query, cluster, llm_response):
+    """Résultat d'une requête du lot ; les commandes sont proposées, jamais exécutées."""
+    if llm_response.get("type") == "command":
+        return {"query": query, "action": "command", "command": llm_response.get("command"),
+                "explanation": llm_response.get("explanation"), "cluster": cluster}
+    return {"query": query, "action": "general",
+            "response": llm_response.get("answer", "I'm sorry, I had trouble understanding that.")}
+
+def batch_results(queries, cluster):
+    """(index, résultat) de chaque requête du lot, dans l'ordre d'achèvement : chemin rapide d'abord, puis le LLM."""
+    llm_indexes, llm_queries = [], []
+    for index, query in enumerate(queries):
+        resolved = resolve_command(query)
+        if resolved["command"] and resolved["confidence"] >= FAST_PATH_THRESHOLD:
+            yield index, batch_item(query, cluster, {"type": "command", "command": resolved["command"], "explanation": resolved["explanation"]})
+        else:
+            llm_indexes.append(index)
+            llm_queries.append(f"{query} (on cluster: {cluster_label(cluster)})")
+    if llm_queries:
+        for position, llm_response in process_user_queries_batch(llm_queries, cluster=cluster):
+            index = llm_indexes[position]
+            yield index, batch_item(queries[index], cluster, llm_response)
+
+@app.route('/chat/batch', methods=['POST'])
+@limiter.limit("5 per minute")
+@require_auth
+def chat_batch():
+    data = request.get_json() or {}
+    messages = data.get('messages')
+    cluster = data.get('cluster', 'default')
+    stream = data.get('stream', False)
+
+    if not isinstance(messages, list) or not messages or not all(isinstance(m, str) and m.strip() for m in messages):
+        return jsonify({"error": "A non-empty list of messages is required."}), 400
+    if len(messages) > BATCH_MAX_QUERIES:
+        return jsonify({"error": f"At most {BATCH_MAX_QUERIES} messages per batch."}), 400
+    queries = [m.strip() for m in messages]
+    logging.info(f"User {request.user_id} sent a batch of {len(queries)} queries")
+
+    # En mode stream, chaque résultat part dès qu'il est prêt, avec son index dans le lot
+    if stream:
+        def stream_generator():
+            results = batch_results(queries, cluster)
+            try:
+                for index, item in results:
+                    yield f"data: {json.dumps(dict(item, index=index))}\n\n"
+                yield f"data: {json.dumps({'done': True, 'count': len(queries)})}\n\n"
+            finally:
+                results.close()
+        return Response(stream_generator(), mimetype='text/event-stream')
+
+    results = [None] * len(queries)
+    for index, item in batch_results(queries, cluster):
+        results[index] = item
+    return jsonify({"results": results, "action": "batch"})
+
 @app.route('/regenerate', methods=['POST'])
 @limiter.limit("20 per minute")
 @require_auth
@@ -127,29 +244,55 @@ def regenerate():
 
     if not original_query: return jsonify({"error": "Original query is required."}), 400
 
-    llm_response = process_user_query_with_llm(f"{original_query} (on cluster: {cluster})")
+    llm_response = process_user_query_with_llm(f"{original_query} (on cluster: {cluster_label(cluster)})", cluster=cluster, use_cache=False)
 
     if llm_response.get("type") == "command":
-        command = llm_response.get("command")
-        explanation = llm_response.get("explanation")
-        store_pending_command(session_id, command, cluster, original_query)
-        response_text = (
-            f"Suggested command: `{command}`\n"
-            f"Explanation: {explanation}\n"
-            f"(Cluster: {cluster})\n\n"
-            "Do you want to execute this command?"
-        )
-        return jsonify({
-            "response": response_text,
-            "action": "pending_confirmation",
-            "command": command,
-            "cluster": cluster,
-            "original_query": original_query
-        })
+        return pending_confirmation_response(session_id, llm_response.get("command"), llm_response.get("explanation"), cluster, original_query)
     else:
         return jsonify({"response": "I couldn't find another command for that request.", "action": "general"})
 
 
+def command_stream_generator(session_id, command, cluster, user_query):
+    """Sortie de la commande ligne par ligne en SSE, puis un événement final avec le code de retour."""
+    events = execute_command_stream(command, cluster=cluster)
+    output = []
+    try:
+        yield f"data: {json.dumps({'command': command, 'cluster': cluster})}\n\n"
+        for event in events:
+            if event is None:
+                # Commentaire SSE pendant les silences : une écriture vers un client parti
+                # échoue, ce qui ferme ce générateur et arrête le processus kubectl.
+                yield ": keep-alive\n\n"
+                continue
+            if "line" in event:
+                output.append(event["line"])
+            elif event.get("truncated"):
+                output.append(f"[stopped: {event['truncated']}]")
+            yield f"data: {json.dumps(event)}\n\n"
+    finally:
+        events.close()
+        result = "\n".join(output).strip() or "Command executed successfully. No output was produced."
+        update_history(session_id, user_query, f"Executed: `{command}`", tool_output=result)
+
+def merge_fanout_results(results):
+    """Sorties de chaque cluster, l'une après l'autre sous un titre."""
+    return "\n\n".join(f"=== {r['cluster']} ({r['status']}, {r['elapsed_ms']} ms) ===\n{r['output']}" for r in results)
+
+def fanout_stream_generator(session_id, command, targets, user_query):
+    """Un événement SSE par cluster, dans l'ordre où ils terminent, puis un bilan."""
+    results = execute_command_fanout(command, targets)
+    finished = []
+    try:
+        yield f"data: {json.dumps({'command': command, 'clusters': targets})}\n\n"
+        for result in results:
+            finished.append(result)
+            yield f"data: {json.dumps(result)}\n\n"
+        counts = {status: sum(r["status"] == status for r in finished) for status in ("ok", "error", "timeout")}
+        yield f"data: {json.dumps({'done': True, 'summary': counts})}\n\n"
+    finally:
+        results.close()
+        update_history(session_id, user_query, f"Executed on {len(targets)} clusters: `{command}`", tool_output=merge_fanout_results(finished))
+
 @app.route('/confirm', methods=['POST'])
 @limiter.limit("20 per minute")
 @require_auth
@@ -158,24 +301,105 @@ def confirm():
     session_id = data.get('session_id', 'local-session')
     user_confirmation = data.get('confirm', '').strip().lower()
 
-    context = get_context(session_id)
-    pending = context.get('pending_command') if isinstance(context, dict) else None
+    if user_confirmation not in ("yes", "no"):
+        if not get_pending_command(session_id): return jsonify({"response": "Error: No pending command found.", "action": "error"})
+        return jsonify({"response": "Invalid input. Please respond with 'Yes' or 'No'.", "action": "error"})
+
+    # Retrait atomique : une double confirmation n'exécute la commande qu'une seule fois
+    pending = pop_pending_command(session_id)
     if not pending: return jsonify({"response": "Error: No pending command found.", "action": "error"})
 
     command, cluster, user_query = pending['command'], pending['cluster'], pending['original_query']
+    targets = cluster_manager.fanout_targets(cluster)
+
+    if user_confirmation == "yes" and targets is not None:
+        if data.get('stream', False):
+            return Response(fanout_stream_generator(session_id, command, targets, user_query), mimetype='text/event-stream')
+        results = list(execute_command_fanout(command, targets))
+        merged = merge_fanout_results(results)
+        update_history(session_id, user_query, f"Executed on {len(targets)} clusters: `{command}`", tool_output=merged)
+        return jsonify({"response": merged, "action": "executed", "results": results})
 
+    if user_confirmation == "yes" and data.get('stream', False):
+        return Response(command_stream_generator(session_id, command, cluster, user_query), mimetype='text/event-stream')
     if user_confirmation == "yes":
-        result = execute_command(command, cluster=cluster)
-        clear_pending_command(session_id)
-        update_history(session_id, user_query, f"Executed: `{command}`\nResult: {result}")
-        return jsonify({"response": result, "action": "executed"})
-    elif user_confirmation == "no":
+        # Les listes arrivent par pages : la première tout de suite, la suite via /cursor/<id>
+        result, continue_token = execute_command_page(command, cluster=cluster)
+        cursor = save_list_cursor(session_id, command, cluster, continue_token, page=2) if continue_token else None
+        history_output = result if cursor is None else f"{result}\n[page 1, more results behind cursor #{cursor}]"
+        update_history(session_id, user_query, f"Executed: `{command}`", tool_output=history_output)
+        return jsonify({"response": result, "action": "executed", "next_cursor": cursor})
+    else:
         response_text = "Command not executed. What would you like to do next?"
-        clear_pending_command(session_id)
         update_history(session_id, user_query, response_text)
         return jsonify({"response": response_text, "action": "cancelled"})
-    else:
-        return jsonify({"response": "Invalid input. Please respond with 'Yes' or 'No'.", "action": "error"})
+
+@app.route('/cursor/<int:cursor_id>', methods=['GET'])
+@require_auth
+def next_page(cursor_id):
+    """Page suivante d'une liste paginée de la session ; chaque curseur n'est utilisable qu'une fois."""
+    session_id = request.args.get('session_id', 'local-session')
+    cursor = pop_list_cursor(session_id, cursor_id)
+    if cursor is None: return jsonify({"error": f"Cursor #{cursor_id} not found or expired."}), 404
+
+    result, continue_token = execute_command_page(cursor["command"], cluster=cursor["cluster"], continue_token=cursor["continue_token"])
+    next_cursor = save_list_cursor(session_id, cursor["command"], cursor["cluster"], continue_token, page=cursor["page"] + 1) if continue_token else None
+    return jsonify({"response": result, "action": "executed", "page": cursor["page"], "next_cursor": next_cursor})
+
+@app.route('/tool_output/<int:output_id>', methods=['GET'])
+@require_auth
+def tool_output(output_id):
+    session_id = request.args.get('session_id', 'local-session')
+    content = get_tool_output(session_id, output_id)
+    if content is None: return jsonify({"error": f"Output #{output_id} not found."}), 404
+    return jsonify({"response": content, "action": "tool_output"})
+
+@app.route('/reindex', methods=['POST'])
+@require_auth
+def reindex():
+    data = request.get_json()
+    document = data.get('document', '').strip()
+    if not document: return jsonify({"error": "Document name is required."}), 400
+    if not document.endswith('.txt'): return jsonify({"error": "Only .txt documents can be indexed."}), 400
+
+    if not reindex_document(document):
+        return jsonify({"error": f"Failed to re-index {document}."}), 500
+    logging.info(f"User {request.user_id} re-indexed document {document}")
+    return jsonify({"response": f"Document {document} re-indexed.", "action": "reindexed"})
+
+@app.route('/stats', methods=['GET'])
+@require_auth
+def stats():
+    return jsonify({"rag_cache": get_cache_stats(), "answer_cache": answer_cache.stats(),
+                    "ollama": ollama_client.stats(), "coalescing": get_coalescing_stats(),
+                    "watch_cache": watch_cache.stats(), "result_cache": result_cache.stats()})
+
+def component_status():
+    """(prêt, état de chaque composant) ; le kubeconfig est relu à chaque appel et n'est pas bloquant."""
+    ready, components = readiness.status()
+    contexts = cluster_manager.list_clusters()
+    components["kubeconfig"] = {"status": "ready" if contexts else "failed", "required": False, "contexts": len(contexts)}
+    return ready, components
+
+@app.route('/healthz', methods=['GET'])
+@limiter.exempt
+def healthz():
+    """Sonde de vie : le processus répond, quel que soit l'état des composants."""
+    _, components = component_status()
+    return jsonify({"status": "ok", "components": components})
+
+@app.route('/readyz', methods=['GET'])
+@limiter.exempt
+def readyz():
+    """Sonde de disponibilité : 503 tant qu'un composant requis n'est pas chargé."""
+    ready, components = component_status()
+    return jsonify({"ready": ready, "components": components}), 200 if ready else 503
+
+@app.route('/metrics', methods=['GET'])
+@limiter.exempt
+def prometheus_metrics():
+    """Histogrammes de latence par étape, par endpoint et compteurs Ollama, au format Prometheus."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == "__main__":
     app.run(debug=False, host='0.0.0.0', port=5000)
@@ -0,0 +1,134 @@
+# app/singleflight.py
+
+import logging
+import threading
+import time
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time: callers arriving while a computation
+    for the same key is in flight wait for it and share its result instead of redoing it.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+class TokenBroadcast:
+    """
+    Fans one upstream token stream out to any number of subscribers. A background thread
+    pumps the source; subscribers joining late first replay the tokens already produced.
+    The source is closed as soon as every subscriber has left, or when subscriptions handed
+    out were not consumed within `join_grace` seconds, so abandoned generations are
+    cancelled upstream.
+    """
+
+    def __init__(self, source, on_finish=None, join_grace=5.0):
+        self._source = source
+        self._on_finish = on_finish
+        self._join_grace = join_grace
+        self._tokens = []
+        self._done = False
+        self._subscribers = 0   # subscriptions being consumed
+        self._pending = 0       # subscriptions handed out but not started yet
+        self._ever_started = False
+        self._last_subscribe = time.monotonic()
+        self._cond = threading.Condition()
+        threading.Thread(target=self._pump, daemon=True).start()
+
+    @property
+    def finished(self):
+        return self._done
+
+    def _abandoned(self):
+        if self._subscribers:
+            return False
+        waited = time.monotonic() - self._last_subscribe
+        if self._pending and waited < self._join_grace:
+            return False
+        return self._ever_started or waited > self._join_grace
+
+    def _pump(self):
+        try:
+            for token in self._source:
+                with self._cond:
+                    if self._abandoned():
+                        logging.info("All subscribers left the shared stream, cancelling the upstream generation.")
+                        break
+                    self._tokens.append(token)
+                    self._cond.notify_all()
+        except Exception as e:
+            logging.error(f"Shared stream source failed: {e}")
+        finally:
+            self._source.close()
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+            if self._on_finish:
+                self._on_finish()
+
+    def subscribe(self):
+        """Return a generator over the full token stream (replayed from the start)."""
+        with self._cond:
+            self._pending += 1
+            self._last_subscribe = time.monotonic()
+        return self._iterate()
+
+    def _iterate(self):
+        with self._cond:
+            self._pending -= 1
+            self._subscribers += 1
+            self._ever_started = True
+        index = 0
+        try:
+            while True:
+                with self._cond:
+                    while index >= len(self._tokens) and not self._done:
+                        self._cond.wait()
+                    if index >= len(self._tokens):
+                        return
+                    token = self._tokens[index]
+                index += 1
+                yield token
+        finally:
+            with self._cond:
+                self._subscribers -= 1
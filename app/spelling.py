@@ -0,0 +1,136 @@
+# app/spelling.py
+
+import logging
+import os
+import re
+from collections import Counter
+
+from cache import TTLCache
+from nlp_parser2 import K8S_COMMAND_VERBS, K8S_RESOURCES
+
+# Words that must never be "corrected": kubectl vocabulary and common short names
+PROTECTED_WORDS = set(K8S_COMMAND_VERBS) | set(K8S_RESOURCES) | {
+    "kubectl", "k8s", "kube", "kubernetes", "namespace", "namespaces", "cluster", "clusters",
+    "yaml", "json", "replicas", "rollout", "scale", "context", "config", "label", "labels",
+    "container", "containers", "image", "port", "ports", "helm", "ingress", "hpa", "rbac",
+}
+
+# Tokens containing digits or separators are Kubernetes names, flags, paths or selectors
+# (e.g. jenkins-orange-65659745d5-4sprj, -n, app=web, ./app.yaml): edit distance is meaningless there.
+_IDENTIFIER_RE = re.compile(r"[0-9/_.:=@\-]")
+_WORD_RE = re.compile(r"[a-zà-ÿ]+")
+_PUNCTUATION = "\"'`.,;:!?()[]{}<>"
+
+class TypoCorrector:
+    """
+    Typo correction tuned for Kubernetes questions.
+    Known words and identifiers are skipped outright; the remaining words are matched against a
+    domain vocabulary built from the docs corpus with a symmetric-delete index, and only then
+    (optionally) against a general dictionary. Every word's correction is memoized.
+    """
+
+    def __init__(self, docs_dir="docs/", dictionary=None, max_distance=2, memo_size=10000):
+        self.docs_dir = docs_dir
+        self.dictionary = dictionary
+        self.max_distance = max_distance
+        self._memo = TTLCache(maxsize=memo_size, ttl=float("inf"))
+        self.vocabulary = Counter()
+        self._deletes = {}
+        self.load_vocabulary()
+
+    def load_vocabulary(self):
+        """(Re)build the domain vocabulary from the docs directory and the parser keyword lists."""
+        vocabulary = Counter({word: 1 for word in PROTECTED_WORDS if word.isalpha()})
+        if os.path.isdir(self.docs_dir):
+            for name in sorted(os.listdir(self.docs_dir)):
+                if not name.endswith(".txt"):
+                    continue
+                try:
+                    with open(os.path.join(self.docs_dir, name), "r", encoding="utf-8") as f:
+                        vocabulary.update(word for word in _WORD_RE.findall(f.read().lower()) if len(word) > 2)
+                except Exception as e:
+                    logging.error(f"Could not read {name} for the spelling vocabulary: {e}")
+
+        deletes = {}
+        for word in vocabulary:
+            for variant in self._delete_variants(word):
+                deletes.setdefault(variant, []).append(word)
+        self.vocabulary, self._deletes = vocabulary, deletes
+        self._memo.clear()
+        logging.info(f"Spelling vocabulary loaded: {len(vocabulary)} words, {len(deletes)} delete variants")
+
+    def _delete_variants(self, word):
+        variants, frontier = {word}, {word}
+        for _ in range(self._distance_for(word)):
+            frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+            variants |= frontier
+        return variants
+
+    def _distance_for(self, word):
+        # One edit on short words already changes their meaning too often
+        return 1 if len(word) < 6 else self.max_distance
+
+    def _should_skip(self, word):
+        return (
+            len(word) <= 2
+            or word in PROTECTED_WORDS
+            or word in self.vocabulary
+            or _IDENTIFIER_RE.search(word) is not None
+            or not word.isalpha()
+        )
+
+    def correct_word(self, word):
+        """Return the corrected form of a single token, keeping surrounding punctuation."""
+        cached = self._memo.get(word)
+        if cached is not None:
+            return cached
+
+        core = word.strip(_PUNCTUATION)
+        lower = core.lower()
+        corrected = word
+        if core and not self._should_skip(lower) and not (self.dictionary and self.dictionary.known([lower])):
+            replacement = self._domain_candidate(lower)
+            if replacement is None and self.dictionary is not None:
+                replacement = self.dictionary.correction(lower)
+            if replacement and replacement != lower:
+                corrected = word.replace(core, replacement, 1)
+
+        self._memo.set(word, corrected)
+        return corrected
+
+    def _domain_candidate(self, word):
+        distance = self._distance_for(word)
+        candidates = set()
+        for variant in self._delete_variants(word):
+            candidates.update(self._deletes.get(variant, ()))
+        best = None
+        for candidate in candidates:
+            d = _edit_distance(word, candidate, distance)
+            if d <= distance:
+                rank = (d, -self.vocabulary[candidate], candidate)
+                if best is None or rank < best:
+                    best = rank
+        return best[2] if best else None
+
+    def correct(self, query):
+        return " ".join(self.correct_word(word) for word in query.split())
+
+    def stats(self):
+        return self._memo.stats()
+
+def _edit_distance(a, b, limit):
+    """Optimal string alignment distance, stopping early once it exceeds `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
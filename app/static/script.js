@@ -76,6 +76,57 @@ function addToHistory(command) {
     commandHistory.innerHTML = commandHistoryArray.map(cmd => `<div class="p-1 border-b border-gray-700">${cmd}</div>`).join('');
 }
 
+// Lit un flux SSE et appelle onEvent pour chaque événement "data:" complet.
+// Un événement peut être coupé entre deux lectures : le reste est gardé dans le tampon.
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+
+        for (const event of events) {
+            if (!event.startsWith('data:')) continue; // commentaires de keep-alive
+            const jsonData = event.substring(5);
+            try {
+                onEvent(JSON.parse(jsonData));
+            } catch (e) {
+                console.error("Error parsing stream data:", e, jsonData);
+            }
+        }
+    }
+}
+
+// Affiche la sortie d'une commande au fil de l'eau (texte brut, sans interprétation HTML).
+async function streamCommandOutput(response) {
+    const messageDiv = addMessage("", false, true);
+    const outputDiv = messageDiv.querySelector('.command-output');
+    outputDiv.style.whiteSpace = 'pre-wrap';
+
+    await readEventStream(response, (data) => {
+        if (data.command) {
+            addToHistory(data.command);
+        } else if (data.line !== undefined) {
+            outputDiv.textContent += data.line + '\n';
+        } else if (data.cluster !== undefined) {
+            // Exécution sur plusieurs clusters : un bloc par cluster, dans l'ordre d'arrivée
+            outputDiv.textContent += `=== ${data.cluster} (${data.status}, ${data.elapsed_ms} ms) ===\n${data.output}\n\n`;
+        } else if (data.done) {
+            if (data.summary) outputDiv.textContent += `[${data.summary.ok} ok, ${data.summary.error} failed, ${data.summary.timeout} timed out]\n`;
+            else if (data.truncated) outputDiv.textContent += `[stopped: ${data.truncated}]\n`;
+            else if (data.exit_code) outputDiv.textContent += `[exit code ${data.exit_code}]\n`;
+            if (!outputDiv.textContent) outputDiv.textContent = 'Command executed successfully. No output was produced.';
+        }
+        chatContainer.scrollTop = chatContainer.scrollHeight;
+    });
+}
+
 async function sendMessage() {
     const message = userInput.value.trim();
     if (!message) return;
@@ -106,32 +157,16 @@ async function sendMessage() {
         }
 
         // Gère les réponses en streaming (text/event-stream)
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
         let botMessageDiv = addMessage("", false); // Crée un conteneur vide pour la réponse
         let fullResponse = "";
 
-        while (true) {
-            const { value, done } = await reader.read();
-            if (done) break;
-
-            const textChunk = decoder.decode(value, { stream: true });
-            const eventLines = textChunk.split('\n\n').filter(line => line.startsWith('data:'));
-            
-            for (const line of eventLines) {
-                const jsonData = line.substring(5);
-                try {
-                    const data = JSON.parse(jsonData);
-                    if (data.chunk) {
-                        fullResponse += data.chunk;
-                        botMessageDiv.innerHTML = fullResponse.replace(/`([^`]+)`/g, '<code>$1</code>').replace(/\n/g, '<br>');
-                        chatContainer.scrollTop = chatContainer.scrollHeight;
-                    }
-                } catch (e) {
-                    console.error("Error parsing stream data:", e, jsonData);
-                }
+        await readEventStream(response, (data) => {
+            if (data.chunk) {
+                fullResponse += data.chunk;
+                botMessageDiv.innerHTML = fullResponse.replace(/`([^`]+)`/g, '<code>$1</code>').replace(/\n/g, '<br>');
+                chatContainer.scrollTop = chatContainer.scrollHeight;
             }
-        }
+        });
     } catch (error) {
         removeTypingAnimation();
         addMessage('Error: Could not connect to the server.', false);
@@ -157,10 +192,14 @@ chatContainer.addEventListener('click', async (e) => {
             const response = await fetch('/confirm', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
-                body: JSON.stringify({ confirm: confirmValue, session_id: sessionId })
+                body: JSON.stringify({ confirm: confirmValue, session_id: sessionId, stream: true })
             });
-            const data = await response.json();
             removeTypingAnimation();
+            if (response.headers.get("Content-Type").includes("text/event-stream")) {
+                await streamCommandOutput(response);
+                return;
+            }
+            const data = await response.json();
             addMessage(data.response, false, data.action === 'executed');
             if (data.action === 'executed') {
                 const commandText = data.response.match(/`([^`]+)`/);
@@ -0,0 +1,54 @@
+# app/test_answer_cache.py
+
+import answer_cache
+from answer_cache import SemanticAnswerCache, replay_stream
+
+def test_similar_query_above_threshold_is_a_hit():
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store([1.0, 0.0, 0.0], "prod", 1, "A pod is the smallest deployable unit.")
+    # cosine similarity 0.995 with the stored vector
+    assert cache.lookup([1.0, 0.1, 0.0], "prod", 1) == "A pod is the smallest deployable unit."
+    assert cache.stats()["hits"] == 1
+
+def test_query_below_threshold_is_a_miss():
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store([1.0, 0.0, 0.0], "prod", 1, "answer")
+    # cosine similarity 0.707
+    assert cache.lookup([1.0, 1.0, 0.0], "prod", 1) is None
+    assert cache.stats()["misses"] == 1
+
+def test_most_similar_entry_wins():
+    cache = SemanticAnswerCache(threshold=0.5)
+    cache.store([1.0, 0.0], "prod", 1, "first")
+    cache.store([0.8, 0.6], "prod", 1, "second")
+    assert cache.lookup([0.7, 0.7], "prod", 1) == "second"
+
+def test_entries_are_scoped_by_cluster_and_index_version():
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store([1.0, 0.0], "prod", 1, "answer")
+    assert cache.lookup([1.0, 0.0], "staging", 1) is None
+    assert cache.lookup([1.0, 0.0], "prod", 2) is None
+    assert cache.lookup([1.0, 0.0], "prod", 1) == "answer"
+
+def test_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    cache = SemanticAnswerCache(threshold=0.9, ttl=60)
+    cache.store([1.0, 0.0], "prod", 1, "answer")
+    now[0] += 61
+    assert cache.lookup([1.0, 0.0], "prod", 1) is None
+    assert cache.stats()["size"] == 0
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticAnswerCache(threshold=0.99, maxsize=2)
+    cache.store([1.0, 0.0, 0.0], "prod", 1, "x")
+    cache.store([0.0, 1.0, 0.0], "prod", 1, "y")
+    assert cache.lookup([1.0, 0.0, 0.0], "prod", 1) == "x"
+    cache.store([0.0, 0.0, 1.0], "prod", 1, "z")
+    assert cache.lookup([0.0, 1.0, 0.0], "prod", 1) is None
+    assert cache.lookup([1.0, 0.0, 0.0], "prod", 1) == "x"
+    assert cache.stats()["evictions"] == 1
+
+def test_replay_stream_rebuilds_the_answer():
+    answer = "A pod  groups\ncontainers."
+    assert "".join(replay_stream(answer)) == answer
@@ -0,0 +1,53 @@
+# app/test_cache.py
+
+import cache
+from cache import TTLCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_get_returns_stored_value_and_counts_hits():
+    c = TTLCache(maxsize=2, ttl=60)
+    c.set("a", 1)
+    assert c.get("a") == 1
+    assert c.get("missing", "default") == "default"
+    assert (c.hits, c.misses) == (1, 1)
+
+def test_least_recently_used_entry_is_evicted():
+    c = TTLCache(maxsize=2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")          # "b" is now the least recently used
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert c.get("a") == 1 and c.get("c") == 3
+    assert c.evictions == 1
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    c = TTLCache(maxsize=4, ttl=10)
+    c.set("a", 1)
+    c.set("b", 2, ttl=30)
+    clock.now += 11
+    assert c.get("a") is None
+    assert c.get("b") == 2
+    assert c.expirations == 1
+
+def test_falsy_values_are_cached():
+    c = TTLCache(maxsize=4, ttl=60)
+    c.set("empty", "")
+    assert c.get("empty", "default") == ""
+
+def test_pop_and_invalidate():
+    c = TTLCache(maxsize=8, ttl=60)
+    for key in [("ctx1", "dev"), ("ctx1", "prod"), ("ctx2", "dev")]:
+        c.set(key, key[1])
+    assert c.pop(("ctx2", "dev")) == "dev"
+    assert c.pop(("ctx2", "dev"), "gone") == "gone"
+    assert c.invalidate(lambda key: key[0] == "ctx1") == 2
+    assert c.get(("ctx1", "dev")) is None
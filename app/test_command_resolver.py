@@ -0,0 +1,80 @@
+# app/test_command_resolver.py
+
+import os
+
+import pytest
+
+from bench import resolver_eval
+from command_resolver import FAST_PATH_THRESHOLD, is_conceptual_question, normalize_command, resolve_command
+
+def _fast_path(query):
+    resolved = resolve_command(query)
+    return resolved["command"] if resolved["command"] and resolved["confidence"] >= FAST_PATH_THRESHOLD else None
+
+@pytest.mark.parametrize("query, command", [
+    ("show services", "kubectl get svc"),
+    ("list pods in codep-orange", "kubectl get pods -n codep-orange"),
+    ("kubectl get pods -A", "kubectl get pods --all-namespaces"),
+    ("list nodes in dev", "kubectl get nodes"),
+    ("describe pod jenkins-orange-65659745d5-4sprj in codep-orange",
+     "kubectl describe pod jenkins-orange-65659745d5-4sprj -n codep-orange"),
+    ("logs of pod my-app-7d9f8-abcde", "kubectl logs my-app-7d9f8-abcde"),
+    ("get pods -o wide -n dev", "kubectl get pods -n dev -o wide"),
+    ("get pods -o=json", "kubectl get pods -o json"),
+    ("get pods -o jsonpath={.items[*].metadata.name}", "kubectl get pods -o jsonpath={.items[*].metadata.name}"),
+    ("show deployment my-app as json", "kubectl get deployment my-app -o json"),
+    ("get pods --selector app=web in codep-orange", "kubectl get pods -n codep-orange -l app=web"),
+    ("get pods -l app=web,tier!=db", "kubectl get pods -l app=web,tier!=db"),
+])
+def test_fast_path_commands(query, command):
+    assert _fast_path(query) == command
+
+@pytest.mark.parametrize("query", [
+    "what is a pod?",
+    "comment fonctionne un service ?",
+    "hello",
+    "",
+    "show pods that are not running",
+    "show pods and services",
+])
+def test_ambiguous_or_conceptual_queries_go_to_the_llm(query):
+    assert _fast_path(query) is None
+
+@pytest.mark.parametrize("query", ["get pods -o yaml;", "get pods -o foo", "get pods -l app=web;rm", "get pods -l =web"])
+def test_invalid_flag_values_are_not_fast_pathed(query):
+    resolved = resolve_command(query)
+    assert resolved["confidence"] < FAST_PATH_THRESHOLD
+    assert resolved["command"] is None or (" -o " not in resolved["command"] and " -l " not in resolved["command"])
+
+@pytest.mark.parametrize("query, command", [
+    ("remove the kube-system namespace", "kubectl delete namespace kube-system"),
+    ("delete pod my-app-7d9f8-abcde", "kubectl delete pod my-app-7d9f8-abcde"),
+    ("scale deployment backend to 3 replicas", "kubectl scale deployment backend --replicas=3"),
+    ("restart deployment frontend", "kubectl rollout restart deployment frontend"),
+])
+def test_mutating_commands_are_resolved_but_never_fast_pathed(query, command):
+    resolved = resolve_command(query)
+    assert resolved["command"] == command
+    assert resolved["confidence"] < FAST_PATH_THRESHOLD
+
+def test_cluster_targets_are_extracted():
+    assert resolve_command("list pods on cluster prod")["cluster"] == "prod"
+    assert resolve_command("get pods on all clusters")["clusters"] == "all"
+    assert resolve_command("get pods on clusters a, b")["clusters"] == ["a", "b"]
+
+def test_conceptual_questions():
+    assert is_conceptual_question("How do I scale a deployment?")
+    assert is_conceptual_question("pourquoi mon pod redémarre")
+    assert not is_conceptual_question("get pods")
+
+def test_normalize_command_unifies_namespace_flags_and_resource_aliases():
+    assert normalize_command("kubectl get po -n dev") == normalize_command("kubectl get pods --namespace=dev")
+    assert normalize_command("kubectl get svc -A") == normalize_command("kubectl get services --all-namespaces")
+
+def test_eval_set_has_no_wrong_or_unsafe_fast_path(monkeypatch):
+    monkeypatch.setattr(resolver_eval, "COMMANDS_FILE", os.path.join(os.path.dirname(__file__), "docs", "k8s_commands.txt"))
+    results = [{"query": query, "expected": expected, "resolved": resolve_command(query)}
+               for query, expected in resolver_eval.load_cases()]
+    metrics = resolver_eval.evaluate(results, FAST_PATH_THRESHOLD)
+    assert metrics["accuracy"] == 1.0
+    assert metrics["false_fast_path"] == 0.0
@@ -0,0 +1,80 @@
+# app/test_k8s_executor.py
+
+import pytest
+
+import k8s_executor
+from cache import TTLCache
+from k8s_executor import _invalidate_results, _result_cache_key
+
+@pytest.fixture(autouse=True)
+def no_kubeconfig(monkeypatch):
+    """Every context defaults to the "default" namespace; the result cache starts empty."""
+    monkeypatch.setattr(k8s_executor.cluster_manager, "get_default_namespace", lambda cluster=None: "default")
+    monkeypatch.setattr(k8s_executor, "result_cache", TTLCache(maxsize=64, ttl=60))
+
+def test_equivalent_spellings_share_a_key():
+    key = _result_cache_key("kubectl get pods -n dev -o wide", "prod")
+    assert key == _result_cache_key("kubectl get po --output=wide --namespace=dev", "prod")
+    assert key == _result_cache_key("kubectl get pod -o wide -ndev", "prod")
+    assert key != _result_cache_key("kubectl get pods -n dev -o wide", "staging")
+
+@pytest.mark.parametrize("command, namespace", [
+    ("kubectl get pods", "default"),
+    ("kubectl get pods -n dev", "dev"),
+    ("kubectl get pods -A", "*"),
+    ("kubectl get nodes", ""),
+    ("kubectl get ns", ""),
+    ("kubectl describe deployment/web -n dev", "dev"),
+])
+def test_key_namespace(command, namespace):
+    assert _result_cache_key(command, "prod")[1] == namespace
+
+@pytest.mark.parametrize("command", [
+    "kubectl logs web-1",
+    "kubectl delete pod web-1",
+    "kubectl get pods -w",
+    "kubectl get -f manifest.yaml",
+    "kubectl get pods 'unterminated",
+    "helm list",
+])
+def test_uncacheable_commands_have_no_key(command):
+    assert _result_cache_key(command, "prod") is None
+
+def test_result_cache_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(k8s_executor, "RESULT_CACHE_TTL", 0)
+    assert _result_cache_key("kubectl get pods", "prod") is None
+
+def _fill_cache():
+    commands = {
+        "dev": ("kubectl get pods -n dev", "prod"),
+        "prod": ("kubectl get pods -n prod", "prod"),
+        "all": ("kubectl get pods -A", "prod"),
+        "nodes": ("kubectl get nodes", "prod"),
+        "other": ("kubectl get pods -n dev", "staging"),
+    }
+    for name, (command, cluster) in commands.items():
+        k8s_executor.result_cache.set(_result_cache_key(command, cluster), name)
+    return {name: _result_cache_key(command, cluster) for name, (command, cluster) in commands.items()}
+
+def _cached(keys):
+    return {name for name, key in keys.items() if k8s_executor.result_cache.get(key) is not None}
+
+def test_namespaced_change_invalidates_its_namespace_and_the_wide_lists():
+    keys = _fill_cache()
+    _invalidate_results("kubectl delete pod web-1 -n dev", "prod")
+    assert _cached(keys) == {"prod", "other"}
+
+def test_manifest_or_node_changes_invalidate_the_whole_context():
+    keys = _fill_cache()
+    _invalidate_results("kubectl apply -f manifest.yaml", "prod")
+    assert _cached(keys) == {"other"}
+
+    keys = _fill_cache()
+    _invalidate_results("kubectl cordon node-1", "prod")
+    assert _cached(keys) == {"other"}
+
+@pytest.mark.parametrize("command", ["kubectl get pods -n dev", "kubectl rollout status deployment/web -n dev"])
+def test_read_only_commands_invalidate_nothing(command):
+    keys = _fill_cache()
+    _invalidate_results(command, "prod")
+    assert _cached(keys) == set(keys)
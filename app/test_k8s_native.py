@@ -0,0 +1,69 @@
+# app/test_k8s_native.py
+
+import pytest
+
+import k8s_native
+from k8s_native import UnsupportedCommand, _human_duration, _parse, _render_get, execute_native
+
+TABLE = {
+    "columnDefinitions": [
+        {"name": "Name", "type": "string", "priority": 0},
+        {"name": "Ready", "type": "string", "priority": 0},
+        {"name": "Status", "type": "string", "priority": 0},
+        {"name": "IP", "type": "string", "priority": 1},
+    ],
+    "rows": [
+        {"cells": ["web-1", "1/1", "Running", "10.0.0.12"], "object": {"metadata": {"name": "web-1", "namespace": "dev"}}},
+        {"cells": ["db-0", "0/1", "Pending", None], "object": {"metadata": {"name": "db-0", "namespace": "data"}}},
+    ],
+}
+
+@pytest.fixture
+def api_client(monkeypatch):
+    """An API client that must not be called: the commands are rejected before any request."""
+    monkeypatch.setattr(k8s_native, "_api_client", lambda cluster: (None, "default"))
+
+@pytest.mark.usefixtures("api_client")
+@pytest.mark.parametrize("command", [
+    "kubectl describe pod web-1",
+    "kubectl logs web-1",
+    "kubectl top pods",
+    "kubectl get pods -o yaml",
+    "kubectl get pods -w",
+    "kubectl get pods,svc",
+    "kubectl get widgets",
+])
+def test_commands_left_to_kubectl(command):
+    with pytest.raises(UnsupportedCommand):
+        execute_native(command)
+
+def test_parse_flag_spellings():
+    assert _parse(["get", "pods", "-ndev", "--output=wide", "-l", "app=web", "-A"]) == (
+        "get", ["pods"], {"namespace": "dev", "output": "wide", "selector": "app=web", "all-namespaces": True})
+
+def test_render_get_hides_wide_columns_and_aligns():
+    assert _render_get(TABLE, "pods", {}, all_namespaces=False) == (
+        "NAME    READY   STATUS\n"
+        "web-1   1/1     Running\n"
+        "db-0    0/1     Pending"
+    )
+
+def test_render_get_wide_and_all_namespaces():
+    assert _render_get(TABLE, "pods", {"output": "wide"}, all_namespaces=True) == (
+        "NAMESPACE   NAME    READY   STATUS    IP\n"
+        "dev         web-1   1/1     Running   10.0.0.12\n"
+        "data        db-0    0/1     Pending   <none>"
+    )
+
+def test_render_get_names_and_sorting():
+    flags = {"output": "name", "sort-by": ".metadata.name"}
+    assert _render_get(TABLE, "pods", flags, all_namespaces=False) == "pod/db-0\npod/web-1"
+    assert _render_get(TABLE, "deployments", {"output": "name"}, all_namespaces=False) == "deployment.apps/web-1\ndeployment.apps/db-0"
+
+def test_render_get_without_headers_or_rows():
+    assert _render_get(TABLE, "pods", {"no-headers": True}, all_namespaces=False).splitlines()[0].startswith("web-1")
+    assert _render_get({"rows": []}, "pods", {}, all_namespaces=False) == ""
+
+@pytest.mark.parametrize("seconds, age", [(30, "30s"), (150, "2m30s"), (3 * 3600 + 300, "3h5m"), (3 * 86400 + 7200, "3d2h"), (400 * 86400, "400d")])
+def test_age_rounding_matches_kubectl(seconds, age):
+    assert _human_duration(seconds) == age
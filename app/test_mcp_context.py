@@ -0,0 +1,82 @@
+# app/test_mcp_context.py
+
+import threading
+
+import pytest
+
+import mcp_context
+from mcp_context import (estimate_tokens, get_history, get_history_since, get_summary_version, get_tool_output,
+                         pop_pending_command, set_pending_command, update_history)
+
+@pytest.fixture(autouse=True)
+def session_db(tmp_path, monkeypatch):
+    """A fresh database per test; the per-thread connection and the session cache are reset."""
+    monkeypatch.setattr(mcp_context, "DB_PATH", str(tmp_path / "sessions.db"))
+    mcp_context._local.conn = None
+    mcp_context._cache.clear()
+    mcp_context._initialize_db()
+    yield
+    mcp_context._local.conn.close()
+    mcp_context._local.conn = None
+
+def test_history_keeps_recent_turns_verbatim():
+    update_history("s1", "list pods", "kubectl get pods")
+    update_history("s1", "and services?", "kubectl get svc")
+    history = get_history("s1")
+    assert history == "User: list pods\nAssistant: kubectl get pods\nUser: and services?\nAssistant: kubectl get svc\n"
+    assert get_history("other") == ""
+    assert get_summary_version("s1") == 0
+
+def test_old_turns_are_folded_into_a_summary(monkeypatch):
+    monkeypatch.setattr(mcp_context, "HISTORY_TOKEN_BUDGET", 100)
+    for i in range(12):
+        update_history("s1", f"question {i}", f"answer {i} " + "detail " * 10)
+    history = get_history("s1")
+    assert history.startswith("Summary of earlier conversation:\n- User: question 0 -> answer 0")
+    # The most recent turn is always kept verbatim, and the history stays within the budget
+    assert "User: question 11\n" in history
+    assert "User: question 0\n" not in history
+    assert estimate_tokens(history.split("\nUser: ", 1)[1]) <= 100
+    assert get_summary_version("s1") > 0
+
+def test_history_since_returns_only_later_turns():
+    update_history("s1", "first", "one")
+    first_id = mcp_context._connection().execute("SELECT MAX(id) FROM turns").fetchone()[0]
+    update_history("s1", "second", "two")
+    assert get_history_since("s1", first_id) == "User: second\nAssistant: two\n"
+
+def test_long_tool_outputs_are_stored_apart_and_purged_once_folded(monkeypatch):
+    monkeypatch.setattr(mcp_context, "HISTORY_TOKEN_BUDGET", 400)
+    output = "\n".join(f"pod-{i}   1/1   Running   0   5d" for i in range(200))
+    update_history("s1", "list pods", "kubectl get pods", tool_output=output)
+    assert get_tool_output("s1", 1) == output
+    assert get_tool_output("other-session", 1) is None
+    assert "[output #1 truncated: 200 lines" in get_history("s1")
+
+    for i in range(10):
+        update_history("s1", f"question {i}", "answer " * 20)
+    assert "[output #1" not in get_history("s1")
+    assert get_tool_output("s1", 1) is None
+
+def test_pending_command_is_popped_once():
+    set_pending_command("s1", "kubectl delete pod web-1", "prod", "delete web-1")
+    assert pop_pending_command("s1") == {"command": "kubectl delete pod web-1", "cluster": "prod", "original_query": "delete web-1"}
+    assert pop_pending_command("s1") is None
+
+def test_concurrent_confirmations_pop_the_command_once():
+    set_pending_command("s1", "kubectl delete pod web-1", "prod", "delete web-1")
+    barrier = threading.Barrier(8)
+    popped = []
+
+    def confirm():
+        barrier.wait()
+        popped.append(pop_pending_command("s1"))
+        mcp_context._local.conn.close()
+
+    threads = [threading.Thread(target=confirm) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert len(popped) == 8
+    assert [p["command"] for p in popped if p] == ["kubectl delete pod web-1"]
@@ -0,0 +1,132 @@
+# app/test_singleflight.py
+
+import threading
+import time
+
+from singleflight import SingleFlight, TokenBroadcast
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached in time"
+        time.sleep(0.005)
+
+def test_concurrent_calls_share_one_computation():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", compute)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(flight.do("key", compute)))
+    follower.start()
+    _wait_for(lambda: flight.stats()["coalesced"] == 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert results == ["result", "result"]
+    assert len(calls) == 1
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 1}
+
+def test_followers_get_the_leader_error():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("key", fail)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    _wait_for(lambda: flight.stats()["coalesced"] == 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert errors == ["upstream down", "upstream down"]
+
+def test_sequential_calls_are_not_coalesced():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    assert flight.stats()["leaders"] == 2
+
+class Source:
+    """Token generator that records whether it was closed before its end."""
+
+    def __init__(self, count, delay=0.0):
+        self.count = count
+        self.delay = delay
+        self.produced = 0
+        self.closed = threading.Event()
+        self._generator = self._tokens()
+
+    def _tokens(self):
+        try:
+            for i in range(self.count):
+                time.sleep(self.delay)
+                self.produced += 1
+                yield f"t{i} "
+        finally:
+            self.closed.set()
+
+    def __iter__(self):
+        return self._generator
+
+    def close(self):
+        self._generator.close()
+
+def test_every_subscriber_gets_the_whole_stream():
+    finished = threading.Event()
+    broadcast = TokenBroadcast(Source(5), on_finish=finished.set)
+    first = broadcast.subscribe()
+    assert list(first) == ["t0 ", "t1 ", "t2 ", "t3 ", "t4 "]
+    assert finished.wait(5)
+    # A late subscriber replays the tokens already produced
+    assert list(broadcast.subscribe()) == ["t0 ", "t1 ", "t2 ", "t3 ", "t4 "]
+    assert broadcast.finished
+
+def test_source_is_cancelled_when_every_subscriber_leaves():
+    source = Source(10000, delay=0.002)
+    finished = threading.Event()
+    broadcast = TokenBroadcast(source, on_finish=finished.set)
+    stream = broadcast.subscribe()
+    assert next(stream) == "t0 "
+    stream.close()
+    assert source.closed.wait(5)
+    assert finished.wait(5)
+    assert source.produced < 10000
+
+def test_source_is_cancelled_when_subscriptions_are_never_consumed():
+    source = Source(10000, delay=0.002)
+    broadcast = TokenBroadcast(source, join_grace=0.05)
+    broadcast.subscribe()   # handed out, never iterated
+    assert source.closed.wait(5)
+    assert source.produced < 10000
+
+def test_pending_subscription_keeps_the_source_alive():
+    source = Source(50, delay=0.001)
+    broadcast = TokenBroadcast(source, join_grace=5.0)
+    stream = broadcast.subscribe()
+    _wait_for(lambda: broadcast.finished)
+    assert len(list(stream)) == 50
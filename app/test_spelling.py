@@ -0,0 +1,67 @@
+# app/test_spelling.py
+
+import pytest
+
+from spelling import TypoCorrector
+
+@pytest.fixture
+def docs_dir(tmp_path):
+    (tmp_path / "storage.txt").write_text(
+        "A persistent volume claim requests persistent storage. Replication keeps replicas available.",
+        encoding="utf-8",
+    )
+    (tmp_path / "notes.md").write_text("markdown files are not indexed: zebrafish", encoding="utf-8")
+    return str(tmp_path)
+
+class FakeDictionary:
+    def __init__(self, words, corrections):
+        self.words = words
+        self.corrections = corrections
+
+    def known(self, words):
+        return {word for word in words if word in self.words}
+
+    def correction(self, word):
+        return self.corrections.get(word)
+
+def test_words_are_corrected_from_the_docs_vocabulary(docs_dir):
+    corrector = TypoCorrector(docs_dir)
+    assert corrector.correct("what is a persistant volume") == "what is a persistent volume"
+    assert corrector.correct("how does replicaton work") == "how does replication work"
+
+def test_punctuation_is_kept(docs_dir):
+    assert TypoCorrector(docs_dir).correct("persistant?") == "persistent?"
+
+@pytest.mark.parametrize("token", ["jenkins-orange-65659745d5-4sprj", "-n", "app=web", "./app.yaml", "node2"])
+def test_identifiers_are_left_alone(docs_dir, token):
+    assert TypoCorrector(docs_dir).correct(f"describe {token}") == f"describe {token}"
+
+@pytest.mark.parametrize("word", ["svc", "sts", "kubectl", "namespace", "cm"])
+def test_kubernetes_words_are_left_alone(docs_dir, word):
+    assert TypoCorrector(docs_dir).correct(word) == word
+
+def test_only_txt_documents_feed_the_vocabulary(docs_dir):
+    corrector = TypoCorrector(docs_dir)
+    assert "persistent" in corrector.vocabulary
+    assert "zebrafish" not in corrector.vocabulary
+
+def test_short_words_allow_a_single_edit(tmp_path):
+    (tmp_path / "doc.txt").write_text("scale", encoding="utf-8")
+    corrector = TypoCorrector(str(tmp_path))
+    assert corrector.correct_word("sclae") == "scale"     # transposition: one edit
+    assert corrector.correct_word("sxxle") == "sxxle"     # two edits on a short word
+
+def test_dictionary_is_only_a_fallback(docs_dir):
+    dictionary = FakeDictionary(words={"banana"}, corrections={"bananna": "banana", "persistant": "persist"})
+    corrector = TypoCorrector(docs_dir, dictionary=dictionary)
+    assert corrector.correct_word("persistant") == "persistent"
+    assert corrector.correct_word("bananna") == "banana"
+    assert corrector.correct_word("banana") == "banana"
+
+def test_corrections_are_memoized_until_the_vocabulary_reloads(docs_dir):
+    corrector = TypoCorrector(docs_dir)
+    corrector.correct_word("persistant")
+    corrector.correct_word("persistant")
+    assert corrector.stats()["hits"] == 1
+    corrector.load_vocabulary()
+    assert corrector.stats()["size"] == 0